@@ -1,15 +1,60 @@
 
+import os
 import sys
+import json
+import base64
+import shutil
+import zlib
+import hashlib
+import math
+import mmap
+import struct
+import codecs
+import heapq
+import bisect
+import random
+import email.utils
 import time
+import argparse
+import importlib
 import threading
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import queue
+import gzip
+import atexit
+import contextvars
+import multiprocessing
+from abc import ABC, abstractmethod
+from multiprocessing import shared_memory
+from array import array
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
 from datetime import datetime
-from typing import List, Tuple
+from typing import Iterable, Iterator, List, Tuple
 import logging
+import logging.handlers
 
-import requests
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin
+from urllib.parse import parse_qs, urljoin, urlsplit
+from html.parser import HTMLParser as _StdHTMLParser
+
+
+class _LazyModule:
+    """
+    首次访问属性时才 import 的模块代理：import scraper 不加载 requests / asyncio，
+    只用解析函数或 --help 时启动更快。import_module 自带模块锁，多线程首次访问也只加载一次。
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+
+    def __getattr__(self, attr):
+        value = getattr(importlib.import_module(self._name), attr)
+        # 缓存到实例上，之后的访问不再经过 __getattr__
+        setattr(self, attr, value)
+        return value
+
+
+requests = _LazyModule("requests")
+asyncio = _LazyModule("asyncio")
 
 DMM_SEARCH_TEMPLATE = "https://www.dmm.co.jp/mono/dvd/-/search/=/searchstr={code}/"
 
@@ -308,13 +353,18 @@ def translate_genres_to_zh(genres: List[str]) -> List[str]:
 
 thread_local = threading.local()
 
-# 配置：在此处直接设置参数而非命令行
+# 配置：默认值在此处直接设置；命令行参数（python scraper.py --help）与 scrape(**options) 可覆盖同名键
 CONFIG = {
     "codes": ["ssni-123"],  # 在此填入要测试的番号列表
     "codes_file": None,      # 或者给出一个文本文件路径（每行一个番号）
     "repeat": 10,            # 每个番号重复请求次数
     "interval": 0.0,         # 串行模式下两次请求的间隔（秒）
     "workers": 10,            # 并发线程数；>1 时忽略 interval
+    "engine": "thread",      # 并发引擎："thread"（线程池）、"pipeline"（分阶段流水线）或 "async"（asyncio + aiohttp）
+    "async_concurrency": 100,  # async 引擎下同时在途的请求上限
+    # pipeline 引擎：各阶段 worker 数与阶段间队列长度
+    "pipeline_workers": {"search_fetch": 10, "search_parse": 2, "detail_fetch": 10, "detail_parse": 2},
+    "pipeline_queue_size": 100,
     "timeout": 15.0,         # 单次请求超时（秒）
     "log_file": "scraper.log",  # 所有输出写入该日志文件
     "also_stdout": False,    # 是否同时输出到控制台
@@ -342,352 +392,5337 @@ CONFIG = {
             "domain": ".dmm.co.jp", "path": "/"},
     ],
     "extract_first_result": True,
+    # 磁盘 HTTP 缓存：ttl 秒内直接命中；过期后用 ETag/Last-Modified 条件请求；总大小超过 max_bytes 按 LRU 淘汰
+    "http_cache": {"enabled": False, "dir": ".scraper_cache/http", "ttl": 86400, "max_bytes": 512 * 1024 * 1024},
+    # 单飞：同一 URL 的并发请求/解析只做一次；share_completed 时已完成的成功解析结果（不含页面正文）
+    # 放进最多 max_completed 条的 LRU 里复用，内存不随番号数量增长
+    "single_flight": {"enabled": False, "share_completed": False, "max_completed": 1024},
+    # HTML 解析后端："bs4"（BeautifulSoup + html.parser）、"lxml"（需安装 lxml）、"partial"（只扫描目标区域）
+    "parser": "bs4",
+    # 进程池解析：搜索页 / 详情页解析放到 workers 个子进程（为空时取 CPU 核数），网络 I/O 不变；
+    # transfer："shm"（共享内存）或 "zlib"（压缩后传输）
+    "parse_processes": {"enabled": False, "workers": None, "transfer": "shm"},
+    # 解析结果记忆：按 (页面内容 hash, 解析后端, URL) 记住搜索页 / 详情页的解析结果，页面没变时直接返回上次结果；
+    # 解析代码或 GENRE_JA_TO_ZH 变化（见 _parser_fingerprint）时整个文件自动作废。max_entries 为内存中保留的条目上限
+    "parse_memo": {"enabled": False, "path": ".scraper_cache/parse_memo.tsv", "max_entries": 100000},
+    # 番号 -> 详情页 URL 索引：命中时跳过搜索页直接请求详情页，详情页 404/410 时回退到搜索
+    "detail_index": {"enabled": False, "path": ".scraper_cache/detail_index.tsv"},
+    # 原始页面归档：搜索页 / 详情页压缩后追加写入 dir（可 mmap 随机访问）
+    "archive": {"enabled": False, "dir": ".scraper_cache/archive", "flush_every": 100, "reextract_workers": None},
+    # 运行模式："crawl"（抓取）、"reextract"（不联网，用进程池重新解析 archive 中的页面并输出到 sinks）、
+    # "refresh"（按元数据缓存增量刷新，见 refresh_codes）或 "daemon"（常驻服务，通过本地 JSON API 按需查询，见 serve_daemon）
+    "mode": "crawl",
+    # refresh 模式：按 cache_path（movie-metadata-cache.json）排队刷新，缺封面/标题的优先，其余按 lastUpdated 从旧到新；
+    # max_seconds / max_requests / max_codes 为本次预算（为空表示不限），min_age_days 天内更新过且齐全的条目跳过；
+    # 只写回字段有变化的条目，touch_unchanged=True 时没有变化的条目也写回以更新 lastUpdated（下次排到队尾）
+    "refresh": {"cache_path": "movie-metadata-cache.json", "max_seconds": None, "max_requests": None,
+                "max_codes": None, "min_age_days": 7, "touch_unchanged": False},
+    # daemon 模式：监听地址（unix_socket 给出路径时改为监听 Unix socket）、查询线程数（为空时同 workers）、
+    # 单次 /batch 的番号上限
+    "daemon": {"host": "127.0.0.1", "port": 8765, "unix_socket": None, "workers": None, "max_batch": 500},
+    # 搜索页流式下载：见到第一个结果链接（或 #list 结束、出现无结果标记）后立即断开
+    "stream_search": {"enabled": False, "chunk_size": 16384,
+                      "no_result_markers": ["に一致する商品は見つかりませんでした"]},
+    # 日志：后台线程写盘；超过 max_bytes 或每 interval 秒（为空时不按时间）轮转，旧段 gzip 压缩，保留 backup_count 段。
+    # verbosity："quiet"（不写每条结果）、"normal"（结果块不含页面正文）、"full"（附带整页正文）
+    "logging": {"verbosity": "normal", "max_bytes": 50 * 1024 * 1024, "interval": None,
+                "backup_count": 10, "compress": True, "rollover_on_start": True},
+    # 结构化结果输出，例如：
+    # [{"type": "jsonl", "path": "results.jsonl"},
+    #  {"type": "sqlite", "path": "results.db", "batch_size": 200},
+    #  {"type": "metadata_cache", "path": "userData/movie-metadata-cache.json"}]
+    "sinks": [],
+    # 分阶段计时与指标导出：结束时（以及每 interval 秒）写出 JSON 摘要与 Prometheus textfile
+    "metrics": {"enabled": False, "json_path": "scraper_metrics.json",
+                "prom_path": "scraper_metrics.prom", "interval": 60},
+    # 自适应并发与速率（AIMD + 令牌桶）：按 429/503/错误率/延迟/Retry-After 调整；
+    # max_limit 为空时取 workers（async 引擎取 async_concurrency）
+    "adaptive": {"enabled": False, "initial_limit": 4, "min_limit": 1, "max_limit": None,
+                 "initial_rate": 5.0, "min_rate": 0.5, "max_rate": 50.0, "burst": 5.0,
+                 "decrease_factor": 0.5, "latency_target": 2.0, "cooldown": 2.0},
+    # 重试：状态码 / 异常类别（"connection"、"timeout"）命中时按指数退避 + 抖动重试。
+    # 不占用并发名额的等待只在 thread 引擎（按单个请求延迟重新提交）和 async 引擎（在信号量外 sleep）中成立；
+    # sequential / pipeline 引擎、多数据源（sources）的来源线程与 daemon 的查询线程在原线程内 sleep，退避期间占着该线程
+    "retry": {"enabled": False, "max_attempts": 3, "statuses": [429, 500, 502, 503, 504],
+              "exceptions": ["connection", "timeout"], "base_delay": 0.5, "max_delay": 30.0},
+    # 按主机熔断：连续失败 failure_threshold 次后暂停 reset_timeout 秒，再放行一个探测请求
+    "circuit_breaker": {"enabled": False, "failure_threshold": 5, "reset_timeout": 30.0},
+    # 对冲请求：超过近期延迟 percentile 分位仍未返回时再发一个相同请求，先返回者胜出；
+    # 额外请求不超过总数的 max_ratio，近期样本不足 min_samples 时不对冲
+    "hedging": {"enabled": False, "percentile": 95.0, "min_delay": 0.05, "window": 256,
+                "min_samples": 20, "max_ratio": 0.05, "pool_size": None},
+    # 断点续跑：记录已完成 / 失败的番号，重启后跳过已完成的
+    "checkpoint": {"enabled": False, "path": "scraper.journal", "fsync_every": 200, "fsync_interval": 2.0},
+    # 流式模式（超大番号列表）：逐行读取 codes_file，用紧凑结构去重，只保留 window 个任务在途
+    # （为空时线程池取 workers * 4，async 取 async_concurrency * 2）。
+    # dedupe："exact"（有序数组存 8 字节摘要，约 8 字节/番号，随番号数线性增长，默认）或
+    # "bloom"（布隆过滤器，内存固定，但极少数番号会被误判为重复而跳过，结束时日志记录跳过的个数）
+    "streaming": {"enabled": False, "window": None, "dedupe": "exact",
+                  "bloom_capacity": 10_000_000, "bloom_error_rate": 1e-4},
+    # 封面下载：按内容哈希存入 dir，断点续传；image_cache_dir 指向 Next.js 的 userData/image-cache 时
+    # 同时放入 image-proxy 同名文件，metadata_cache sink 写入 /api/image-serve/ 本地地址。
+    # thumbnail 需要 Pillow
+    "covers": {"enabled": False, "dir": ".scraper_cache/covers", "workers": 8, "timeout": 30.0,
+               "max_attempts": 3, "image_cache_dir": None,
+               "thumbnail": {"enabled": False, "max_size": 360, "quality": 85}},
+    # 数据源：providers 可为 "dmm"、"javbus"，多于一个时每个番号并发查询所有来源，
+    # 任一来源的 complete_fields 全部非空即返回并取消其余来源，否则按顺序逐字段合并
+    "sources": {"providers": ["dmm"], "complete_fields": ["title", "performer", "cover"],
+                "javbus_base": "https://www.javbus.com", "pool_size": None},
+    # HTTP 客户端：整个进程共享一个连接池（shared=False 时每线程一个）。pool_size 为每主机连接上限
+    # （为空时按并发数推算），keepalive_expiry 秒未用的空闲连接丢弃重连，http2 需要 pip install "httpx[http2]"。
+    # prewarm：开跑前对 prewarm_hosts（为空时取搜索页所在主机）预先建好的连接数（DNS + TCP + TLS）
+    "http_client": {"shared": True, "pool_size": None, "pool_block": True, "keepalive_expiry": 60.0,
+                    "http2": False, "prewarm": 0, "prewarm_hosts": None},
 }
 
 
-def _get_session() -> requests.Session:
-    if not hasattr(thread_local, "session"):
-        s = requests.Session()
-        s.headers.update(DEFAULT_HEADERS)
-        # 预置 cookie（域为 .dmm.co.jp，子域名通用）
-        for k, v in DEFAULT_COOKIES.items():
-            s.cookies.set(k, v, domain=".dmm.co.jp")
-        # 附加用户提供的 cookies
-        extra = CONFIG.get("extra_cookies") or []
-        for c in extra:
-            try:
-                name = c.get("name")
-                value = c.get("value")
-                domain = c.get("domain", ".dmm.co.jp")
-                path = c.get("path", "/")
-                if name is not None and value is not None:
-                    s.cookies.set(name, value, domain=domain, path=path)
-            except Exception:
-                # 忽略无效条目，避免中断
-                pass
-        thread_local.session = s
-    return thread_local.session
+def _iter_cookies():
+    """
+    依次产出 (name, value, domain, path)：先是 DEFAULT_COOKIES，再是 CONFIG["extra_cookies"]。
+    """
+    # 预置 cookie（域为 .dmm.co.jp，子域名通用）
+    for k, v in DEFAULT_COOKIES.items():
+        yield k, v, ".dmm.co.jp", "/"
+    # JavBus：existmag=mag 时搜索结果包含没有磁力链接的影片
+    if "javbus" in _source_names():
+        host = urlsplit((CONFIG.get("sources") or {}).get("javbus_base", "https://www.javbus.com")).hostname
+        yield "existmag", "mag", "." + (host or "www.javbus.com").removeprefix("www."), "/"
+    # 附加用户提供的 cookies
+    extra = CONFIG.get("extra_cookies") or []
+    for c in extra:
+        try:
+            name = c.get("name")
+            value = c.get("value")
+            domain = c.get("domain", ".dmm.co.jp")
+            path = c.get("path", "/")
+            if name is not None and value is not None:
+                yield name, value, domain, path
+        except Exception:
+            # 忽略无效条目，避免中断
+            pass
 
 
-def _make_url(code: str) -> str:
-    code = code.strip().replace(" ", "")
-    return DMM_SEARCH_TEMPLATE.format(code=code)
+_http_client = None
+_http_client_lock = threading.Lock()
+# 逐跳首部：HTTP/2 禁止携带
+_HOP_HEADERS = frozenset(("connection", "keep-alive", "proxy-connection", "transfer-encoding", "upgrade"))
 
 
-def fetch_once(code: str, idx: int, timeout: float = 15.0) -> Tuple[str, int, str, str]:
+def _fetcher_count() -> int:
+    """同时发请求的调用方数量：线程池的 workers 或流水线各 *_fetch 阶段之和。"""
+    return max(int(CONFIG.get("workers", 1)),
+               sum(int(v) for k, v in (CONFIG.get("pipeline_workers") or {}).items() if k.endswith("_fetch")))
+
+
+def _new_session() -> "requests.Session":
     """
-    发起一次请求并返回 (content, status_code, url, error)
-    - content: 成功时为完整页面文本；失败时为空字符串
-    - status_code: HTTP 状态码（失败时为 0）
-    - url: 实际请求的 URL
-    - error: 失败时的错误信息（成功时为空字符串）
+    按 CONFIG["http_client"] 创建 Session：连接池大小 / 空闲连接过期时间可配置，
+    http2=True 时改用 httpx（需要 pip install "httpx[http2]"），缺少依赖时退回 HTTP/1.1。
     """
-    url = _make_url(code)
+    hcfg = CONFIG.get("http_client") or {}
+    # 对冲请求会让同时在途的请求翻倍
+    hedging = 2 if (CONFIG.get("hedging") or {}).get("enabled") else 1
+    pool_size = int(hcfg.get("pool_size") or max(10, _fetcher_count() * hedging))
+    expiry = float(hcfg.get("keepalive_expiry") or 0.0)
+    s = requests.Session()
+    s.headers.update(DEFAULT_HEADERS)
+    for name, value, domain, path in _iter_cookies():
+        s.cookies.set(name, value, domain=domain, path=path)
+    adapter = None
+    if hcfg.get("http2"):
+        try:
+            adapter = _http2_adapter_class()(pool_size, expiry)
+        except ImportError as e:
+            logging.warning(f"[http] HTTP/2 需要 httpx[http2]（{e}），改用 HTTP/1.1 连接池")
+    if adapter is None:
+        adapter = _pooled_adapter_class()(pool_connections=int(hcfg.get("pool_hosts", 4)),
+                                          pool_maxsize=pool_size,
+                                          pool_block=bool(hcfg.get("pool_block", True)),
+                                          keepalive_expiry=expiry)
+    s.mount("http://", adapter)
+    s.mount("https://", adapter)
+    return s
+
+
+def _get_session() -> "requests.Session":
+    """
+    返回发请求用的 Session。默认整个进程共享一个（requests.Session 的连接池与 cookie jar 均线程安全），
+    CONFIG["http_client"]["shared"] 为 False 时退回每个线程一个。
+    """
+    global _http_client
+    if not (CONFIG.get("http_client") or {}).get("shared", True):
+        if not hasattr(thread_local, "session"):
+            thread_local.session = _new_session()
+        return thread_local.session
+    client = _http_client
+    if client is None:
+        with _http_client_lock:
+            if _http_client is None:
+                _http_client = _new_session()
+            client = _http_client
+    return client
+
+
+def _prewarm_origins() -> List[str]:
+    hosts = (CONFIG.get("http_client") or {}).get("prewarm_hosts")
+    if hosts:
+        return list(hosts)
+    parts = urlsplit(DMM_SEARCH_TEMPLATE)
+    return [f"{parts.scheme}://{parts.netloc}/"]
+
+
+def prewarm_http_client():
+    """
+    在第一批请求之前按 CONFIG["http_client"]["prewarm"] 预先建好连接（DNS + TCP + TLS），
+    放回共享连接池供随后的请求直接复用。HTTP/2 下一条连接即可承载全部并发，只预热一条。
+    """
+    n = int((CONFIG.get("http_client") or {}).get("prewarm") or 0)
+    if n <= 0:
+        return
     session = _get_session()
-    try:
-        resp = session.get(url, timeout=timeout)
-        status = resp.status_code
-        # 尽量正确解码
-        if resp.encoding is None:
-            resp.encoding = resp.apparent_encoding or "utf-8"
-        content = resp.text
-        return content, status, url, ""
-    except requests.RequestException as e:
-        return "", 0, url, str(e)
+    for origin in _prewarm_origins():
+        adapter = session.get_adapter(origin)
+        start = time.perf_counter()
+        try:
+            warmed = adapter.prewarm(session, origin, n)
+        except Exception as e:
+            logging.warning(f"[http] 预热 {origin} 失败: {e}")
+            continue
+        logging.info(f"[http] 预热 {origin}: {warmed} 个连接，用时 {time.perf_counter() - start:.3f}s")
 
 
-def run_sequential(codes: List[str], repeat: int, interval: float, timeout: float):
-    total = len(codes) * max(1, repeat)
-    counter = 0
-    for code in codes:
-        for i in range(repeat):
-            counter += 1
-            start = time.perf_counter()
-            content, status, url, err = fetch_once(code, i, timeout=timeout)
-            elapsed = time.perf_counter() - start
-            if CONFIG.get("extract_first_result", False) and not err and status == 200:
-                result = _extract_detail_fields(content, url)
-                _print_extract_block(counter, total, code,
-                                     status, url, elapsed, result)
-            else:
-                _print_response_block(
-                    counter, total, code, status, url, elapsed, content, err)
-            if interval > 0 and not (i == repeat - 1 and code == codes[-1]):
-                time.sleep(interval)
+def close_http_client():
+    global _http_client
+    with _http_client_lock:
+        client, _http_client = _http_client, None
+    if client is not None:
+        client.close()
 
 
-def run_parallel(codes: List[str], repeat: int, workers: int, timeout: float):
-    tasks = []
-    for code in codes:
-        for i in range(repeat):
-            tasks.append((code, i))
+def _make_url(code: str) -> str:
+    code = code.strip().replace(" ", "")
+    return DMM_SEARCH_TEMPLATE.format(code=code)
 
-    total = len(tasks)
-    counter = 0
-    with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
-        future_map = {ex.submit(_timed_fetch, code, i, timeout): (
-            code, i) for code, i in tasks}
-        for fut in as_completed(future_map):
-            code, i = future_map[fut]
-            counter += 1
-            content, status, url, err, elapsed = fut.result()
-            if CONFIG.get("extract_first_result", False) and not err and status == 200:
-                result = _extract_detail_fields(content, url)
-                _print_extract_block(counter, total, code,
-                                     status, url, elapsed, result)
-            else:
-                _print_response_block(
-                    counter, total, code, status, url, elapsed, content, err)
 
+# ---------------- 分阶段计时与指标导出 ----------------
 
-def _extract_detail_fields(html: str, base_url: str):
+# 直方图桶上界（秒），与 Prometheus 默认桶相近
+_HIST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+METRIC_PHASES = ("connect", "ttfb", "download", "search_fetch", "search_parse",
+                 "detail_fetch", "detail_parse", "cover_select", "cover_download")
+
+
+class Metrics:
     """
-    解析搜索页 HTML，找到第一个结果链接，再抓取详情页并解析所需字段。
-    返回字典：{"detail_url": str, "title": str, "performer": str, "category": str, "error": str}
-    注意：仅使用用户提供的 CSS 选择器。
+    进程内指标：各阶段耗时直方图、HTTP 状态码计数、接收字节数。线程安全。
     """
-    try:
-        soup = BeautifulSoup(html, "html.parser")
-        # 从搜索页找到第一个结果详情链接
-        a = soup.select_one("#list > li:nth-child(1) > div > p.tmb > a")
-        if not a or not a.get("href"):
-            return {"detail_url": "", "title": "", "performer": "", "category": "", "error": "未找到第一个结果链接"}
-        detail_href = a.get("href").strip()
-        detail_url = urljoin(base_url, detail_href)
-    except Exception as e:
-        return {"detail_url": "", "title": "", "performer": "", "category": "", "error": f"搜索页解析失败: {e}"}
 
-    # 请求详情页
-    session = _get_session()
-    try:
-        resp = session.get(detail_url, timeout=CONFIG.get("timeout", 15.0))
-        if resp.encoding is None:
-            resp.encoding = resp.apparent_encoding or "utf-8"
-        detail_html = resp.text
-    except requests.RequestException as e:
-        return {"detail_url": detail_url, "title": "", "performer": "", "category": "", "error": f"详情页请求失败: {e}"}
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.hist = {}      # phase -> [bucket_counts..., +Inf]
+        self.sums = {}      # phase -> 总耗时
+        self.status = {}    # status -> 次数
+        self.bytes_received = 0
 
-    # 解析详情页字段
-    try:
-        dsoup = BeautifulSoup(detail_html, "html.parser")
-        title_el = dsoup.select_one("#title")
-        performer_el = dsoup.select_one("#performer")
-        # 分类（ジャンル）：根据左侧标签单元格寻找右侧兄弟单元格中的所有 a 文本
-        title = title_el.get_text(strip=True) if title_el else ""
-        performer = performer_el.get_text(strip=True) if performer_el else ""
-
-        def is_genre_td(td):
-            txt = td.get_text(strip=True) if td else ""
-            txt = txt.replace("：", ":")  # 归一化全角冒号
-            return "ジャンル" in txt
+    def observe(self, phase: str, seconds: float):
+        with self._lock:
+            counts = self.hist.get(phase)
+            if counts is None:
+                counts = self.hist[phase] = [0] * (len(_HIST_BUCKETS) + 1)
+                self.sums[phase] = 0.0
+            i = 0
+            while i < len(_HIST_BUCKETS) and seconds > _HIST_BUCKETS[i]:
+                i += 1
+            counts[i] += 1
+            self.sums[phase] += seconds
 
-        category = ""
-        label_td = None
-        for td in dsoup.find_all("td", class_="nw"):
-            if is_genre_td(td):
-                label_td = td
-                break
-        if label_td:
-            value_td = label_td.find_next_sibling("td")
-            if value_td:
-                cats = [a.get_text(strip=True) for a in value_td.find_all("a")]
-                cats = [c for c in cats if c]
-                # 去重保持顺序（可选）
-                seen = set()
-                cats_unique = []
-                for c in cats:
-                    if c not in seen:
-                        seen.add(c)
-                        cats_unique.append(c)
-                # 翻译为中文
-                cats_zh = translate_genres_to_zh(cats_unique)
-                category = " / ".join(cats_zh)
+    def count_response(self, status: int, nbytes: int = 0):
+        with self._lock:
+            self.status[status] = self.status.get(status, 0) + 1
+            self.bytes_received += nbytes
 
-        # 封面图片：优先 og:image；再尝试 modal 节点的 data-src/src；再全局扫描候选
-        cover_url = ""
-        candidates = []
-        # 1) meta og:image
-        meta_og = dsoup.find("meta", attrs={"property": "og:image"})
-        if meta_og and meta_og.get("content"):
-            candidates.append(meta_og.get("content").strip())
-        # 2) modal 大图节点
-        cover_el = dsoup.select_one("#fn-modalSampleImage__image")
-        if cover_el:
-            # 常见懒加载属性优先
-            for attr in ("data-src", "data-original", "data-lazy", "data-srcset", "src"):
-                val = cover_el.get(attr)
-                if val:
-                    val = val.strip()
-                    # 处理 srcset: 取第一段 URL
-                    if attr == "data-srcset":
-                        val = val.split()[0].strip(", ")
-                    candidates.append(val)
-            # 父级 a 的 href 也可能是大图
-            parent_a = cover_el.find_parent("a")
-            if parent_a and parent_a.get("href"):
-                candidates.append(parent_a.get("href").strip())
-        # 3) 全局扫描 img，挑选 pics.dmm.co.jp/mono/movie 路径，过滤 loading gif
-        for img in dsoup.find_all("img"):
-            for attr in ("data-src", "data-original", "src"):
-                val = img.get(attr)
-                if not val:
-                    continue
-                val_low = val.lower()
-                if ("pics.dmm.co.jp" in val_low or "p.dmm.co.jp" in val_low) and \
-                   ("/mono/movie/" in val_low or "/digital/" in val_low):
-                    if "loading" in val_low and val_low.endswith(".gif"):
-                        continue
-                    candidates.append(val.strip())
-        # 去重并补全为绝对 URL
-        normed = []
-        seen = set()
-        for u in candidates:
-            if not u:
+    @staticmethod
+    def _quantile(counts, q: float) -> float:
+        # 与 histogram_quantile 相同：在所在桶内线性插值
+        total = sum(counts)
+        if total == 0:
+            return 0.0
+        rank = q * total
+        cum = 0
+        for i, c in enumerate(counts):
+            if cum + c >= rank and c > 0:
+                lower = _HIST_BUCKETS[i - 1] if i > 0 else 0.0
+                if i >= len(_HIST_BUCKETS):
+                    return lower
+                return lower + (_HIST_BUCKETS[i] - lower) * (rank - cum) / c
+            cum += c
+        return _HIST_BUCKETS[-1]
+
+    def summary(self) -> dict:
+        with self._lock:
+            phases = {}
+            for phase, counts in self.hist.items():
+                n = sum(counts)
+                phases[phase] = {
+                    "count": n,
+                    "sum_s": round(self.sums[phase], 6),
+                    "mean_s": round(self.sums[phase] / n, 6) if n else 0.0,
+                    "p50_s": round(self._quantile(counts, 0.50), 6),
+                    "p95_s": round(self._quantile(counts, 0.95), 6),
+                    "p99_s": round(self._quantile(counts, 0.99), 6),
+                }
+            return {
+                "uptime_s": round(time.time() - self.started, 3),
+                "phases": phases,
+                "status": {str(k): v for k, v in sorted(self.status.items())},
+                "bytes_received": self.bytes_received,
+            }
+
+    def prometheus(self) -> str:
+        with self._lock:
+            lines = [
+                "# HELP scraper_phase_seconds Time spent per scraper phase.",
+                "# TYPE scraper_phase_seconds histogram",
+            ]
+            for phase, counts in sorted(self.hist.items()):
+                cum = 0
+                for le, c in zip(_HIST_BUCKETS, counts):
+                    cum += c
+                    lines.append(f'scraper_phase_seconds_bucket{{phase="{phase}",le="{le}"}} {cum}')
+                cum += counts[-1]
+                lines.append(f'scraper_phase_seconds_bucket{{phase="{phase}",le="+Inf"}} {cum}')
+                lines.append(f'scraper_phase_seconds_sum{{phase="{phase}"}} {self.sums[phase]:.6f}')
+                lines.append(f'scraper_phase_seconds_count{{phase="{phase}"}} {cum}')
+            lines += [
+                "# HELP scraper_http_responses_total HTTP responses by status code (0 = request failed).",
+                "# TYPE scraper_http_responses_total counter",
+            ]
+            for status, n in sorted(self.status.items()):
+                lines.append(f'scraper_http_responses_total{{status="{status}"}} {n}')
+            lines += [
+                "# HELP scraper_bytes_received_total Response body bytes received.",
+                "# TYPE scraper_bytes_received_total counter",
+                f"scraper_bytes_received_total {self.bytes_received}",
+            ]
+            return "\n".join(lines) + "\n"
+
+    def export(self, json_path: str = None, prom_path: str = None):
+        """原子写出 JSON 摘要与 Prometheus textfile。"""
+        for path, text in ((json_path, lambda: json.dumps(self.summary(), ensure_ascii=False, indent=2)),
+                           (prom_path, self.prometheus)):
+            if not path:
                 continue
-            abs_u = urljoin(detail_url, u)
-            if abs_u not in seen:
-                seen.add(abs_u)
-                normed.append(abs_u)
-        # 偏好规则：优先 pl（大图）> ps > 非 gif
+            tmp = path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(text())
+            os.replace(tmp, path)
 
-        def pick(urls):
-            if not urls:
-                return ""
-            pref = [u for u in urls if "/pl." in u or u.endswith(
-                "pl.jpg") or u.endswith("pl.png") or "_pl" in u]
-            if pref:
-                return pref[0]
-            pref = [u for u in urls if "/ps." in u or u.endswith(
-                "ps.jpg") or u.endswith("ps.png") or "_ps" in u]
-            if pref:
-                return pref[0]
-            pref = [u for u in urls if not u.lower().endswith(
-                ".gif") and "loading" not in u.lower()]
-            if pref:
-                return pref[0]
-            return urls[0]
-        cover_url = pick(normed)
 
-        return {"detail_url": detail_url, "title": title, "performer": performer, "category": category, "cover": cover_url, "error": ""}
-    except Exception as e:
-        return {"detail_url": detail_url, "title": "", "performer": "", "category": "", "error": f"详情页解析失败: {e}"}
+_metrics = None
 
+# 写入每条记录 timings 的阶段
+RECORD_PHASES = ("search_fetch", "search_parse", "detail_fetch", "detail_parse")
 
-def _timed_fetch(code: str, idx: int, timeout: float):
-    start = time.perf_counter()
-    content, status, url, err = fetch_once(code, idx, timeout=timeout)
-    elapsed = time.perf_counter() - start
-    return content, status, url, err, elapsed
+# 当前番号的分阶段耗时（phase -> 秒，同一阶段多次时累加），由引擎在处理一个番号期间经 _Timings 设置；
+# 用 contextvars 而不是 thread_local，async 引擎的每个协程任务各有一份
+_current_timings = contextvars.ContextVar("scraper_timings", default=None)
 
 
-def setup_logging(log_file: str, also_stdout: bool = False):
-    # 按你的需求：每次运行覆盖旧日志，而不是追加
-    handlers = [logging.FileHandler(log_file, mode="w", encoding="utf-8")]
-    if also_stdout:
-        handlers.append(logging.StreamHandler(sys.stdout))
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(message)s",
-        handlers=handlers,
-        force=True,  # 覆盖已有配置，保证写入我们指定的文件
-    )
+class _Timings:
+    """with _Timings(timings): ... 期间的 _span / _observe 同时累加进 timings。"""
 
+    __slots__ = ("timings", "_token")
 
-def _print_response_block(counter: int, total: int, code: str, status: int, url: str, elapsed: float, content: str, err: str):
-    timestamp = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
-    header = (
-        f"\n===== BEGIN RESPONSE [{counter}/{total}] code={code} status={status} time={elapsed:.3f}s at {timestamp} UTC =====\n"
-        f"URL: {url}\n"
-    )
-    footer = f"\n===== END RESPONSE [{counter}/{total}] code={code} =====\n"
-    if err:
-        block = header + f"ERROR: {err}\n" + footer
-    else:
-        block = header + content + footer
-    # 使用 logging 输出，FileHandler/StreamHandler 自带锁，线程安全
-    logging.info(block)
+    def __init__(self, timings):
+        self.timings = timings
 
+    def __enter__(self):
+        self._token = _current_timings.set(self.timings)
+        return self.timings
 
-def _print_extract_block(counter: int, total: int, code: str, status: int, url: str, elapsed: float, result: dict):
-    timestamp = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
-    header = (
-        f"\n===== BEGIN EXTRACT [{counter}/{total}] code={code} status={status} time={elapsed:.3f}s at {timestamp} UTC =====\n"
-        f"Search URL: {url}\n"
-    )
-    detail_url = result.get("detail_url", "")
-    title = result.get("title", "")
-    performer = result.get("performer", "")
-    category = result.get("category", "")
-    cover = result.get("cover", "")
-    error = result.get("error", "")
-    body = (
-        f"Detail URL: {detail_url}\n"
-        f"Title: {title}\n"
-        f"Performer: {performer}\n"
-        f"Category: {category}\n"
-        f"Cover: {cover}\n"
-    )
-    if error:
-        body += f"ERROR: {error}\n"
-    footer = f"===== END EXTRACT [{counter}/{total}] code={code} =====\n"
-    logging.info(header + body + footer)
+    def __exit__(self, *exc):
+        _current_timings.reset(self._token)
+        return False
 
 
-def load_codes_from_config(cfg) -> List[str]:
-    codes: List[str] = []
-    # 1) 直接从配置中的列表读取
-    if isinstance(cfg.get("codes"), list):
-        for c in cfg.get("codes"):
-            s = str(c).strip()
-            if s:
-                codes.append(s)
-    # 2) 可选：从文件读取
-    codes_file = cfg.get("codes_file")
-    if codes_file:
+class _Span:
+    __slots__ = ("phase", "start")
+
+    def __init__(self, phase: str):
+        self.phase = phase
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        _observe(self.phase, time.perf_counter() - self.start)
+        return False
+
+
+def _span(phase: str) -> _Span:
+    """计时上下文：with _span("detail_parse"): ...；未开启指标且不在 _Timings 内时只多一次 perf_counter。"""
+    return _Span(phase)
+
+
+def _observe(phase: str, seconds: float):
+    if _metrics is not None:
+        _metrics.observe(phase, seconds)
+    timings = _current_timings.get()
+    if timings is not None:
+        timings[phase] = timings.get(phase, 0.0) + seconds
+
+
+_requests_sent = 0
+_requests_sent_lock = threading.Lock()
+
+
+def _count_response(status: int, nbytes: int = 0):
+    global _requests_sent
+    # 实际发出的请求数（含失败与 304），refresh 模式的请求预算据此估算
+    with _requests_sent_lock:
+        _requests_sent += 1
+    if _metrics is not None:
+        _metrics.count_response(status, nbytes)
+
+
+class _TimedConnectionMixin:
+    """给 urllib3 连接加上建连（DNS + TCP + TLS）计时。"""
+
+    def connect(self):
+        start = time.perf_counter()
         try:
-            with open(codes_file, "r", encoding="utf-8") as f:
-                for line in f:
-                    s = line.strip()
-                    if s:
-                        codes.append(s)
-        except OSError as e:
-            print(f"读取 codes 文件失败: {e}", file=sys.stderr)
-    # 去重并保持顺序
-    seen = set()
-    deduped = []
-    for c in codes:
-        if c not in seen:
-            seen.add(c)
-            deduped.append(c)
-    if not deduped:
-        deduped = ["ABF-243"]
-    return deduped
+            return super().connect()
+        finally:
+            _observe("connect", time.perf_counter() - start)
 
 
-def main():
-    cfg = CONFIG
-    # 初始化日志
-    log_file = cfg.get("log_file", "scraper.log")
-    also_stdout = bool(cfg.get("also_stdout", False))
-    setup_logging(log_file, also_stdout)
-    logging.info("=== Scraper started ===")
-    logging.info(f"CONFIG: {cfg}")
+_pooled_adapter = None
+_http2_adapter = None
 
-    codes = load_codes_from_config(cfg)
-    repeat = int(cfg.get("repeat", 1))
-    interval = float(cfg.get("interval", 0.0))
-    workers = int(cfg.get("workers", 1))
-    timeout = float(cfg.get("timeout", 15.0))
 
-    if workers > 1:
-        run_parallel(codes, repeat=max(1, repeat),
-                     workers=workers, timeout=timeout)
-    else:
-        run_sequential(codes, repeat=max(1, repeat),
-                       interval=max(0.0, interval), timeout=timeout)
+def _pooled_adapter_class():
+    """
+    HTTP/1.1 连接池适配器：建连（DNS + TCP + TLS）计时、空闲连接过期、预热。
+    urllib3 / requests 的子类在首次创建 Session 时才定义，避免 import scraper 就加载它们。
+    """
+    global _pooled_adapter
+    if _pooled_adapter is None:
+        import requests.adapters
+        import urllib3.connection
+        import urllib3.connectionpool
+        import urllib3.util.wait
+
+        class _TimedHTTPConnection(_TimedConnectionMixin, urllib3.connection.HTTPConnection):
+            pass
+
+        class _TimedHTTPSConnection(_TimedConnectionMixin, urllib3.connection.HTTPSConnection):
+            @property
+            def is_connected(self) -> bool:
+                # TLS 1.3 服务端在握手后发送的 NewSessionTicket 会让空闲（例如预热后尚未使用的）连接变为可读，
+                # urllib3 据此误判连接已断开；先消化掉这些协议记录再判断
+                if self.sock is None:
+                    return False
+                if not urllib3.util.wait.wait_for_read(self.sock, timeout=0.0):
+                    return True
+                return _only_tls_records(self.sock)
 
+        class _ExpiringPoolMixin:
+            # 由适配器在创建连接池后设置；0 表示空闲连接不过期
+            keepalive_expiry = 0.0
+
+            def _put_conn(self, conn):
+                if conn is not None:
+                    conn.idle_since = time.monotonic()
+                super()._put_conn(conn)
+
+            def _get_conn(self, timeout=None):
+                conn = super()._get_conn(timeout)
+                idle_since = getattr(conn, "idle_since", None)
+                if (self.keepalive_expiry and idle_since is not None
+                        and time.monotonic() - idle_since > self.keepalive_expiry):
+                    # 服务端多半已关闭该连接；关掉后发请求时会重新建连
+                    conn.close()
+                return conn
+
+        class _PooledHTTPConnectionPool(_ExpiringPoolMixin, urllib3.connectionpool.HTTPConnectionPool):
+            ConnectionCls = _TimedHTTPConnection
+
+        class _PooledHTTPSConnectionPool(_ExpiringPoolMixin, urllib3.connectionpool.HTTPSConnectionPool):
+            ConnectionCls = _TimedHTTPSConnection
+
+        class _PooledHTTPAdapter(requests.adapters.HTTPAdapter):
+            def __init__(self, keepalive_expiry: float = 0.0, **kwargs):
+                self.keepalive_expiry = keepalive_expiry
+                super().__init__(**kwargs)
+
+            def init_poolmanager(self, *args, **kwargs):
+                super().init_poolmanager(*args, **kwargs)
+                self.poolmanager.pool_classes_by_scheme = {
+                    "http": _PooledHTTPConnectionPool,
+                    "https": _PooledHTTPSConnectionPool,
+                }
+
+            def get_connection_with_tls_context(self, request, verify, proxies=None, cert=None):
+                pool = super().get_connection_with_tls_context(request, verify, proxies, cert)
+                pool.keepalive_expiry = self.keepalive_expiry
+                return pool
+
+            def prewarm(self, session, url: str, n: int) -> int:
+                """并行建好 n 个连接（不超过连接池大小）后放回连接池，返回成功数。"""
+                # 与 Session.send 一样合并环境设置（CA 证书等），才能取到之后请求所用的同一个连接池
+                settings = session.merge_environment_settings(url, {}, None, session.verify, session.cert)
+                request = requests.Request("GET", url).prepare()
+                pool = self.get_connection_with_tls_context(request, settings["verify"],
+                                                            settings["proxies"], settings["cert"])
+                conns = [pool._get_conn() for _ in range(min(n, self._pool_maxsize))]
+                ok = 0
+                try:
+                    with ThreadPoolExecutor(max_workers=len(conns), thread_name_prefix="prewarm") as ex:
+                        for conn, err in zip(conns, ex.map(_try_connect, conns)):
+                            if err is None:
+                                ok += 1
+                            else:
+                                logging.warning(f"[http] 预热连接失败: {err}")
+                finally:
+                    for conn in conns:
+                        pool._put_conn(conn)
+                return ok
+
+        _pooled_adapter = _PooledHTTPAdapter
+    return _pooled_adapter
+
+
+def _only_tls_records(sock) -> bool:
+    """非阻塞地读一次 TLS socket：只有协议记录（无应用数据、未关闭）时返回 True。"""
+    import ssl
+    timeout = sock.gettimeout()
+    try:
+        sock.settimeout(0.0)
+        sock.recv(1)
+        # 读到应用数据或 EOF：该连接都不能再用于新请求
+        return False
+    except ssl.SSLWantReadError:
+        return True
+    except OSError:
+        return False
+    finally:
+        try:
+            sock.settimeout(timeout)
+        except OSError:
+            pass
+
+
+def _try_connect(conn):
+    try:
+        conn.connect()
+        return None
+    except Exception as e:
+        conn.close()
+        return e
+
+
+class _HttpxRaw:
+    """把 httpx 的流式响应包装成 requests.Response.raw 需要的 read(amt) / close() 接口（正文已解压）。"""
+
+    def __init__(self, resp):
+        self._resp = resp
+        self._chunks = resp.iter_bytes()
+        self._buf = b""
+
+    def read(self, amt=None, **_kwargs):
+        import httpx
+        try:
+            if amt is None:
+                data, self._buf = self._buf + b"".join(self._chunks), b""
+                return data
+            while len(self._buf) < amt:
+                chunk = next(self._chunks, None)
+                if chunk is None:
+                    break
+                self._buf += chunk
+        except httpx.TimeoutException as e:
+            raise requests.exceptions.ReadTimeout(e)
+        except httpx.TransportError as e:
+            raise requests.exceptions.ChunkedEncodingError(e)
+        data, self._buf = self._buf[:amt], self._buf[amt:]
+        return data
+
+    def close(self):
+        self._resp.close()
+
+
+def _http2_adapter_class():
+    """
+    基于 httpx 的 requests 适配器：同一主机的并发请求复用一条 HTTP/2 连接（多路复用）。
+    缺少 httpx 或 h2 时抛出 ImportError。
+    """
+    global _http2_adapter
+    if _http2_adapter is None:
+        import httpx
+        import h2  # noqa: F401  httpx 的 HTTP/2 支持依赖 h2，提前检查以便退回 HTTP/1.1
+        import requests.adapters
+        from requests.structures import CaseInsensitiveDict
+        from requests.utils import get_encoding_from_headers
+
+        class _Http2Adapter(requests.adapters.BaseAdapter):
+            def __init__(self, pool_size: int, keepalive_expiry: float):
+                super().__init__()
+                limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size,
+                                      keepalive_expiry=keepalive_expiry or None)
+                self.client = httpx.Client(http2=True, limits=limits, follow_redirects=False)
+
+            def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+                if isinstance(timeout, tuple):
+                    timeout = httpx.Timeout(timeout[1], connect=timeout[0])
+                headers = [(k, v) for k, v in request.headers.items() if k.lower() not in _HOP_HEADERS]
+                req = self.client.build_request(request.method, request.url, headers=headers,
+                                                content=request.body, timeout=timeout)
+                try:
+                    r = self.client.send(req, stream=True)
+                except httpx.TimeoutException as e:
+                    raise requests.Timeout(e, request=request)
+                except httpx.TransportError as e:
+                    raise requests.ConnectionError(e, request=request)
+                resp = requests.Response()
+                resp.status_code = r.status_code
+                resp.reason = r.reason_phrase
+                resp.headers = CaseInsensitiveDict(r.headers)
+                # httpx 已按 Content-Encoding 解压，去掉该首部以免被再次当作压缩数据
+                resp.headers.pop("Content-Encoding", None)
+                resp.encoding = get_encoding_from_headers(resp.headers)
+                resp.raw = _HttpxRaw(r)
+                resp.url = request.url
+                resp.request = request
+                resp.connection = self
+                if not stream:
+                    resp.content
+                return resp
+
+            def prewarm(self, session, url: str, n: int) -> int:
+                # 一条连接即可多路复用；没有单独建连的公开接口，用一次 HEAD 请求完成握手
+                self.client.head(url, headers={k: v for k, v in DEFAULT_HEADERS.items()
+                                               if k.lower() not in _HOP_HEADERS})
+                return 1
+
+            def close(self):
+                self.client.close()
+
+        _http2_adapter = _Http2Adapter
+    return _http2_adapter
+
+
+class _MetricsReporter:
+    """长时间运行时按 interval 秒周期性导出指标。"""
+
+    def __init__(self, metrics: Metrics, json_path: str, prom_path: str, interval: float):
+        self.metrics = metrics
+        self.json_path = json_path
+        self.prom_path = prom_path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.interval > 0:
+            self._thread = threading.Thread(target=self._loop, name="metrics-reporter", daemon=True)
+            self._thread.start()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self.export()
+
+    def export(self):
+        try:
+            self.metrics.export(self.json_path, self.prom_path)
+        except OSError as e:
+            logging.warning(f"导出指标失败: {e}")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.export()
+
+
+def start_metrics(cfg: dict):
+    """按 CONFIG["metrics"] 开启指标收集；返回 reporter（未开启时为 None）。"""
+    global _metrics
+    mcfg = cfg.get("metrics") or {}
+    if not mcfg.get("enabled"):
+        return None
+    _metrics = Metrics()
+    reporter = _MetricsReporter(_metrics, mcfg.get("json_path"), mcfg.get("prom_path"),
+                                float(mcfg.get("interval", 60)))
+    reporter.start()
+    return reporter
+
+
+# ---------------- 自适应并发与速率控制（AIMD + 令牌桶） ----------------
+
+def _parse_retry_after(value) -> float:
+    """Retry-After 可以是秒数或 HTTP 日期；无法解析时返回 0。"""
+    if not value:
+        return 0.0
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+        return max(0.0, when.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class AdaptiveLimiter:
+    """
+    根据服务端反馈调整在途请求数与请求速率：
+    - 正常且不慢的响应：并发 +1/limit（约每轮 +1），速率 +rate_step
+    - 429/503/5xx/请求失败，或延迟超过 latency_target：并发与速率乘以 decrease_factor
+      （cooldown 秒内只降一次，避免一批错误把上限压到底）
+    - 带 Retry-After 时，在该时间内暂停发出新请求
+    线程与 asyncio 共用：状态由锁保护，acquire / acquire_async 各自等待。
+    clock 为单调时钟（测试时可注入）。
+    """
+
+    def __init__(self, initial_limit: float = 4, min_limit: float = 1, max_limit: float = 64,
+                 initial_rate: float = 5.0, min_rate: float = 0.5, max_rate: float = 50.0,
+                 rate_step: float = 0.2, burst: float = 5.0, decrease_factor: float = 0.5,
+                 latency_target: float = 2.0, cooldown: float = 2.0, clock=time.monotonic):
+        self.clock = clock
+        self.min_limit = max(1.0, float(min_limit))
+        self.max_limit = max(self.min_limit, float(max_limit))
+        self.limit = min(self.max_limit, max(self.min_limit, float(initial_limit)))
+        self.min_rate = float(min_rate)
+        self.max_rate = float(max_rate)
+        self.rate = min(self.max_rate, max(self.min_rate, float(initial_rate)))
+        self.rate_step = float(rate_step)
+        self.burst = max(1.0, float(burst))
+        self.decrease_factor = float(decrease_factor)
+        self.latency_target = float(latency_target)
+        self.cooldown = float(cooldown)
+        self.in_flight = 0
+        self._tokens = self.burst
+        self._last_refill = self.clock()
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._logged_limit = int(self.limit)
+        self._cond = threading.Condition()
+        self.decisions = []
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def _try_acquire(self) -> float:
+        """调用方持有锁。成功返回 0，否则返回建议等待的秒数。"""
+        now = self.clock()
+        if now < self._paused_until:
+            return self._paused_until - now
+        if self.in_flight >= int(self.limit):
+            return 0.05
+        self._refill(now)
+        if self._tokens < 1.0:
+            return (1.0 - self._tokens) / self.rate
+        self._tokens -= 1.0
+        self.in_flight += 1
+        return 0.0
+
+    def acquire(self):
+        with self._cond:
+            while True:
+                wait = self._try_acquire()
+                if wait <= 0:
+                    return
+                self._cond.wait(wait)
+
+    async def acquire_async(self):
+        while True:
+            with self._cond:
+                wait = self._try_acquire()
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    def release(self, status: int, latency: float, retry_after=None):
+        """status 为 None 表示请求被取消（对冲落败），只归还名额，不作为拥塞信号。"""
+        with self._cond:
+            self.in_flight -= 1
+            if status is None:
+                self._cond.notify_all()
+                return
+            now = self.clock()
+            pause = _parse_retry_after(retry_after) if status in (429, 503) else 0.0
+            if pause > 0:
+                self._paused_until = max(self._paused_until, now + pause)
+            congested = status == 0 or status == 429 or status >= 500
+            slow = latency > self.latency_target
+            if congested or slow:
+                if now - self._last_decrease >= self.cooldown:
+                    self._last_decrease = now
+                    self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+                    self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+                    reason = f"status={status}" if congested else f"latency={latency:.2f}s"
+                    if pause > 0:
+                        reason += f" retry_after={pause:.1f}s"
+                    self._record(reason)
+            else:
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+                self.rate = min(self.max_rate, self.rate + self.rate_step)
+                if int(self.limit) > self._logged_limit:
+                    self._record("increase")
+            self._cond.notify_all()
+
+    def _record(self, reason: str):
+        # 调用方持有锁
+        self._logged_limit = int(self.limit)
+        decision = {"ts": time.time(), "reason": reason, "limit": int(self.limit), "rate": round(self.rate, 2)}
+        self.decisions.append(decision)
+        logging.info(f"[adaptive] {reason} -> limit={decision['limit']} rate={decision['rate']}/s")
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def _get_limiter():
+    """按 CONFIG["adaptive"] 懒加载进程级限流器；未启用时返回 None。"""
+    global _limiter
+    cfg = CONFIG.get("adaptive") or {}
+    if not cfg.get("enabled"):
+        return None
+    with _limiter_lock:
+        if _limiter is None:
+            if CONFIG.get("engine") == "async":
+                default_max = CONFIG.get("async_concurrency", 100)
+            else:
+                default_max = CONFIG.get("workers", 1)
+            _limiter = AdaptiveLimiter(
+                initial_limit=cfg.get("initial_limit", 4),
+                min_limit=cfg.get("min_limit", 1),
+                max_limit=cfg.get("max_limit") or default_max,
+                initial_rate=cfg.get("initial_rate", 5.0),
+                min_rate=cfg.get("min_rate", 0.5),
+                max_rate=cfg.get("max_rate", 50.0),
+                rate_step=cfg.get("rate_step", 0.2),
+                burst=cfg.get("burst", 5.0),
+                decrease_factor=cfg.get("decrease_factor", 0.5),
+                latency_target=cfg.get("latency_target", 2.0),
+                cooldown=cfg.get("cooldown", 2.0),
+            )
+    return _limiter
+
+
+# ---------------- 重试（指数退避 + 抖动）与按主机熔断 ----------------
+
+_circuit_open_error = None
+
+
+def _circuit_open_error_class():
+    """
+    CircuitOpenError 继承 requests.RequestException（调用方的 except 照常生效），
+    因此同样延迟到首次使用时定义；模块属性 scraper.CircuitOpenError 经 __getattr__ 取到同一个类。
+    """
+    global _circuit_open_error
+    if _circuit_open_error is None:
+        class CircuitOpenError(requests.RequestException):
+            """熔断器处于打开状态，请求未发出。"""
+
+        CircuitOpenError.__module__ = __name__
+        CircuitOpenError.__qualname__ = "CircuitOpenError"
+        _circuit_open_error = CircuitOpenError
+    return _circuit_open_error
+
+
+def __getattr__(name):
+    if name == "CircuitOpenError":
+        return _circuit_open_error_class()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+class _RetryLater(Exception):
+    """
+    run_parallel 的工作线程不原地等待重试，而是抛出此异常由主循环延迟重新提交。
+    只在设置了 thread_local.defer_retries 的线程中抛出；其他引擎的线程照常原地 sleep。
+    """
+
+    def __init__(self, delay: float):
+        super().__init__(delay)
+        self.delay = delay
+
+
+def _exception_kind(e: BaseException) -> str:
+    """把各类网络异常归为 "timeout" / "connection" / "other"，供 RetryPolicy 匹配。"""
+    if isinstance(e, (requests.Timeout, asyncio.TimeoutError)):
+        return "timeout"
+    if isinstance(e, (requests.ConnectionError, requests.exceptions.ChunkedEncodingError)):
+        return "connection"
+    if isinstance(e, _circuit_open_error_class()):
+        return "circuit"
+    try:
+        import aiohttp
+    except ImportError:
+        return "other"
+    if isinstance(e, aiohttp.ServerTimeoutError):
+        return "timeout"
+    if isinstance(e, (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError)):
+        return "connection"
+    return "other"
+
+
+class RetryPolicy:
+    """
+    重试策略：statuses 中的状态码与 exceptions 中的异常类别（"timeout" / "connection"）会重试，
+    最多 max_attempts 次（含首次）。等待时间为 full jitter 指数退避：
+    uniform(0, min(max_delay, base_delay * 2^(attempt-1)))，且不少于服务端给出的 Retry-After。
+    熔断拒绝（"circuit"）总是可以重试，等待到下一次探测时间。
+    """
+
+    def __init__(self, max_attempts: int = 3, statuses=(429, 500, 502, 503, 504),
+                 exceptions=("connection", "timeout"), base_delay: float = 0.5, max_delay: float = 30.0):
+        self.max_attempts = max(1, int(max_attempts))
+        self.statuses = frozenset(int(x) for x in statuses)
+        self.exceptions = frozenset(exceptions)
+        self.base_delay = float(base_delay)
+        self.max_delay = float(max_delay)
+
+    def should_retry(self, status: int, kind) -> bool:
+        if kind is not None:
+            return kind == "circuit" or kind in self.exceptions
+        return status in self.statuses
+
+    def delay(self, attempt: int, retry_after=None) -> float:
+        backoff = random.uniform(0.0, min(self.max_delay, self.base_delay * (2 ** (attempt - 1))))
+        return max(backoff, min(self.max_delay, _parse_retry_after(retry_after)))
+
+
+class CircuitBreaker:
+    """
+    按主机的熔断器：连续 failure_threshold 次失败（异常、429、5xx）后打开，
+    reset_timeout 秒内拒绝该主机的请求；之后进入半开状态，只放行一个探测请求，
+    成功则关闭，失败则重新打开。
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.reset_timeout = float(reset_timeout)
+        self._lock = threading.Lock()
+        self._hosts = {}  # host -> {"failures", "state", "opened_at", "probing"}
+        self.stats = {"opened": 0, "rejected": 0}
+
+    def before(self, host: str) -> float:
+        """允许发出请求时返回 0，否则返回距离下次探测的秒数。"""
+        with self._lock:
+            st = self._hosts.get(host)
+            if st is None or st["state"] == "closed":
+                return 0.0
+            now = time.monotonic()
+            if st["state"] == "open":
+                remaining = st["opened_at"] + self.reset_timeout - now
+                if remaining > 0:
+                    self.stats["rejected"] += 1
+                    return remaining
+                st["state"] = "half_open"
+                st["probing"] = False
+            if st["probing"]:
+                self.stats["rejected"] += 1
+                return min(self.reset_timeout, 1.0)
+            st["probing"] = True
+            return 0.0
+
+    def record(self, host: str, ok: bool):
+        with self._lock:
+            st = self._hosts.setdefault(host, {"failures": 0, "state": "closed", "opened_at": 0.0, "probing": False})
+            if ok:
+                st.update(failures=0, state="closed", probing=False)
+                return
+            st["failures"] += 1
+            if st["state"] == "half_open" or st["failures"] >= self.failure_threshold:
+                if st["state"] != "open":
+                    self.stats["opened"] += 1
+                    logging.info(f"[circuit] {host} 熔断 {self.reset_timeout:.0f}s（连续失败 {st['failures']} 次）")
+                st.update(state="open", opened_at=time.monotonic(), probing=False)
+
+
+def _is_failure(status: int, kind) -> bool:
+    return kind is not None or status == 429 or status >= 500
+
+
+_retry_policy = None
+_circuit_breaker = None
+_retry_lock = threading.Lock()
+_retry_stats = {"retries": 0}
+
+
+def _get_retry_policy():
+    """按 CONFIG["retry"] 懒加载；未启用时返回 None。"""
+    global _retry_policy
+    cfg = CONFIG.get("retry") or {}
+    if not cfg.get("enabled"):
+        return None
+    with _retry_lock:
+        if _retry_policy is None:
+            _retry_policy = RetryPolicy(
+                max_attempts=cfg.get("max_attempts", 3),
+                statuses=cfg.get("statuses", (429, 500, 502, 503, 504)),
+                exceptions=cfg.get("exceptions", ("connection", "timeout")),
+                base_delay=cfg.get("base_delay", 0.5),
+                max_delay=cfg.get("max_delay", 30.0),
+            )
+    return _retry_policy
+
+
+def _get_circuit_breaker():
+    """按 CONFIG["circuit_breaker"] 懒加载；未启用时返回 None。"""
+    global _circuit_breaker
+    cfg = CONFIG.get("circuit_breaker") or {}
+    if not cfg.get("enabled"):
+        return None
+    with _retry_lock:
+        if _circuit_breaker is None:
+            _circuit_breaker = CircuitBreaker(
+                failure_threshold=cfg.get("failure_threshold", 5),
+                reset_timeout=cfg.get("reset_timeout", 30.0),
+            )
+    return _circuit_breaker
+
+
+def _count_retry():
+    with _retry_lock:
+        _retry_stats["retries"] += 1
+
+
+# ---------------- 对冲请求（hedging） ----------------
+
+class _HedgeCancelled(Exception):
+    """对冲落败的请求被取消。"""
+
+
+class Hedger:
+    """
+    对冲请求：一个请求超过近期延迟的 percentile 分位仍未返回时，再发一个相同的请求，
+    先成功返回的胜出，另一个被取消（尚未开始则直接撤销，正在下载则停止读取并关闭连接）。
+    额外请求数不超过总请求数的 max_ratio；近期样本少于 min_samples 时不对冲。
+    """
+
+    def __init__(self, percentile: float = 95.0, min_delay: float = 0.05, window: int = 256,
+                 min_samples: int = 20, max_ratio: float = 0.05, pool_size: int = 64):
+        self.percentile = float(percentile)
+        self.min_delay = float(min_delay)
+        self.min_samples = max(1, int(min_samples))
+        self.max_ratio = float(max_ratio)
+        self._lat = deque(maxlen=max(self.min_samples, int(window)))
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max(2, int(pool_size)), thread_name_prefix="hedge")
+        self.stats = {"requests": 0, "fired": 0, "won": 0, "over_budget": 0}
+
+    def delay(self):
+        """当前的对冲等待时间；样本不足时返回 None（不对冲）。"""
+        with self._lock:
+            if len(self._lat) < self.min_samples:
+                return None
+            ordered = sorted(self._lat)
+        k = min(len(ordered) - 1, int(self.percentile / 100.0 * len(ordered)))
+        return max(self.min_delay, ordered[k])
+
+    def _start(self):
+        with self._lock:
+            self.stats["requests"] += 1
+
+    def _take_budget(self) -> bool:
+        with self._lock:
+            if self.stats["fired"] + 1 > self.max_ratio * self.stats["requests"]:
+                self.stats["over_budget"] += 1
+                return False
+            self.stats["fired"] += 1
+            return True
+
+    def _finish(self, seconds: float, hedge_won: bool):
+        with self._lock:
+            self._lat.append(seconds)
+            if hedge_won:
+                self.stats["won"] += 1
+
+    def call(self, fn):
+        """
+        同步版本：fn(cancel_event) 发出一次请求；返回先成功的结果，全部失败时抛出主请求的异常。
+        """
+        self._start()
+        start = time.perf_counter()
+        cancels = [threading.Event()]
+        futs = [self._pool.submit(fn, cancels[0])]
+        delay = self.delay()
+        if delay is not None:
+            done, _ = wait(futs, timeout=delay)
+            if not done and self._take_budget():
+                cancels.append(threading.Event())
+                futs.append(self._pool.submit(fn, cancels[1]))
+        winner = None
+        pending = set(futs)
+        while pending and winner is None:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            winner = next((f for f in futs if f in done and f.exception() is None), None)
+        for fut, cancel in zip(futs, cancels):
+            if fut is not winner:
+                cancel.set()
+                fut.cancel()
+        if winner is None:
+            raise futs[0].exception()
+        self._finish(time.perf_counter() - start, winner is not futs[0])
+        return winner.result()
+
+    async def call_async(self, make):
+        """
+        asyncio 版本：make() 返回一次请求的协程，结果为 (content, status, error, retry_after, kind)，
+        kind 为空表示拿到了响应。落败的任务直接 cancel。
+        """
+        self._start()
+        start = time.perf_counter()
+        tasks = [asyncio.ensure_future(make())]
+        delay = self.delay()
+        if delay is not None:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done and self._take_budget():
+                tasks.append(asyncio.ensure_future(make()))
+        winner = None
+        pending = set(tasks)
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            winner = next((t for t in tasks if t in done and t.result()[4] is None), None)
+        for t in tasks:
+            if t is not winner:
+                t.cancel()
+        if winner is None:
+            return tasks[0].result()
+        self._finish(time.perf_counter() - start, winner is not tasks[0])
+        return winner.result()
+
+    def close(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+_hedger = None
+_hedger_lock = threading.Lock()
+
+
+def _get_hedger():
+    """按 CONFIG["hedging"] 懒加载对冲器；未启用时返回 None。"""
+    global _hedger
+    cfg = CONFIG.get("hedging") or {}
+    if not cfg.get("enabled"):
+        return None
+    with _hedger_lock:
+        if _hedger is None:
+            fetchers = _fetcher_count()
+            _hedger = Hedger(
+                percentile=float(cfg.get("percentile", 95.0)),
+                min_delay=float(cfg.get("min_delay", 0.05)),
+                window=int(cfg.get("window", 256)),
+                min_samples=int(cfg.get("min_samples", 20)),
+                max_ratio=float(cfg.get("max_ratio", 0.05)),
+                # 每个调用方最多同时占用两个线程（主请求 + 对冲请求）
+                pool_size=int(cfg.get("pool_size") or 2 * max(8, fetchers)),
+            )
+    return _hedger
+
+
+def close_hedger():
+    global _hedger
+    with _hedger_lock:
+        hedger, _hedger = _hedger, None
+    if hedger is not None:
+        hedger.close()
+        logging.info(f"Hedging: {hedger.stats}")
+
+
+# ---------------- 持久化 HTTP 响应缓存 ----------------
+
+class HttpCache:
+    """
+    磁盘 HTTP 响应缓存：每个 URL 一个文件（首行为 JSON 元数据，其后为 zlib 压缩的正文）。
+    - ttl 秒内的条目直接命中，不发请求
+    - 过期条目带 If-None-Match / If-Modified-Since 重新验证，304 时沿用缓存正文
+    - 总大小超过 max_bytes 时按最近访问时间（LRU）淘汰
+    """
+
+    def __init__(self, cache_dir: str, ttl: float = 86400.0, max_bytes: int = 512 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.ttl = float(ttl)
+        self.max_bytes = int(max_bytes)
+        self._lock = threading.Lock()
+        # key -> [size, last_access]
+        self._index = {}
+        self._total = 0
+        self.stats = {"hit": 0, "revalidated": 0, "miss": 0, "stored": 0, "evicted": 0}
+        os.makedirs(cache_dir, exist_ok=True)
+        for entry in os.scandir(cache_dir):
+            if entry.is_file() and entry.name.endswith(".bin"):
+                st = entry.stat()
+                self._index[entry.name[:-4]] = [st.st_size, st.st_atime]
+                self._total += st.st_size
+
+    @staticmethod
+    def _key(url: str) -> str:
+        return hashlib.sha1(url.split("#", 1)[0].encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + ".bin")
+
+    def get(self, url: str):
+        """
+        返回 (meta, content)；不存在或损坏时返回 (None, "")。
+        """
+        key = self._key(url)
+        try:
+            with open(self._path(key), "rb") as f:
+                meta = json.loads(f.readline().decode("utf-8"))
+                content = zlib.decompress(f.read()).decode("utf-8")
+        except (OSError, ValueError, zlib.error):
+            return None, ""
+        with self._lock:
+            if key in self._index:
+                self._index[key][1] = time.time()
+        return meta, content
+
+    def is_fresh(self, meta) -> bool:
+        return time.time() - float(meta.get("stored_at", 0)) < self.ttl
+
+    @staticmethod
+    def conditional_headers(meta) -> dict:
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        return headers
+
+    def put(self, url: str, content: str, etag: str = "", last_modified: str = ""):
+        meta = {"url": url, "etag": etag or "", "last_modified": last_modified or "", "stored_at": time.time()}
+        self._write(self._key(url), meta, content)
+
+    def refresh(self, url: str, meta, content: str):
+        """304 重新验证成功：只刷新存储时间。"""
+        meta = dict(meta, stored_at=time.time())
+        self._write(self._key(url), meta, content)
+
+    def _write(self, key: str, meta, content: str):
+        data = json.dumps(meta, ensure_ascii=False).encode("utf-8") + b"\n" + \
+            zlib.compress(content.encode("utf-8"), 6)
+        path = self._path(key)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError:
+            return
+        with self._lock:
+            old = self._index.get(key)
+            if old:
+                self._total -= old[0]
+            self._index[key] = [len(data), time.time()]
+            self._total += len(data)
+            self.stats["stored"] += 1
+            victims = self._pick_victims()
+        for victim in victims:
+            try:
+                os.remove(self._path(victim))
+            except OSError:
+                pass
+
+    def _pick_victims(self) -> List[str]:
+        # 调用方持有 self._lock
+        if self._total <= self.max_bytes:
+            return []
+        victims = []
+        for key, (size, _) in sorted(self._index.items(), key=lambda kv: kv[1][1]):
+            if self._total <= self.max_bytes:
+                break
+            victims.append(key)
+            self._total -= size
+            del self._index[key]
+            self.stats["evicted"] += 1
+        return victims
+
+    def count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+
+
+_http_cache = None
+_http_cache_lock = threading.Lock()
+
+
+def _get_http_cache():
+    """按 CONFIG["http_cache"] 懒加载进程级缓存；未启用时返回 None。"""
+    global _http_cache
+    cfg = CONFIG.get("http_cache") or {}
+    if not cfg.get("enabled"):
+        return None
+    with _http_cache_lock:
+        if _http_cache is None:
+            _http_cache = HttpCache(
+                cfg.get("dir", ".scraper_cache/http"),
+                ttl=float(cfg.get("ttl", 86400)),
+                max_bytes=int(cfg.get("max_bytes", 512 * 1024 * 1024)),
+            )
+    return _http_cache
+
+
+class _PartialPage(str):
+    """流式读取搜索页时提前断开得到的页面前缀：不写入 HTTP 缓存与页面归档，也不与要完整页面的调用方共享。"""
+
+    __slots__ = ()
+
+
+def _cached_get(url: str, timeout: float, stream_search: bool = False) -> Tuple[str, int, str]:
+    """
+    带磁盘缓存的 GET，返回 (content, status_code, error)。
+    缓存命中或 304 重新验证时 status 记为 200。
+    stream_search=True 时按搜索页流式读取，见到第一个结果链接即断开（此时 content 只是页面前缀，
+    以 _PartialPage 返回，不写入缓存）。
+    """
+    cache = _get_http_cache()
+    meta, cached = (None, "")
+    headers = None
+    if cache is not None:
+        meta, cached = cache.get(url)
+        if meta is not None:
+            if cache.is_fresh(meta):
+                cache.count("hit")
+                return cached, 200, ""
+            headers = cache.conditional_headers(meta)
+    policy = _get_retry_policy()
+    breaker = _get_circuit_breaker()
+    host = urlsplit(url).hostname or ""
+    # run_parallel 的工作线程按任务计数重试次数，等待交给主循环
+    defer = getattr(thread_local, "defer_retries", False)
+    attempt = getattr(thread_local, "task_attempt", 1) if defer else 1
+    while True:
+        blocked_for = breaker.before(host) if breaker is not None else 0.0
+        resp, content, truncated = None, "", False
+        status, retry_after, error, kind = 0, None, None, None
+        if blocked_for > 0:
+            error = _circuit_open_error_class()(f"熔断中：{host} 暂停请求（{blocked_for:.1f}s 后探测）")
+            kind = "circuit"
+        else:
+            try:
+                resp, content, truncated = _hedged_http_get(url, timeout, headers, stream_search)
+                status, retry_after = resp.status_code, resp.headers.get("Retry-After")
+            except requests.RequestException as e:
+                error, kind = e, _exception_kind(e)
+            if breaker is not None:
+                breaker.record(host, ok=not _is_failure(status, kind))
+        if policy is None or attempt >= policy.max_attempts or not policy.should_retry(status, kind):
+            break
+        delay = blocked_for if blocked_for > 0 else policy.delay(attempt, retry_after)
+        _count_retry()
+        if defer:
+            raise _RetryLater(delay)
+        time.sleep(delay)
+        attempt += 1
+    if error is not None:
+        raise error
+    if status == 304 and meta is not None:
+        cache.count("revalidated")
+        cache.refresh(url, meta, cached)
+        return cached, 200, ""
+    if cache is not None:
+        cache.count("miss")
+        if status == 200 and not truncated:
+            cache.put(url, content, resp.headers.get("ETag", ""), resp.headers.get("Last-Modified", ""))
+    return (_PartialPage(content) if truncated else content), status, ""
+
+
+def _hedged_http_get(url: str, timeout: float, headers, stream_search: bool):
+    """开启对冲时经 Hedger 发出请求，否则直接发出；每次实际请求都经 _limited_http_get 占用限流名额。"""
+    hedger = _get_hedger()
+    if hedger is None:
+        return _limited_http_get(url, timeout, headers, stream_search)
+    return hedger.call(lambda cancel: _limited_http_get(url, timeout, headers, stream_search, cancel))
+
+
+def _limited_http_get(url: str, timeout: float, headers, stream_search: bool, cancel=None):
+    """
+    启用自适应限流时先取得一个名额再 _http_get：对冲的重复请求同样占名额，总负载不超过 AIMD 上限。
+    对冲落败（_HedgeCancelled）只归还名额，不作为拥塞信号。
+    """
+    limiter = _get_limiter()
+    if limiter is None:
+        return _http_get(url, timeout, headers, stream_search, cancel)
+    limiter.acquire()
+    start = time.perf_counter()
+    status, retry_after = 0, None
+    try:
+        # 等名额期间主请求可能已经胜出
+        if cancel is not None and cancel.is_set():
+            raise _HedgeCancelled(url)
+        resp, content, truncated = _http_get(url, timeout, headers, stream_search, cancel)
+        status, retry_after = resp.status_code, resp.headers.get("Retry-After")
+        return resp, content, truncated
+    except _HedgeCancelled:
+        status = None
+        raise
+    finally:
+        limiter.release(status, time.perf_counter() - start, retry_after)
+
+
+def _http_get(url: str, timeout: float, headers, stream_search: bool, cancel=None):
+    """
+    实际发出 GET 并读取正文，记录 ttfb/download/状态码/字节数指标。
+    返回 (resp, content, truncated)；304 时 content 为空字符串。
+    cancel 为 threading.Event 时分块读取正文，被置位后停止读取并关闭连接（对冲落败）。
+    """
+    session = _get_session()
+    start = time.perf_counter()
+    try:
+        resp = session.get(url, timeout=timeout, headers=headers, stream=stream_search or cancel is not None)
+    except requests.RequestException:
+        _count_response(0)
+        raise
+    got = time.perf_counter()
+    # resp.elapsed：发出请求到解析完响应头（含建连）
+    ttfb = resp.elapsed.total_seconds()
+    _observe("ttfb", ttfb)
+    if resp.status_code == 304:
+        resp.close()
+        _count_response(304)
+        return resp, "", False
+    truncated = False
+    if stream_search and resp.status_code == 200:
+        content, truncated, nbytes = _read_search_stream(resp, cancel)
+        _observe("download", time.perf_counter() - got)
+    elif cancel is not None:
+        body = []
+        try:
+            for chunk in resp.iter_content(16384):
+                if cancel.is_set():
+                    raise _HedgeCancelled(url)
+                body.append(chunk)
+        finally:
+            resp.close()
+        resp._content = b"".join(body)
+        _observe("download", time.perf_counter() - got)
+        if resp.encoding is None:
+            resp.encoding = resp.apparent_encoding or "utf-8"
+        content = resp.text
+        nbytes = len(resp.content)
+    else:
+        if stream_search:
+            # 流式请求的非 200 响应：正文此时才读取，计时从收到响应头开始
+            resp.content
+            _observe("download", time.perf_counter() - got)
+        else:
+            # 非流式时正文已在 session.get 内读完
+            _observe("download", max(0.0, got - start - ttfb))
+        # 尽量正确解码
+        if resp.encoding is None:
+            resp.encoding = resp.apparent_encoding or "utf-8"
+        content = resp.text
+        nbytes = len(resp.content)
+    _count_response(resp.status_code, nbytes)
+    return resp, content, truncated
+
+
+def _read_search_stream(resp, cancel=None) -> Tuple[str, bool, int]:
+    """
+    分块读取搜索页并增量解析，返回 (已读取的文本, 是否提前断开, 已读取字节数)。
+    见到第一个结果链接、#list 已结束或出现“无结果”标记时立即关闭连接。
+    cancel 被置位（对冲落败）时抛出 _HedgeCancelled 并关闭连接。
+    """
+    cfg = CONFIG.get("stream_search") or {}
+    chunk_size = int(cfg.get("chunk_size", 16384))
+    markers = [m for m in cfg.get("no_result_markers") or [] if m]
+    overlap = max((len(m) for m in markers), default=0)
+    # 无 charset 时与非流式一致地回退到 utf-8（apparent_encoding 需要完整正文）
+    decoder = codecs.getincrementaldecoder(resp.encoding or "utf-8")(errors="replace")
+    scanner = _SearchScanner()
+    parts = []
+    tail = ""
+    nbytes = 0
+    try:
+        for chunk in resp.iter_content(chunk_size):
+            if cancel is not None and cancel.is_set():
+                raise _HedgeCancelled(resp.url)
+            nbytes += len(chunk)
+            text = decoder.decode(chunk)
+            parts.append(text)
+            window = tail + text
+            if any(m in window for m in markers):
+                return "".join(parts), True, nbytes
+            tail = window[-overlap:] if overlap else ""
+            try:
+                scanner.feed(text)
+            except _StopScan:
+                return "".join(parts), True, nbytes
+        parts.append(decoder.decode(b"", final=True))
+        return "".join(parts), False, nbytes
+    finally:
+        resp.close()
+
+
+# ---------------- 单飞（single-flight）请求合并 ----------------
+
+class _FlightCall:
+    __slots__ = ("event", "value", "exc")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.exc = None
+
+
+class SingleFlight:
+    """
+    进程内请求合并：同一个 key 同时只执行一次 fn，其余调用者等待并共享其结果。
+    _calls 只保存在途的调用，完成即删除。share_completed=True 时，已完成且 keep(value) 为真的
+    "parse" 结果另存进最多 max_completed 条的 LRU，串行模式下重复的番号不会再请求详情页；
+    "request" 的结果含整页正文，完成后从不保留。
+    """
+
+    def __init__(self, share_completed: bool = False, max_completed: int = 1024):
+        self.share_completed = share_completed
+        self.max_completed = max(0, int(max_completed))
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._completed = OrderedDict()
+        self.stats = {"executed": 0, "requests_saved": 0, "parses_saved": 0}
+
+    def do(self, kind: str, key: str, fn, keep=None):
+        """
+        kind 为 "request" 或 "parse"，只用于统计节省的次数。
+        """
+        while True:
+            with self._lock:
+                if (kind, key) in self._completed:
+                    self._completed.move_to_end((kind, key))
+                    self.stats[kind + "s_saved"] += 1
+                    return self._completed[(kind, key)]
+                call = self._calls.get((kind, key))
+                if call is None:
+                    call = _FlightCall()
+                    self._calls[(kind, key)] = call
+                    self.stats["executed"] += 1
+                    break
+            call.event.wait()
+            if isinstance(call.exc, _RetryLater):
+                # 领头者所在的任务被推迟重试，没有结果可共享：重新参与（等待新的领头者或自己执行）
+                continue
+            with self._lock:
+                self.stats[kind + "s_saved"] += 1
+            if call.exc is not None:
+                raise call.exc
+            return call.value
+        try:
+            call.value = fn()
+        except BaseException as e:
+            call.exc = e
+            raise
+        finally:
+            retain = self.share_completed and kind == "parse" and self.max_completed > 0 and \
+                call.exc is None and (keep is None or keep(call.value))
+            with self._lock:
+                self._calls.pop((kind, key), None)
+                if retain:
+                    self._completed[(kind, key)] = call.value
+                    if len(self._completed) > self.max_completed:
+                        self._completed.popitem(last=False)
+            call.event.set()
+        return call.value
+
+
+_single_flight = None
+_single_flight_lock = threading.Lock()
+
+
+def _get_single_flight():
+    """按 CONFIG["single_flight"] 懒加载进程级 SingleFlight；未启用时返回 None。"""
+    global _single_flight
+    cfg = CONFIG.get("single_flight") or {}
+    if not cfg.get("enabled"):
+        return None
+    with _single_flight_lock:
+        if _single_flight is None:
+            _single_flight = SingleFlight(share_completed=bool(cfg.get("share_completed", False)),
+                                          max_completed=cfg.get("max_completed", 1024))
+    return _single_flight
+
+
+def _shared_get(url: str, timeout: float, stream_search: bool = False) -> Tuple[str, int, str]:
+    """
+    _cached_get 外包一层单飞：同一 URL 的并发请求只发一次。
+    流式读取的请求单独成组（结果可能只是页面前缀），不会把前缀交给要完整页面的调用方。
+    """
+    sf = _get_single_flight()
+    if sf is None:
+        return _cached_get(url, timeout, stream_search)
+    key = f"stream:{url}" if stream_search else url
+    return sf.do("request", key, lambda: _cached_get(url, timeout, stream_search),
+                 keep=lambda r: r[1] == 200)
+
+
+def fetch_once(code: str, idx: int, timeout: float = 15.0) -> Tuple[str, int, str, str]:
+    """
+    发起一次请求并返回 (content, status_code, url, error)
+    - content: 成功时为完整页面文本；失败时为空字符串
+    - status_code: HTTP 状态码（失败时为 0）
+    - url: 实际请求的 URL
+    - error: 失败时的错误信息（成功时为空字符串）
+    """
+    url = _make_url(code)
+    try:
+        stream = bool((CONFIG.get("stream_search") or {}).get("enabled"))
+        with _span("search_fetch"):
+            content, status, _ = _shared_get(url, timeout, stream_search=stream)
+        _archive_page("search", code, url, content, status)
+        return content, status, url, ""
+    except requests.RequestException as e:
+        return "", 0, url, str(e)
+
+
+def _total_of(codes: Iterable[str], repeat: int):
+    """列表时返回总任务数；流式输入（生成器）无法预知，返回 None。"""
+    return len(codes) * max(1, repeat) if hasattr(codes, "__len__") else None
+
+
+def run_sequential(codes: Iterable[str], repeat: int, interval: float, timeout: float):
+    total = _total_of(codes, repeat)
+    counter = 0
+    for code in codes:
+        for i in range(repeat):
+            if interval > 0 and counter > 0:
+                time.sleep(interval)
+            counter += 1
+            with _Timings({}) as timings:
+                hit = _source_result(code, timeout) or _indexed_result(code, timeout)
+                if hit is not None:
+                    content, status, url, err, elapsed, result = hit
+                else:
+                    start = time.perf_counter()
+                    content, status, url, err = fetch_once(code, i, timeout=timeout)
+                    elapsed = time.perf_counter() - start
+                    result = None
+                    if CONFIG.get("extract_first_result", False) and not err and status == 200:
+                        result = _extract_detail_fields(content, url)
+            _emit_result(counter, total, code, status, url, elapsed, content, err, result, timings)
+
+
+def run_parallel(codes: Iterable[str], repeat: int, workers: int, timeout: float, window: int = None):
+    """
+    线程池引擎。任务按需从 codes 中取出，同时在途（含等待重试）的任务不超过 window 个
+    （默认 workers * 4），因此 codes 可以是惰性生成器，内存占用与输入规模无关。
+    """
+    total = _total_of(codes, repeat)
+    tasks = ((code, i) for code in codes for i in range(repeat))
+    window = max(1, workers, int(window or workers * 4))
+    counter = 0
+    # 需要重试的任务按 (到期时间, 序号, code, i, state) 放入小顶堆，到期后重新提交，
+    # 工作线程不会因等待退避而闲置
+    delayed = []
+    seq = 0
+    exhausted = False
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+        future_map = {}
+        while True:
+            # 补足窗口
+            while not exhausted and len(future_map) + len(delayed) < window:
+                task = next(tasks, None)
+                if task is None:
+                    exhausted = True
+                    break
+                code, i = task
+                state = {}
+                future_map[ex.submit(_parallel_task, code, i, timeout, state)] = (code, i, state)
+            if not future_map and not delayed:
+                break
+            now = time.monotonic()
+            while delayed and delayed[0][0] <= now:
+                _, _, code, i, state = heapq.heappop(delayed)
+                future_map[ex.submit(_parallel_task, code, i, timeout, state)] = (code, i, state)
+            wait_s = max(0.0, delayed[0][0] - now) if delayed else None
+            if not future_map:
+                time.sleep(wait_s)
+                continue
+            done, _ = wait(future_map, timeout=wait_s, return_when=FIRST_COMPLETED)
+            for fut in done:
+                code, i, state = future_map.pop(fut)
+                kind, payload = fut.result()
+                if kind == "retry":
+                    seq += 1
+                    heapq.heappush(delayed, (time.monotonic() + payload, seq, code, i, state))
+                    continue
+                counter += 1
+                content, status, url, err, elapsed, result = payload
+                _emit_result(counter, total, code, status, url, elapsed, content, err, result, state.get("timings"))
+
+
+def _parallel_task(code: str, idx: int, timeout: float, state: dict):
+    """
+    run_parallel 的工作单元：抓取搜索页并解析详情。
+    返回 ("done", (content, status, url, err, elapsed, result)) 或需要重试时的 ("retry", delay)。
+    state 在同一任务的多次尝试之间保留：已取回的搜索页（"search"）、当前请求的尝试次数（"attempt"）
+    与分阶段耗时（"timings"），因此详情页请求的重试不会重新请求搜索页。
+    """
+    thread_local.defer_retries = _get_retry_policy() is not None
+    thread_local.task_attempt = state.get("attempt", 1)
+    try:
+        with _Timings(state.setdefault("timings", {})):
+            if "search" not in state:
+                hit = _source_result(code, timeout) or _indexed_result(code, timeout)
+                if hit is not None:
+                    return "done", hit
+                state["search"] = _timed_fetch(code, idx, timeout)
+                # 进入详情页请求，尝试次数重新计
+                thread_local.task_attempt = 1
+            content, status, url, err, elapsed = state["search"]
+            result = None
+            if CONFIG.get("extract_first_result", False) and not err and status == 200:
+                result = _extract_detail_fields(content, url)
+            return "done", (content, status, url, err, elapsed, result)
+    except _RetryLater as r:
+        state["attempt"] = thread_local.task_attempt + 1
+        return "retry", r.delay
+    finally:
+        thread_local.defer_retries = False
+        thread_local.task_attempt = 1
+
+
+# ---------------- 分阶段流水线引擎 ----------------
+
+_PIPELINE_STOP = object()
+
+PIPELINE_STAGES = ("search_fetch", "search_parse", "detail_fetch", "detail_parse")
+
+
+class _PipelineStage:
+    """
+    一个流水线阶段：n 个 worker 线程从 in_q 取任务，fn(job) 返回 True 时交给下一阶段，
+    否则直接送入 out_q。本阶段最后一个 worker 退出时向下一阶段投递结束标记。
+    """
+
+    def __init__(self, name: str, fn, workers: int, queue_size: int):
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, workers)
+        self.in_q = queue.Queue(maxsize=max(1, queue_size))
+        self.next = None
+        self.out_q = None
+        self._alive = self.workers
+        self._lock = threading.Lock()
+        self.threads: List[threading.Thread] = []
+
+    def start(self):
+        for n in range(self.workers):
+            t = threading.Thread(target=self._loop, name=f"{self.name}-{n}", daemon=True)
+            t.start()
+            self.threads.append(t)
+
+    def _loop(self):
+        try:
+            while True:
+                job = self.in_q.get()
+                if job is _PIPELINE_STOP:
+                    break
+                try:
+                    with _Timings(job.setdefault("timings", {})):
+                        forward = self.fn(job) and self.next is not None
+                except Exception as e:
+                    self._fail(job, e)
+                    forward = False
+                except BaseException as e:
+                    # KeyboardInterrupt / SystemExit：这条任务仍要交给主线程，否则主线程一直等它
+                    self._fail(job, e)
+                    self.out_q.put(job)
+                    raise
+                if forward:
+                    self.next.in_q.put(job)
+                else:
+                    self.out_q.put(job)
+        finally:
+            # worker 无论如何退出都要计数，否则下一阶段收不到结束标记
+            with self._lock:
+                self._alive -= 1
+                last = self._alive == 0
+            if last and self.next is not None:
+                for _ in range(self.next.workers):
+                    self.next.in_q.put(_PIPELINE_STOP)
+
+    def _fail(self, job, e: BaseException):
+        error = f"流水线阶段 {self.name} 异常: {e}"
+        job["result"] = {"detail_url": job.get("detail_url", ""), "title": "", "performer": "",
+                         "category": "", "error": error}
+        # 第一个阶段出错时这些字段可能还没填，主线程输出结果时需要
+        job.setdefault("status", 0)
+        job.setdefault("url", _make_url(job["code"]))
+        job.setdefault("elapsed", 0.0)
+        job.setdefault("content", "")
+        job.setdefault("err", error)
+
+
+def _stage_search_fetch(job) -> bool:
+    multi = _source_result(job["code"], job["timeout"])
+    if multi is not None:
+        # 多数据源：各来源在 SourceFanout 内并发完成，结果直接输出
+        content, status, url, err, elapsed, result = multi
+        job.update(content=content, status=status, url=url, err=err, elapsed=elapsed, result=result)
+        return False
+    hit = _fetch_indexed_detail(job["code"], job["timeout"])
+    if hit is not None:
+        # 索引命中：详情页已取回，后两个阶段直接放行
+        detail_url, html, status, err, elapsed = hit
+        job.update(content=html, status=status, url=_make_url(job["code"]), err=err, elapsed=elapsed,
+                   detail_url=detail_url, detail_html=html)
+        return not err and status == 200
+    content, status, url, err, elapsed = _timed_fetch(job["code"], job["idx"], job["timeout"])
+    job.update(content=content, status=status, url=url, err=err, elapsed=elapsed)
+    return bool(CONFIG.get("extract_first_result", False)) and not err and status == 200
+
+
+def _stage_search_parse(job) -> bool:
+    if "detail_html" in job:
+        return True
+    detail_url, perr = _parse_first_result_link(job["content"], job["url"])
+    if perr:
+        job["result"] = {"detail_url": "", "title": "", "performer": "", "category": "", "error": perr}
+        return False
+    job["detail_url"] = detail_url
+    return True
+
+
+def _stage_detail_fetch(job) -> bool:
+    if "detail_html" in job:
+        return True
+    detail_html, _, derr = fetch_detail(job["detail_url"], timeout=job["timeout"], code=job["code"])
+    if derr:
+        job["result"] = {"detail_url": job["detail_url"], "title": "", "performer": "",
+                         "category": "", "error": f"详情页请求失败: {derr}"}
+        return False
+    job["detail_html"] = detail_html
+    return True
+
+
+def _stage_detail_parse(job) -> bool:
+    job["result"] = _parse_detail_page(job.pop("detail_html"), job["detail_url"])
+    return False
+
+
+def run_pipeline(codes: Iterable[str], repeat: int, timeout: float, stage_workers: dict, queue_size: int = 100):
+    """
+    分阶段流水线：搜索页请求 -> 搜索页解析 -> 详情页请求 -> 详情页解析。
+    每个阶段有独立的 worker 数（stage_workers，键见 PIPELINE_STAGES），阶段之间用有界队列衔接；
+    主线程只负责输出结果。
+    """
+    fns = (_stage_search_fetch, _stage_search_parse, _stage_detail_fetch, _stage_detail_parse)
+    out_q: "queue.Queue" = queue.Queue()
+    pool = _get_parse_pool()
+
+    def n_workers(name):
+        n = int(stage_workers.get(name, 1))
+        # 启用进程池时解析阶段的线程只负责派发，至少与子进程数一样多才能用满所有核
+        return max(n, pool.workers) if pool is not None and name.endswith("_parse") else n
+
+    stages = [_PipelineStage(name, fn, n_workers(name), queue_size)
+              for name, fn in zip(PIPELINE_STAGES, fns)]
+    for cur, nxt in zip(stages, stages[1:] + [None]):
+        cur.next = nxt
+        cur.out_q = out_q
+    for st in stages:
+        st.start()
+
+    total = _total_of(codes, repeat)
+
+    feed_error = []
+
+    def feed():
+        head = stages[0]
+        fed = 0
+        try:
+            for code in codes:
+                for i in range(repeat):
+                    # 有界队列：下游处理不过来时在此阻塞，形成背压
+                    head.in_q.put({"code": code, "idx": i, "timeout": timeout})
+                    fed += 1
+        except BaseException as e:
+            # 流式输入（文件读取、refresh 生成器）出错：已投递的任务照常收尾，异常在主线程重新抛出
+            feed_error.append(e)
+        finally:
+            for _ in range(head.workers):
+                head.in_q.put(_PIPELINE_STOP)
+            # 告知主线程总数（流式输入时事先不知道）
+            out_q.put((_PIPELINE_STOP, fed))
+
+    feeder = threading.Thread(target=feed, name="pipeline-feeder", daemon=True)
+    feeder.start()
+
+    counter = 0
+    expected = None
+    while expected is None or counter < expected:
+        job = out_q.get()
+        if isinstance(job, tuple):
+            expected = job[1]
+            continue
+        counter += 1
+        _emit_result(counter, total, job["code"], job["status"], job["url"], job["elapsed"],
+                     job["content"], job["err"], job.get("result"), job.get("timings"))
+
+    feeder.join()
+    for st in stages:
+        for t in st.threads:
+            t.join()
+    if feed_error:
+        raise feed_error[0]
+
+
+# ---------------- asyncio 引擎（可选依赖 aiohttp） ----------------
+
+def _build_async_session(concurrency: int):
+    """
+    创建共享连接池的 aiohttp.ClientSession：整个进程只有一个连接池，
+    并发上限由 TCPConnector 的 limit 与外层 Semaphore 共同约束。
+    """
+    import aiohttp
+
+    expiry = float((CONFIG.get("http_client") or {}).get("keepalive_expiry") or 15.0)
+    connector = aiohttp.TCPConnector(
+        limit=max(1, concurrency),
+        limit_per_host=max(1, concurrency),
+        ttl_dns_cache=300,
+        keepalive_timeout=expiry,
+    )
+    trace_configs = []
+    if _metrics is not None:
+        # 建连计时（DNS + TCP + TLS）
+        trace = aiohttp.TraceConfig()
+
+        async def on_create_start(session, ctx, params):
+            ctx.connect_start = time.perf_counter()
+
+        async def on_create_end(session, ctx, params):
+            _observe("connect", time.perf_counter() - ctx.connect_start)
+
+        trace.on_connection_create_start.append(on_create_start)
+        trace.on_connection_create_end.append(on_create_end)
+        trace_configs.append(trace)
+    return aiohttp.ClientSession(connector=connector, headers=DEFAULT_HEADERS, trace_configs=trace_configs)
+
+
+async def _async_prewarm(session, concurrency: int):
+    """
+    async 引擎的连接预热：aiohttp 没有单独建连的公开接口，对每个预热主机并发发出 HEAD 请求，
+    握手完成的连接留在 connector 中供随后的请求复用。
+    """
+    import aiohttp
+
+    n = min(int((CONFIG.get("http_client") or {}).get("prewarm") or 0), max(1, concurrency))
+    if n <= 0:
+        return
+
+    async def head(origin):
+        try:
+            async with session.head(origin, allow_redirects=False, timeout=aiohttp.ClientTimeout(total=10)):
+                return True
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logging.warning(f"[http] 预热 {origin} 失败: {e}")
+            return False
+
+    for origin in _prewarm_origins():
+        start = time.perf_counter()
+        ok = sum(await asyncio.gather(*(head(origin) for _ in range(n))))
+        logging.info(f"[http] 预热 {origin}: {ok} 个连接，用时 {time.perf_counter() - start:.3f}s")
+
+
+def _cookie_header_for(url: str) -> str:
+    """
+    按域名匹配预置 cookies，拼成 Cookie 请求头。
+    （http.cookies 不接受 "digital[play_muted]" 这类名称，故不走 aiohttp 的 CookieJar）
+    """
+    host = (urlsplit(url).hostname or "").lower()
+    pairs = []
+    for name, value, domain, _path in _iter_cookies():
+        d = domain.lower().lstrip(".")
+        if host == d or host.endswith("." + d):
+            pairs.append(f"{name}={value}")
+    return "; ".join(pairs)
+
+
+async def _async_get_text(session, sem, url: str, timeout: float, phase: str = "search_fetch") -> Tuple[str, int, str]:
+    """
+    在信号量约束下发起一次 GET，返回 (content, status_code, error)。
+    phase 为指标中的阶段名（"search_fetch" / "detail_fetch"）。
+    开启重试时，退避等待发生在信号量之外，不占用并发名额。
+    """
+    cache = _get_http_cache()
+    meta, cached = (None, "")
+    headers = {}
+    if cache is not None:
+        meta, cached = cache.get(url)
+        if meta is not None:
+            if cache.is_fresh(meta):
+                cache.count("hit")
+                return cached, 200, ""
+            headers.update(cache.conditional_headers(meta))
+    cookie = _cookie_header_for(url)
+    if cookie:
+        headers["Cookie"] = cookie
+    policy = _get_retry_policy()
+    breaker = _get_circuit_breaker()
+    host = urlsplit(url).hostname or ""
+    attempt = 1
+    while True:
+        blocked_for = breaker.before(host) if breaker is not None else 0.0
+        if blocked_for > 0:
+            content, status, err, retry_after, kind = "", 0, f"熔断中：{host} 暂停请求（{blocked_for:.1f}s 后探测）", None, "circuit"
+        else:
+            hedger = _get_hedger()
+            if hedger is None:
+                content, status, err, retry_after, kind = await _async_get_once(
+                    session, sem, url, timeout, headers, meta, cached, phase)
+            else:
+                content, status, err, retry_after, kind = await hedger.call_async(
+                    lambda: _async_get_once(session, sem, url, timeout, headers, meta, cached, phase))
+            if breaker is not None:
+                breaker.record(host, ok=not _is_failure(status, kind))
+        if policy is None or attempt >= policy.max_attempts or not policy.should_retry(status, kind):
+            return content, status, err
+        _count_retry()
+        await asyncio.sleep(blocked_for if blocked_for > 0 else policy.delay(attempt, retry_after))
+        attempt += 1
+
+
+async def _async_get_once(session, sem, url: str, timeout: float, headers: dict, meta, cached: str, phase: str):
+    """
+    _async_get_text 的单次尝试，返回 (content, status, error, retry_after, exception_kind)。
+    """
+    import aiohttp
+
+    cache = _get_http_cache()
+    limiter = _get_limiter()
+    async with sem:
+        if limiter is not None:
+            await limiter.acquire_async()
+        status, retry_after = 0, None
+        start = time.perf_counter()
+        try:
+            async with session.get(url, headers=headers, timeout=aiohttp.ClientTimeout(total=timeout)) as resp:
+                status, retry_after = resp.status, resp.headers.get("Retry-After")
+                got = time.perf_counter()
+                _observe("ttfb", got - start)
+                if resp.status == 304 and meta is not None:
+                    _count_response(304)
+                    cache.count("revalidated")
+                    cache.refresh(url, meta, cached)
+                    return cached, 200, "", None, None
+                raw = await resp.read()
+                content = await resp.text(errors="replace")
+                done = time.perf_counter()
+                _observe("download", done - got)
+                _observe(phase, done - start)
+                _count_response(resp.status, len(raw))
+                if cache is not None:
+                    cache.count("miss")
+                    if resp.status == 200:
+                        cache.put(url, content, resp.headers.get("ETag", ""), resp.headers.get("Last-Modified", ""))
+                return content, resp.status, "", retry_after, None
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            _count_response(0)
+            return "", 0, str(e) or e.__class__.__name__, None, _exception_kind(e)
+        except asyncio.CancelledError:
+            # 对冲落败被取消：不计入拥塞信号
+            status = None
+            raise
+        finally:
+            if limiter is not None:
+                limiter.release(status, time.perf_counter() - start, retry_after)
+
+
+async def _async_fetch_and_extract(session, sem, code: str, idx: int, timeout: float, single_source: bool = False):
+    """
+    asyncio 版本的“搜索页 -> 详情页”流程。
+    返回 (code, content, status, url, err, elapsed, result)；未解析时 result 为 None。
+    启用多数据源时转交 SourceFanout；single_source=True（DmmProvider 调用）时只走 DMM 且总是解析详情。
+    """
+    if not single_source:
+        fanout = _get_fanout()
+        if fanout is not None:
+            return (code,) + await fanout.fetch_async(session, sem, code, timeout)
+    url = _make_url(code)
+    index = _get_detail_index()
+    detail_url = index.get(code) if index is not None else None
+    if detail_url:
+        start = time.perf_counter()
+        html, status, derr = await _async_get_text(session, sem, detail_url, timeout, phase="detail_fetch")
+        elapsed = time.perf_counter() - start
+        _archive_page("detail", code, detail_url, html, status)
+        if status in _INDEX_STALE_STATUSES:
+            index.discard(code)
+        else:
+            result = await _async_parse("detail", html, detail_url) if not derr and status == 200 else None
+            return code, html, status, url, derr, elapsed, result
+    start = time.perf_counter()
+    content, status, err = await _async_get_text(session, sem, url, timeout)
+    elapsed = time.perf_counter() - start
+    _archive_page("search", code, url, content, status)
+    if not (single_source or CONFIG.get("extract_first_result", False)) or err or status != 200:
+        return code, content, status, url, err, elapsed, None
+
+    detail_url, perr = await _async_parse("search", content, url)
+    if perr:
+        result = {"detail_url": "", "title": "", "performer": "", "category": "", "error": perr}
+        return code, content, status, url, err, elapsed, result
+    detail_html, dstatus, derr = await _async_get_text(session, sem, detail_url, timeout, phase="detail_fetch")
+    _archive_page("detail", code, detail_url, detail_html, dstatus)
+    if derr:
+        result = {"detail_url": detail_url, "title": "", "performer": "", "category": "", "error": f"详情页请求失败: {derr}"}
+        return code, content, status, url, err, elapsed, result
+    return code, content, status, url, err, elapsed, await _async_parse("detail", detail_html, detail_url)
+
+
+async def _async_timed(coro):
+    """在当前协程任务内收集 coro 的分阶段耗时，返回 (coro 的结果, timings)。"""
+    with _Timings({}) as timings:
+        return await coro, timings
+
+
+async def _run_async_main(codes: Iterable[str], repeat: int, concurrency: int, timeout: float, window: int = None):
+    total = _total_of(codes, repeat)
+    tasks = ((code, i) for code in codes for i in range(repeat))
+    # 已创建的协程（含在信号量上排队的）不超过 window 个
+    window = max(1, concurrency, int(window or concurrency * 2))
+    counter = 0
+    sem = asyncio.Semaphore(max(1, concurrency))
+    async with _build_async_session(concurrency) as session:
+        await _async_prewarm(session, concurrency)
+        pending = set()
+        exhausted = False
+        try:
+            while True:
+                while not exhausted and len(pending) < window:
+                    task = next(tasks, None)
+                    if task is None:
+                        exhausted = True
+                        break
+                    code, i = task
+                    coro = _async_fetch_and_extract(session, sem, code, i, timeout)
+                    pending.add(asyncio.ensure_future(_async_timed(coro)))
+                if not pending:
+                    break
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for fut in done:
+                    (code, content, status, url, err, elapsed, result), timings = fut.result()
+                    counter += 1
+                    _emit_result(counter, total, code, status, url, elapsed, content, err, result, timings)
+        finally:
+            # 被取消或出错时先收回在途的请求协程，再关闭 session
+            for fut in pending:
+                fut.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+
+def run_async(codes: Iterable[str], repeat: int, concurrency: int, timeout: float, window: int = None):
+    """
+    asyncio 引擎：单进程、单连接池，最多 concurrency 个请求同时在途。
+    任务按需从 codes 中取出（最多 window 个协程并存，默认 concurrency * 2）。
+    依赖 aiohttp（pip install aiohttp）。
+    """
+    asyncio.run(_run_async_main(codes, repeat, concurrency, timeout, window))
+
+
+# ---------------- HTML 解析后端 ----------------
+#
+# 每个后端提供两个函数：
+# - first_link(html) -> href 或 None：搜索页 "#list > li:nth-child(1) > div > p.tmb > a" 的 href
+# - detail_raw(html) -> dict：详情页的原始字段，由 _parse_detail_page 统一做翻译与封面挑选
+#   {"title": str, "performer": str, "genres": List[str] 或 None,
+#    "og_image": str 或 None, "modal": dict 或 None, "modal_parent_href": str 或 None, "imgs": List[dict]}
+
+# 封面相关的属性（modal 节点按此顺序取值；全局 img 扫描只用其中三个）
+_MODAL_ATTRS = ("data-src", "data-original", "data-lazy", "data-srcset", "src")
+_IMG_ATTRS = ("data-src", "data-original", "src")
+
+
+def _is_genre_label(text: str) -> bool:
+    # 归一化全角冒号
+    return "ジャンル" in text.replace("：", ":")
+
+
+def _bs4_first_link(html: str):
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, "html.parser")
+    a = soup.select_one("#list > li:nth-child(1) > div > p.tmb > a")
+    return a.get("href") if a else None
+
+
+def _bs4_detail_raw(html: str) -> dict:
+    from bs4 import BeautifulSoup
+    dsoup = BeautifulSoup(html, "html.parser")
+    title_el = dsoup.select_one("#title")
+    performer_el = dsoup.select_one("#performer")
+    raw = {
+        "title": title_el.get_text(strip=True) if title_el else "",
+        "performer": performer_el.get_text(strip=True) if performer_el else "",
+        "genres": None, "og_image": None, "modal": None, "modal_parent_href": None, "imgs": [],
+    }
+    # 分类（ジャンル）：根据左侧标签单元格寻找右侧兄弟单元格中的所有 a 文本
+    label_td = None
+    for td in dsoup.find_all("td", class_="nw"):
+        if _is_genre_label(td.get_text(strip=True)):
+            label_td = td
+            break
+    if label_td:
+        value_td = label_td.find_next_sibling("td")
+        if value_td:
+            raw["genres"] = [a.get_text(strip=True) for a in value_td.find_all("a")]
+    meta_og = dsoup.find("meta", attrs={"property": "og:image"})
+    if meta_og:
+        raw["og_image"] = meta_og.get("content")
+    cover_el = dsoup.select_one("#fn-modalSampleImage__image")
+    if cover_el:
+        raw["modal"] = {attr: cover_el.get(attr) for attr in _MODAL_ATTRS}
+        parent_a = cover_el.find_parent("a")
+        if parent_a:
+            raw["modal_parent_href"] = parent_a.get("href")
+    raw["imgs"] = [{attr: img.get(attr) for attr in _IMG_ATTRS} for img in dsoup.find_all("img")]
+    return raw
+
+
+# ---- lxml：C 实现的解析器 + XPath（可选依赖 lxml） ----
+# 注意：lxml 会按 HTML 规范修复错误嵌套（如缺失 </td>），对畸形页面可能与 html.parser 建出不同的树；
+# 切换前可用 compare_parser_backends 在样本页面上做差分校验。
+
+_XP_FIRST_LINK = (
+    "//*[@id='list']/*[1][self::li]/div"
+    "/p[contains(concat(' ', normalize-space(@class), ' '), ' tmb ')]/a"
+)
+_XP_GENRE_LABELS = "//td[contains(concat(' ', normalize-space(@class), ' '), ' nw ')]"
+
+
+def _lxml_doc(html: str):
+    import lxml.etree
+    import lxml.html
+
+    try:
+        return lxml.html.document_fromstring(html)
+    except (lxml.etree.ParserError, ValueError):
+        # 空文档，或带 XML 编码声明的字符串
+        if not html.strip():
+            return None
+        parser = lxml.html.HTMLParser(encoding="utf-8")
+        return lxml.html.document_fromstring(html.encode("utf-8"), parser=parser)
+
+
+def _lxml_text(el) -> str:
+    """等价于 bs4 的 get_text(strip=True)：跳过注释与 script/style 内容。"""
+    parts = []
+
+    def walk(node):
+        if isinstance(node.tag, str) and node.tag not in ("script", "style"):
+            if node.text:
+                parts.append(node.text)
+            for child in node:
+                walk(child)
+                if child.tail:
+                    parts.append(child.tail)
+        else:
+            for child in node:
+                if child.tail:
+                    parts.append(child.tail)
+
+    walk(el)
+    return "".join(p.strip() for p in parts)
+
+
+def _lxml_first_link(html: str):
+    doc = _lxml_doc(html)
+    if doc is None:
+        return None
+    found = doc.xpath(_XP_FIRST_LINK)
+    return found[0].get("href") if found else None
+
+
+def _lxml_detail_raw(html: str) -> dict:
+    raw = {"title": "", "performer": "", "genres": None, "og_image": None,
+           "modal": None, "modal_parent_href": None, "imgs": []}
+    doc = _lxml_doc(html)
+    if doc is None:
+        return raw
+    for key in ("title", "performer"):
+        found = doc.xpath(f"//*[@id='{key}']")
+        if found:
+            raw[key] = _lxml_text(found[0])
+    for td in doc.xpath(_XP_GENRE_LABELS):
+        if _is_genre_label(_lxml_text(td)):
+            value_td = next(td.itersiblings("td"), None)
+            if value_td is not None:
+                raw["genres"] = [_lxml_text(a) for a in value_td.iterdescendants("a")]
+            break
+    found = doc.xpath("//meta[@property='og:image']")
+    if found:
+        raw["og_image"] = found[0].get("content")
+    found = doc.xpath("//*[@id='fn-modalSampleImage__image']")
+    if found:
+        raw["modal"] = {attr: found[0].get(attr) for attr in _MODAL_ATTRS}
+        parent_a = next(found[0].iterancestors("a"), None)
+        if parent_a is not None:
+            raw["modal_parent_href"] = parent_a.get("href")
+    raw["imgs"] = [{attr: img.get(attr) for attr in _IMG_ATTRS} for img in doc.iter("img")]
+    return raw
+
+
+# ---- partial：只跟踪目标区域的流式扫描（标准库 html.parser，不建整棵树） ----
+
+# 与 bs4 的 HTMLTreeBuilder.empty_element_tags 一致：这些标签不会入栈
+_VOID_TAGS = frozenset((
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "keygen", "link", "menuitem",
+    "meta", "param", "source", "track", "wbr", "basefont", "bgsound", "command", "frame",
+    "image", "isindex", "nextid", "spacer",
+))
+
+
+class _StopScan(Exception):
+    pass
+
+
+class _Frame:
+    __slots__ = ("tag", "attrs", "seq", "parent", "position", "children", "texts", "a_texts")
+
+    def __init__(self, tag, attrs, seq, parent, position):
+        self.tag = tag
+        self.attrs = attrs
+        self.seq = seq
+        self.parent = parent
+        self.position = position
+        self.children = 0
+        self.texts = None
+        self.a_texts = None
+
+
+class _ScanParser(_StdHTMLParser):
+    """
+    按 bs4 + html.parser 的建树规则维护一个打开元素栈：
+    void 元素与 <x/> 立即关闭；结束标签弹出到最近的同名元素，找不到则忽略；文档结束时关闭全部元素。
+    文本按 get_text(strip=True) 的方式收集到 texts 不为 None 的各层元素。
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.root = _Frame("[document]", {}, 0, None, 0)
+        self.stack = [self.root]
+        self.seq = 0
+        self._run = []
+
+    # 子类实现
+    def on_open(self, frame):
+        pass
+
+    def on_close(self, frame):
+        pass
+
+    def _flush_text(self):
+        if not self._run:
+            return
+        text = "".join(self._run).strip()
+        self._run = []
+        if text:
+            for fr in self.stack:
+                if fr.texts is not None:
+                    fr.texts.append(text)
+
+    def handle_data(self, data):
+        if self.stack[-1].tag in ("script", "style"):
+            return
+        self._run.append(data)
+
+    def handle_comment(self, data):
+        self._flush_text()
+
+    def handle_starttag(self, tag, attrs):
+        self._open(tag, attrs, closed=tag in _VOID_TAGS)
+
+    def handle_startendtag(self, tag, attrs):
+        self._open(tag, attrs, closed=True)
+
+    def _open(self, tag, attrs, closed):
+        self._flush_text()
+        parent = self.stack[-1]
+        parent.children += 1
+        self.seq += 1
+        frame = _Frame(tag, {k: (v if v is not None else "") for k, v in attrs},
+                       self.seq, parent, parent.children)
+        self.stack.append(frame)
+        self.on_open(frame)
+        if closed:
+            self.stack.pop()
+            self.on_close(frame)
+
+    def handle_endtag(self, tag):
+        self._flush_text()
+        for i in range(len(self.stack) - 1, 0, -1):
+            if self.stack[i].tag == tag:
+                while len(self.stack) > i:
+                    self.on_close(self.stack.pop())
+                return
+
+    def close(self):
+        super().close()
+        self._flush_text()
+        while len(self.stack) > 1:
+            self.on_close(self.stack.pop())
+
+
+class _SearchScanner(_ScanParser):
+    """找到 "#list > li:nth-child(1) > div > p.tmb > a" 或 #list 结束后立即停止。"""
+
+    href = None
+    found = False
+
+    def on_open(self, frame):
+        if frame.tag != "a" or self.found:
+            return
+        p = frame.parent
+        div = p.parent if p else None
+        li = div.parent if div else None
+        lst = li.parent if li else None
+        if lst is None or p.tag != "p" or "tmb" not in p.attrs.get("class", "").split():
+            return
+        if div.tag == "div" and li.tag == "li" and li.position == 1 and lst.attrs.get("id") == "list":
+            self.found = True
+            self.href = frame.attrs.get("href")
+            raise _StopScan()
+
+    def on_close(self, frame):
+        # #list 已结束仍未命中：可以确定没有第一个结果（DMM 搜索页只有一个 #list）
+        if frame.attrs.get("id") == "list" and not self.found:
+            raise _StopScan()
+
+
+class _DetailScanner(_ScanParser):
+    """只收集 #title、#performer、td 单元格、og:image、modal 大图节点与 img 属性。"""
+
+    def __init__(self):
+        super().__init__()
+        self.raw = {"title": "", "performer": "", "genres": None, "og_image": None,
+                    "modal": None, "modal_parent_href": None, "imgs": []}
+        self._seen = set()
+        self._text_targets = {}  # seq -> "title" / "performer"
+        self._tds = []  # (seq, parent_seq, is_nw, text, [(a_seq, a_text)])
+
+    def _first(self, name: str) -> bool:
+        if name in self._seen:
+            return False
+        self._seen.add(name)
+        return True
+
+    def on_open(self, frame):
+        tag, attrs = frame.tag, frame.attrs
+        el_id = attrs.get("id")
+        if el_id in ("title", "performer") and self._first(el_id):
+            self._text_targets[frame.seq] = el_id
+            frame.texts = []
+        elif el_id == "fn-modalSampleImage__image" and self._first(el_id):
+            self.raw["modal"] = {attr: attrs.get(attr) for attr in _MODAL_ATTRS}
+            for anc in reversed(self.stack[:-1]):
+                if anc.tag == "a":
+                    self.raw["modal_parent_href"] = anc.attrs.get("href")
+                    break
+        if tag == "td":
+            frame.texts = []
+            frame.a_texts = []
+        elif tag == "a" and any(fr.tag == "td" for fr in self.stack):
+            frame.texts = []
+        elif tag == "meta" and attrs.get("property") == "og:image" and self._first("og:image"):
+            self.raw["og_image"] = attrs.get("content")
+        elif tag == "img":
+            self.raw["imgs"].append({attr: attrs.get(attr) for attr in _IMG_ATTRS})
+
+    def on_close(self, frame):
+        if frame.texts is None:
+            return
+        text = "".join(frame.texts)
+        key = self._text_targets.get(frame.seq)
+        if key:
+            self.raw[key] = text
+        if frame.tag == "td":
+            is_nw = "nw" in frame.attrs.get("class", "").split()
+            self._tds.append((frame.seq, frame.parent.seq, is_nw, text, frame.a_texts))
+        elif frame.tag == "a":
+            for fr in self.stack:
+                if fr.tag == "td":
+                    fr.a_texts.append((frame.seq, text))
+
+    def result(self) -> dict:
+        # find_all("td", class_="nw") 按文档顺序；find_next_sibling("td") 即同一父元素下之后的第一个 td
+        tds = sorted(self._tds, key=lambda t: t[0])
+        for seq, parent_seq, is_nw, text, _ in tds:
+            if is_nw and _is_genre_label(text):
+                for seq2, parent_seq2, _, _, a_texts in tds:
+                    if seq2 > seq and parent_seq2 == parent_seq:
+                        self.raw["genres"] = [t for _, t in sorted(a_texts, key=lambda a: a[0])]
+                        break
+                break
+        return self.raw
+
+
+def _partial_first_link(html: str):
+    scanner = _SearchScanner()
+    try:
+        scanner.feed(html)
+        scanner.close()
+    except _StopScan:
+        pass
+    return scanner.href
+
+
+def _partial_detail_raw(html: str) -> dict:
+    scanner = _DetailScanner()
+    scanner.feed(html)
+    scanner.close()
+    return scanner.result()
+
+
+PARSER_BACKENDS = {
+    "bs4": (_bs4_first_link, _bs4_detail_raw),
+    "lxml": (_lxml_first_link, _lxml_detail_raw),
+    "partial": (_partial_first_link, _partial_detail_raw),
+}
+
+_parser_fallback_warned = False
+
+
+def _get_parser_backend(name: str = None):
+    """按名称（默认 CONFIG["parser"]）返回 (first_link, detail_raw)；lxml 未安装时回退到 bs4。"""
+    global _parser_fallback_warned
+    name = (name or CONFIG.get("parser") or "bs4").lower()
+    if name == "lxml":
+        try:
+            import lxml.html  # noqa: F401
+        except ImportError:
+            if not _parser_fallback_warned:
+                _parser_fallback_warned = True
+                logging.warning("parser=lxml 但未安装 lxml，回退到 bs4")
+            name = "bs4"
+    return PARSER_BACKENDS.get(name, PARSER_BACKENDS["bs4"])
+
+
+def compare_parser_backends(samples, backends=("lxml", "partial"), reference: str = "bs4") -> List[str]:
+    """
+    差分校验：samples 为 (search_html, detail_html, detail_url) 的可迭代对象，
+    逐个比较各后端与 reference 后端的输出，返回不一致的描述列表（为空表示完全一致）。
+    """
+    ref_link, ref_detail = PARSER_BACKENDS[reference]
+    mismatches = []
+    for n, (search_html, detail_html, detail_url) in enumerate(samples):
+        # 绕过解析结果记忆，保证每个后端都真的解析一遍
+        expected = (ref_link(search_html), _parse_detail_page_uncached(detail_html, detail_url, backend=reference))
+        for name in backends:
+            first_link, _ = PARSER_BACKENDS[name]
+            got = (first_link(search_html), _parse_detail_page_uncached(detail_html, detail_url, backend=name))
+            if got != expected:
+                mismatches.append(f"sample#{n} backend={name}: {got!r} != {expected!r}")
+    return mismatches
+
+
+# ---------------- 进程池解析 ----------------
+#
+# HTML 解析是 CPU 密集型且持有 GIL；开启 CONFIG["parse_processes"] 后，搜索页 / 详情页解析交给
+# 进程池，网络 I/O 仍留在原引擎的线程或事件循环里。正文以 UTF-8 字节交给子进程：
+# - "shm"：写入一块共享内存，只传名字与长度，子进程直接从共享内存读取
+# - "zlib"：压缩后随任务一起 pickle 过去（页面通常可压到 1/5 以下）
+
+_in_parse_worker = False
+
+
+def _parse_worker_init(cfg: dict):
+    global _in_parse_worker
+    _in_parse_worker = True
+    CONFIG.update(cfg)
+
+
+def _parse_job(kind: str, transfer: str, payload, url: str):
+    """子进程入口：取回正文并解析。kind 为 "search" 或 "detail"。"""
+    if transfer == "shm":
+        name, size = payload
+        shm = shared_memory.SharedMemory(name=name)
+        try:
+            html = bytes(shm.buf[:size]).decode("utf-8")
+        finally:
+            shm.close()
+    else:
+        html = zlib.decompress(payload).decode("utf-8")
+    if kind == "search":
+        return _parse_first_result_link(html, url)
+    return _parse_detail_page(html, url)
+
+
+class ParsePool:
+    """把解析任务提交到 spawn 方式启动的进程池（不 fork 带着大量线程的父进程）。"""
+
+    def __init__(self, workers: int = None, transfer: str = "shm"):
+        self.transfer = "zlib" if str(transfer).lower() == "zlib" else "shm"
+        # 子进程重新导入本模块，只需要带上影响解析的配置
+        cfg = {"parser": CONFIG.get("parser", "bs4")}
+        self.workers = max(1, int(workers or os.cpu_count() or 1))
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_parse_worker_init, initargs=(cfg,))
+
+    def submit(self, kind: str, html: str, url: str):
+        data = html.encode("utf-8")
+        if self.transfer == "shm" and data:
+            shm = shared_memory.SharedMemory(create=True, size=len(data))
+
+            def release(_=None):
+                shm.close()
+                shm.unlink()
+            try:
+                shm.buf[:len(data)] = data
+                fut = self._pool.submit(_parse_job, kind, "shm", (shm.name, len(data)), url)
+            except BaseException:
+                # 进程池已损坏（BrokenProcessPool）或已关闭时任务没有提交出去，共享内存由这里释放
+                release()
+                raise
+            fut.add_done_callback(release)
+            return fut
+        return self._pool.submit(_parse_job, kind, "zlib", zlib.compress(data, 1), url)
+
+    def run(self, kind: str, html: str, url: str):
+        with _span(f"{kind}_parse"):
+            return self.submit(kind, html, url).result()
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+
+
+_parse_pool = None
+_parse_pool_lock = threading.Lock()
+
+
+def _get_parse_pool():
+    """按 CONFIG["parse_processes"] 懒加载进程池；未启用或已在子进程中时返回 None。"""
+    global _parse_pool
+    cfg = CONFIG.get("parse_processes") or {}
+    if _in_parse_worker or not cfg.get("enabled"):
+        return None
+    with _parse_pool_lock:
+        if _parse_pool is None:
+            _parse_pool = ParsePool(cfg.get("workers"), cfg.get("transfer", "shm"))
+    return _parse_pool
+
+
+def close_parse_pool():
+    global _parse_pool
+    with _parse_pool_lock:
+        pool, _parse_pool = _parse_pool, None
+    if pool is not None:
+        pool.close()
+
+
+async def _async_parse(kind: str, html: str, url: str):
+    """async 引擎用：有进程池时 await 结果而不阻塞事件循环，否则就地解析。"""
+    pool = _get_parse_pool()
+    if pool is None:
+        return _parse_first_result_link(html, url) if kind == "search" else _parse_detail_page(html, url)
+    memo = _get_parse_memo()
+    key = memo.key(kind, CONFIG.get("parser", "bs4"), url, html) if memo is not None else None
+    if key is not None:
+        hit = memo.get(key, kind)
+        if hit is not None:
+            return hit
+    start = time.perf_counter()
+    try:
+        result = await asyncio.wrap_future(pool.submit(kind, html, url))
+    finally:
+        _observe(f"{kind}_parse", time.perf_counter() - start)
+    if key is not None:
+        memo.put(key, kind, result)
+    return result
+
+
+# 解析结果的格式或语义变化而代码指纹覆盖不到时（例如依赖的 bs4 / lxml 行为变化），手动加一
+PARSER_VERSION = 1
+
+# 计算指纹时不跟进的全局名：运行期状态与进程池 / 统计等与解析结果无关的调用
+_FINGERPRINT_SKIP = frozenset(("CONFIG", "_get_parse_pool", "_span", "_observe"))
+
+
+def _is_static_value(value) -> bool:
+    if isinstance(value, bool) or value is None:
+        # bool 全局多是运行期开关（如 _parser_fallback_warned）
+        return False
+    if isinstance(value, (str, bytes, int, float)):
+        return True
+    if isinstance(value, (tuple, frozenset)):
+        return all(_is_static_value(v) or callable(v) for v in value)
+    if isinstance(value, dict):
+        return all(isinstance(k, str) and (_is_static_value(v) or callable(v)) for k, v in value.items())
+    return False
+
+
+def _parser_fingerprint() -> str:
+    """
+    解析逻辑的指纹：从两个解析入口出发，沿字节码引用的全局名收集本模块的函数 / 类与常量表
+    （解析后端、GENRE_JA_TO_ZH、属性候选列表等），对字节码和常量做 hash。不含行号，
+    只移动代码位置不会改变指纹；Python 版本不同时字节码不同，指纹也随之变化。
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{PARSER_VERSION}|{sys.version_info[0]}.{sys.version_info[1]}".encode())
+    seen = set()
+    pending = ["_parse_first_result_link_uncached", "_parse_detail_page_uncached"]
+
+    def add_code(code):
+        h.update(code.co_code)
+        h.update(repr(code.co_names).encode())
+        for const in code.co_consts:
+            if hasattr(const, "co_code"):
+                add_code(const)
+            else:
+                h.update(repr(const).encode())
+        pending.extend(code.co_names)
+
+    def add_value(value):
+        if isinstance(value, dict):
+            for k in sorted(value):
+                h.update(repr(k).encode())
+                add_value(value[k])
+        elif isinstance(value, (tuple, frozenset)):
+            for v in (sorted(value, key=repr) if isinstance(value, frozenset) else value):
+                add_value(v)
+        elif getattr(value, "__module__", None) == __name__ and hasattr(value, "__name__"):
+            pending.append(value.__name__)
+        else:
+            h.update(repr(value).encode())
+
+    module = globals()
+    while pending:
+        name = pending.pop()
+        if name in seen or name in _FINGERPRINT_SKIP or name not in module:
+            continue
+        seen.add(name)
+        value = module[name]
+        h.update(name.encode())
+        if getattr(value, "__module__", None) == __name__ and isinstance(value, type):
+            for base in value.__mro__[1:]:
+                if base.__module__ == __name__:
+                    pending.append(base.__name__)
+            for attr in sorted(vars(value)):
+                member = vars(value)[attr]
+                member = getattr(member, "__func__", member)
+                if hasattr(member, "__code__"):
+                    add_code(member.__code__)
+        elif getattr(value, "__module__", None) == __name__ and hasattr(value, "__code__"):
+            add_code(value.__code__)
+        elif _is_static_value(value):
+            add_value(value)
+    return h.hexdigest()
+
+
+class ParseMemo:
+    """
+    持久化的解析结果记忆：key 为 (kind, 解析后端, URL, 页面正文) 的 blake2b，value 为解析结果的 JSON。
+    磁盘上首行是解析逻辑指纹，其后是只追加的 "key\tjson" 行；指纹不符时丢弃旧文件重新开始。
+    内存中只保留 JSON 字符串（命中时反序列化出新对象，调用方可以随意修改），超出 max_entries 时淘汰最早的条目。
+    被淘汰的条目仍留在文件里；文件行数超过存活条目的 COMPACT_RATIO 倍时（启动时或运行中）重写文件。
+    """
+
+    COMPACT_MIN_LINES = 1000
+    COMPACT_RATIO = 2
+
+    def __init__(self, path: str, fingerprint: str, max_entries: int = 100000):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.max_entries = max(1, int(max_entries))
+        self._lock = threading.Lock()
+        self._map = {}
+        self.stats = {"hit": 0, "miss": 0, "stored": 0, "evicted": 0, "compacted": 0}
+        lines = self._load()
+        self._lines = lines or 0
+        if lines is None:
+            logging.info(f"Parse memo: 解析逻辑指纹已变化，丢弃 {path}")
+            self._compact()
+        elif self._needs_compaction():
+            self._compact()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._f = open(path, "a", encoding="utf-8")
+        if not os.path.getsize(path):
+            self._f.write(f"#parser\t{fingerprint}\n")
+            self._f.flush()
+
+    @staticmethod
+    def key(kind: str, backend: str, url: str, html: str) -> str:
+        h = hashlib.blake2b(f"{kind}\0{backend}\0{url}\0".encode("utf-8"), digest_size=16)
+        h.update(html.encode("utf-8", "surrogatepass"))
+        return h.hexdigest()
+
+    def _load(self):
+        """返回读到的行数；指纹不符时返回 None。"""
+        lines = 0
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                header = f.readline()
+                if header and header != f"#parser\t{self.fingerprint}\n":
+                    return None
+                valid = len(header.encode("utf-8"))
+                for line in f:
+                    if not line.endswith("\n"):
+                        break
+                    valid += len(line.encode("utf-8"))
+                    lines += 1
+                    key, _, value = line.rstrip("\n").partition("\t")
+                    if value:
+                        self._map.pop(key, None)
+                        self._map[key] = value
+        except FileNotFoundError:
+            return lines
+        # 截掉崩溃留下的半行，避免后续追加与其拼接成坏记录
+        if os.path.getsize(self.path) > valid:
+            with open(self.path, "r+b") as f:
+                f.truncate(valid)
+        while len(self._map) > self.max_entries:
+            del self._map[next(iter(self._map))]
+        return lines
+
+    def _needs_compaction(self) -> bool:
+        return self._lines > self.COMPACT_MIN_LINES and self._lines > self.COMPACT_RATIO * len(self._map)
+
+    def _compact(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(f"#parser\t{self.fingerprint}\n")
+            for key, value in self._map.items():
+                f.write(f"{key}\t{value}\n")
+        os.replace(tmp, self.path)
+        self._lines = len(self._map)
+
+    def get(self, key: str, kind: str):
+        with self._lock:
+            value = self._map.get(key)
+            self.stats["hit" if value is not None else "miss"] += 1
+        if value is None:
+            return None
+        try:
+            result = json.loads(value)
+        except ValueError:
+            # 坏记录（例如旧版本留下的拼接行）当作未命中并丢弃，之后重新解析写入
+            with self._lock:
+                if self._map.get(key) == value:
+                    del self._map[key]
+                self.stats["hit"] -= 1
+                self.stats["miss"] += 1
+            return None
+        return tuple(result) if kind == "search" else result
+
+    def put(self, key: str, kind: str, result):
+        """只记成功的结果：搜索页 (detail_url, "")、详情页 error 为空的字典。"""
+        failed = result[1] if kind == "search" else result.get("error")
+        if failed:
+            return
+        value = json.dumps(list(result) if kind == "search" else result, ensure_ascii=False)
+        with self._lock:
+            if key in self._map or self._f.closed:
+                return
+            self._map[key] = value
+            self._f.write(f"{key}\t{value}\n")
+            self._f.flush()
+            self._lines += 1
+            self.stats["stored"] += 1
+            if len(self._map) > self.max_entries:
+                del self._map[next(iter(self._map))]
+                self.stats["evicted"] += 1
+            if self._needs_compaction():
+                # 长时间运行（daemon）时淘汰的条目在文件里越积越多，运行中也要重写
+                self._f.close()
+                self._compact()
+                self._f = open(self.path, "a", encoding="utf-8")
+                self.stats["compacted"] += 1
+
+    def close(self):
+        with self._lock:
+            if not self._f.closed:
+                self._f.close()
+
+
+_parse_memo = None
+_parse_memo_lock = threading.Lock()
+
+
+def _get_parse_memo():
+    """按 CONFIG["parse_memo"] 懒加载解析结果记忆；未启用或已在解析子进程中时返回 None。"""
+    global _parse_memo
+    cfg = CONFIG.get("parse_memo") or {}
+    if _in_parse_worker or not cfg.get("enabled"):
+        return None
+    with _parse_memo_lock:
+        if _parse_memo is None:
+            _parse_memo = ParseMemo(cfg.get("path", ".scraper_cache/parse_memo.tsv"), _parser_fingerprint(),
+                                    cfg.get("max_entries", 100000))
+    return _parse_memo
+
+
+def close_parse_memo():
+    global _parse_memo
+    with _parse_memo_lock:
+        memo, _parse_memo = _parse_memo, None
+    if memo is not None:
+        memo.close()
+        logging.info(f"Parse memo: {memo.stats}")
+
+
+def _memoized_parse(kind: str, backend: str, url: str, html: str, parse):
+    memo = _get_parse_memo()
+    if memo is None:
+        return parse()
+    key = memo.key(kind, backend or CONFIG.get("parser", "bs4"), url, html)
+    hit = memo.get(key, kind)
+    if hit is not None:
+        return hit
+    result = parse()
+    memo.put(key, kind, result)
+    return result
+
+
+def _parse_first_result_link(html: str, base_url: str) -> Tuple[str, str]:
+    """
+    解析搜索页 HTML，返回 (detail_url, error)。
+    - detail_url: 第一个结果的详情页绝对 URL；失败时为空字符串
+    - error: 失败原因（成功时为空字符串）
+    """
+    return _memoized_parse("search", None, base_url, html,
+                           lambda: _parse_first_result_link_uncached(html, base_url))
+
+
+def _parse_first_result_link_uncached(html: str, base_url: str) -> Tuple[str, str]:
+    pool = _get_parse_pool()
+    if pool is not None:
+        return pool.run("search", html, base_url)
+    try:
+        first_link, _ = _get_parser_backend()
+        # 从搜索页找到第一个结果详情链接
+        with _span("search_parse"):
+            detail_href = first_link(html)
+        if not detail_href:
+            return "", "未找到第一个结果链接"
+        return urljoin(base_url, detail_href.strip()), ""
+    except Exception as e:
+        return "", f"搜索页解析失败: {e}"
+
+
+def _extract_detail_fields(html: str, base_url: str):
+    """
+    解析搜索页 HTML，找到第一个结果链接，再抓取详情页并解析所需字段。
+    返回字典：{"detail_url": str, "title": str, "performer": str, "category": str, "error": str}
+    注意：仅使用用户提供的 CSS 选择器。
+    """
+    sf = _get_single_flight()
+    if sf is not None:
+        # 同一搜索页 URL 共享一次解析（含详情页请求与解析）
+        return sf.do("parse", base_url, lambda: _extract_detail_fields_uncached(html, base_url),
+                     keep=lambda r: not r.get("error"))
+    return _extract_detail_fields_uncached(html, base_url)
+
+
+def _extract_detail_fields_uncached(html: str, base_url: str):
+    detail_url, err = _parse_first_result_link(html, base_url)
+    if err:
+        return {"detail_url": "", "title": "", "performer": "", "category": "", "error": err}
+
+    # 请求详情页
+    detail_html, _, derr = fetch_detail(detail_url, timeout=CONFIG.get("timeout", 15.0))
+    if derr:
+        return {"detail_url": detail_url, "title": "", "performer": "", "category": "", "error": f"详情页请求失败: {derr}"}
+
+    return _parse_detail_page(detail_html, detail_url)
+
+
+def fetch_detail(detail_url: str, timeout: float = 15.0, code: str = "") -> Tuple[str, int, str]:
+    """
+    请求详情页并返回 (content, status_code, error)，约定同 fetch_once。
+    code 已知时一并记入页面归档。
+    """
+    try:
+        with _span("detail_fetch"):
+            content, status, err = _shared_get(detail_url, timeout)
+    except requests.RequestException as e:
+        return "", 0, str(e)
+    _archive_page("detail", code, detail_url, content, status)
+    return content, status, err
+
+
+def _parse_detail_page(detail_html: str, detail_url: str, backend: str = None):
+    """
+    解析详情页 HTML，返回与 _extract_detail_fields 相同结构的字典。
+    backend 为解析后端名称（见 PARSER_BACKENDS），默认取 CONFIG["parser"]。
+    """
+    return _memoized_parse("detail", backend, detail_url, detail_html,
+                           lambda: _parse_detail_page_uncached(detail_html, detail_url, backend))
+
+
+def _parse_detail_page_uncached(detail_html: str, detail_url: str, backend: str = None):
+    pool = _get_parse_pool() if backend is None else None
+    if pool is not None:
+        return pool.run("detail", detail_html, detail_url)
+    # 解析详情页字段
+    try:
+        _, detail_raw = _get_parser_backend(backend)
+        with _span("detail_parse"):
+            raw = detail_raw(detail_html)
+        title = raw["title"]
+        performer = raw["performer"]
+
+        category = ""
+        if raw["genres"] is not None:
+            cats = [c for c in raw["genres"] if c]
+            # 去重保持顺序（可选）
+            seen = set()
+            cats_unique = []
+            for c in cats:
+                if c not in seen:
+                    seen.add(c)
+                    cats_unique.append(c)
+            # 翻译为中文
+            cats_zh = translate_genres_to_zh(cats_unique)
+            category = " / ".join(cats_zh)
+
+        # 封面图片：优先 og:image；再尝试 modal 节点的 data-src/src；再全局扫描候选
+        cover_start = time.perf_counter()
+        cover_url = ""
+        candidates = []
+        # 1) meta og:image
+        if raw["og_image"]:
+            candidates.append(raw["og_image"].strip())
+        # 2) modal 大图节点
+        if raw["modal"] is not None:
+            # 常见懒加载属性优先
+            for attr in _MODAL_ATTRS:
+                val = raw["modal"].get(attr)
+                if val:
+                    val = val.strip()
+                    # 处理 srcset: 取第一段 URL
+                    if attr == "data-srcset":
+                        val = val.split()[0].strip(", ")
+                    candidates.append(val)
+            # 父级 a 的 href 也可能是大图
+            if raw["modal_parent_href"]:
+                candidates.append(raw["modal_parent_href"].strip())
+        # 3) 全局扫描 img，挑选 pics.dmm.co.jp/mono/movie 路径，过滤 loading gif
+        for img in raw["imgs"]:
+            for attr in _IMG_ATTRS:
+                val = img.get(attr)
+                if not val:
+                    continue
+                val_low = val.lower()
+                if ("pics.dmm.co.jp" in val_low or "p.dmm.co.jp" in val_low) and \
+                   ("/mono/movie/" in val_low or "/digital/" in val_low):
+                    if "loading" in val_low and val_low.endswith(".gif"):
+                        continue
+                    candidates.append(val.strip())
+        # 去重并补全为绝对 URL
+        normed = []
+        seen = set()
+        for u in candidates:
+            if not u:
+                continue
+            abs_u = urljoin(detail_url, u)
+            if abs_u not in seen:
+                seen.add(abs_u)
+                normed.append(abs_u)
+        # 偏好规则：优先 pl（大图）> ps > 非 gif
+
+        def pick(urls):
+            if not urls:
+                return ""
+            pref = [u for u in urls if "/pl." in u or u.endswith(
+                "pl.jpg") or u.endswith("pl.png") or "_pl" in u]
+            if pref:
+                return pref[0]
+            pref = [u for u in urls if "/ps." in u or u.endswith(
+                "ps.jpg") or u.endswith("ps.png") or "_ps" in u]
+            if pref:
+                return pref[0]
+            pref = [u for u in urls if not u.lower().endswith(
+                ".gif") and "loading" not in u.lower()]
+            if pref:
+                return pref[0]
+            return urls[0]
+        cover_url = pick(normed)
+        _observe("cover_select", time.perf_counter() - cover_start)
+
+        return {"detail_url": detail_url, "title": title, "performer": performer, "category": category, "cover": cover_url, "error": ""}
+    except Exception as e:
+        return {"detail_url": detail_url, "title": "", "performer": "", "category": "", "error": f"详情页解析失败: {e}"}
+
+
+def _timed_fetch(code: str, idx: int, timeout: float):
+    start = time.perf_counter()
+    content, status, url, err = fetch_once(code, idx, timeout=timeout)
+    elapsed = time.perf_counter() - start
+    return content, status, url, err, elapsed
+
+
+# ---------------- 原始页面归档与离线重新解析 ----------------
+
+_ARCHIVE_KINDS = {"search": 1, "detail": 2}
+
+
+def _try_lock_exclusive(f) -> bool:
+    """对已打开的文件加非阻塞排他锁（关闭文件或进程退出时由系统释放）；已被其它进程持有时返回 False。"""
+    try:
+        if os.name == "nt":
+            import msvcrt
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+
+class PageArchive:
+    """
+    只追加的压缩页面归档：
+    - pages.dat：逐条记录，每条为 4 字节 meta 长度 + JSON meta（url/code/kind/status/ts）+ zlib 压缩正文
+    - pages.idx：定长索引项（URL 键、偏移、长度、类型、正文摘要），加载到内存 dict，同一 URL 以最后一条为准
+    读取通过 mmap 随机访问，多个进程可以同时打开同一归档只读。
+    写入端持有 pages.lock 上的排他锁，同一时刻只有一个写入者；只有写入者会截掉崩溃留下的不完整尾部，
+    只读端遇到指向未落盘数据的索引项只跳过（可能是写入者刚提交的记录）。
+    同一 URL 正文未变化（摘要相同）时不重复写入。
+    """
+
+    ENTRY = struct.Struct("<16sQIB3x8s")
+
+    def __init__(self, root: str, readonly: bool = False, flush_every: int = 100):
+        self.root = root
+        self.data_path = os.path.join(root, "pages.dat")
+        self.index_path = os.path.join(root, "pages.idx")
+        self.flush_every = max(1, int(flush_every))
+        self._lock = threading.Lock()
+        self._entries = {}   # url_key -> (offset, length, kind, digest)
+        self._mm = None
+        self._pending = 0
+        self.stats = {"stored": 0, "unchanged": 0, "bytes_in": 0, "bytes_out": 0}
+        self.readonly = readonly
+        self._lock_f = None
+        if not readonly:
+            os.makedirs(root, exist_ok=True)
+            self._lock_f = open(os.path.join(root, "pages.lock"), "a+b")
+            if not _try_lock_exclusive(self._lock_f):
+                self._lock_f.close()
+                raise RuntimeError(f"归档已被其它进程以写入方式打开: {root}")
+        self._data_size = os.path.getsize(self.data_path) if os.path.exists(self.data_path) else 0
+        self._load_index()
+        self._data_f = self._index_f = None
+        if not readonly:
+            self._data_f = open(self.data_path, "ab")
+            self._index_f = open(self.index_path, "ab")
+        self._read_f = open(self.data_path, "rb") if os.path.exists(self.data_path) else None
+
+    @staticmethod
+    def url_key(url: str) -> bytes:
+        return hashlib.blake2b(url.split("#", 1)[0].encode("utf-8"), digest_size=16).digest()
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, "rb") as f:
+                raw = f.read()
+        except FileNotFoundError:
+            return
+        # 末尾不完整的索引项，以及指向未落盘数据的索引项（崩溃时两个文件的缓冲不同步）都忽略；
+        # 只读端看到的可能是写入者正在追加的记录，只有持锁的写入者才截断
+        valid = len(raw) - len(raw) % self.ENTRY.size
+        for pos, (key, offset, length, kind, digest) in enumerate(self.ENTRY.iter_unpack(raw[:valid])):
+            if offset + length > self._data_size:
+                valid = pos * self.ENTRY.size
+                break
+            self._entries[key] = (offset, length, kind, digest)
+        if valid < len(raw) and not self.readonly:
+            with open(self.index_path, "r+b") as f:
+                f.truncate(valid)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, kind: str, url: str, content: str, code: str = "", status: int = 200):
+        data = content.encode("utf-8")
+        digest = hashlib.blake2b(data, digest_size=8).digest()
+        key = self.url_key(url)
+        with self._lock:
+            old = self._entries.get(key)
+            if old is not None and old[3] == digest:
+                self.stats["unchanged"] += 1
+                return
+        meta = json.dumps({"url": url, "code": code, "kind": kind, "status": status, "ts": time.time()},
+                          ensure_ascii=False).encode("utf-8")
+        record = struct.pack("<I", len(meta)) + meta + zlib.compress(data, 6)
+        with self._lock:
+            offset = self._data_size
+            self._data_f.write(record)
+            self._data_size += len(record)
+            entry = (offset, len(record), _ARCHIVE_KINDS[kind], digest)
+            self._index_f.write(self.ENTRY.pack(key, *entry))
+            self._entries[key] = entry
+            self.stats["stored"] += 1
+            self.stats["bytes_in"] += len(data)
+            self.stats["bytes_out"] += len(record)
+            self._pending += 1
+            if self._pending >= self.flush_every:
+                self._flush()
+
+    def _flush(self):
+        # 调用方持有锁；先数据后索引
+        self._data_f.flush()
+        self._index_f.flush()
+        self._pending = 0
+
+    def _view(self, end: int):
+        if self._mm is None or len(self._mm) < end:
+            with self._lock:
+                if self._data_f is not None:
+                    self._flush()
+                if self._read_f is None:
+                    self._read_f = open(self.data_path, "rb")
+                if self._mm is not None:
+                    self._mm.close()
+                self._mm = mmap.mmap(self._read_f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mm
+
+    def read_meta(self, offset: int, length: int) -> dict:
+        mm = self._view(offset + length)
+        (meta_len,) = struct.unpack_from("<I", mm, offset)
+        return json.loads(mm[offset + 4:offset + 4 + meta_len])
+
+    def read(self, offset: int, length: int):
+        """返回 (meta, html)。"""
+        mm = self._view(offset + length)
+        (meta_len,) = struct.unpack_from("<I", mm, offset)
+        meta = json.loads(mm[offset + 4:offset + 4 + meta_len])
+        html = zlib.decompress(mm[offset + 4 + meta_len:offset + length]).decode("utf-8")
+        return meta, html
+
+    def lookup(self, url: str):
+        """URL 对应的最新 (offset, length)；不存在时返回 None。"""
+        entry = self._entries.get(self.url_key(url))
+        return entry[:2] if entry else None
+
+    def get(self, url: str):
+        """返回 (meta, html)；未归档时返回 (None, "")。"""
+        entry = self.lookup(url)
+        if entry is None:
+            return None, ""
+        return self.read(*entry)
+
+    def entries(self):
+        """按写入顺序返回 [(offset, length, kind)]。"""
+        return sorted((e[0], e[1], e[2]) for e in self._entries.values())
+
+    def close(self):
+        with self._lock:
+            if self._data_f is not None and not self._data_f.closed:
+                self._flush()
+                self._data_f.close()
+                self._index_f.close()
+            if self._mm is not None:
+                self._mm.close()
+                self._mm = None
+            if self._read_f is not None:
+                self._read_f.close()
+                self._read_f = None
+            if self._lock_f is not None:
+                self._lock_f.close()
+                self._lock_f = None
+
+
+_archive = None
+_archive_lock = threading.Lock()
+
+
+def _get_archive():
+    """按 CONFIG["archive"] 懒加载归档（写入端）；未启用时返回 None。"""
+    global _archive
+    cfg = CONFIG.get("archive") or {}
+    if not cfg.get("enabled") or _in_parse_worker:
+        return None
+    with _archive_lock:
+        if _archive is None:
+            _archive = PageArchive(cfg.get("dir", ".scraper_cache/archive"),
+                                   flush_every=int(cfg.get("flush_every", 100)))
+    return _archive
+
+
+def close_archive():
+    global _archive
+    with _archive_lock:
+        archive, _archive = _archive, None
+    if archive is not None:
+        archive.close()
+        logging.info(f"Archive: {archive.stats}")
+
+
+def _archive_page(kind: str, code: str, url: str, content: str, status: int):
+    """归档一次成功取回的完整页面（status 200 且正文非空；流式读取提前断开的前缀不归档）。"""
+    if status != 200 or not content or isinstance(content, _PartialPage):
+        return
+    archive = _get_archive()
+    if archive is not None:
+        archive.add(kind, url, content, code=code or "", status=status)
+
+
+_reextract_source = None
+
+
+def _reextract_init(root: str, cfg: dict):
+    global _reextract_source
+    _parse_worker_init(cfg)
+    _reextract_source = PageArchive(root, readonly=True)
+
+
+def _reextract_chunk(items):
+    """
+    子进程中重新解析一批番号：items 为 [(code, search_entry, detail_entry)]，entry 为 (offset, length) 或 None。
+    返回 [(code, search_url, result)]。
+    """
+    arch = _reextract_source
+    rows = []
+    for code, search_entry, detail_entry in items:
+        search_url = _make_url(code)
+        if search_entry is not None:
+            meta, html = arch.read(*search_entry)
+            search_url = meta["url"]
+            detail_url, err = _parse_first_result_link(html, search_url)
+            if err:
+                rows.append((code, search_url, {"detail_url": "", "title": "", "performer": "",
+                                                "category": "", "error": err}))
+                continue
+            # 优先用搜索页当前解析出的详情页；未归档时退回该番号最近一次的详情页
+            detail_entry = arch.lookup(detail_url) or detail_entry
+        if detail_entry is None:
+            rows.append((code, search_url, {"detail_url": "", "title": "", "performer": "",
+                                            "category": "", "error": "详情页未归档"}))
+            continue
+        meta, html = arch.read(*detail_entry)
+        rows.append((code, search_url, _parse_detail_page(html, meta["url"])))
+    return rows
+
+
+def reextract_archive(root: str, workers: int = None, chunk_size: int = 200) -> int:
+    """
+    离线模式：不发任何请求，在进程池中重新解析归档里的页面，结果照常经 _emit_result 输出到各 sink。
+    每个番号取最新的搜索页（再找对应详情页）；只有详情页的番号（来自详情页索引命中）直接解析详情页。
+    返回处理的番号数。
+    """
+    archive = PageArchive(root, readonly=True)
+    by_code = {}
+    try:
+        for offset, length, kind in archive.entries():
+            code = archive.read_meta(offset, length).get("code")
+            if code:
+                slot = by_code.setdefault(code, [None, None])
+                slot[kind - 1] = (offset, length)
+    finally:
+        archive.close()
+    items = [(code, slot[0], slot[1]) for code, slot in by_code.items()]
+    chunks = [items[i:i + chunk_size] for i in range(0, len(items), max(1, chunk_size))]
+    total = len(items)
+    logging.info(f"Reextract: 归档中共 {total} 个番号，{len(chunks)} 批")
+    cfg = {"parser": CONFIG.get("parser", "bs4")}
+    counter = 0
+    with ProcessPoolExecutor(max_workers=max(1, int(workers or os.cpu_count() or 1)),
+                             mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_reextract_init, initargs=(root, cfg)) as pool:
+        for rows in pool.map(_reextract_chunk, chunks):
+            for code, search_url, result in rows:
+                counter += 1
+                _emit_result(counter, total, code, 200, search_url, 0.0, "", "", result)
+    return counter
+
+
+# ---------------- 番号 -> 详情页 URL 索引 ----------------
+
+# 详情页返回这些状态码时认为映射已失效，删除后改走搜索页
+_INDEX_STALE_STATUSES = (404, 410)
+
+
+class DetailUrlIndex:
+    """
+    持久化的 番号 -> detail_url 映射：内存中是 dict，磁盘上是只追加的 "code\tdetail_url" 行，
+    detail_url 为空的行表示删除。加载时以最后一条为准；废弃行过多时重写为紧凑文件。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._map = {}
+        self.stats = {"hit": 0, "miss": 0, "stale": 0, "stored": 0}
+        lines = self._load()
+        if lines > 1000 and lines > 2 * len(self._map):
+            self._compact()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._f = open(path, "a", encoding="utf-8")
+
+    @staticmethod
+    def _key(code: str) -> str:
+        return code.strip().upper()
+
+    def _load(self) -> int:
+        lines = 0
+        valid = 0
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if not line.endswith("\n"):
+                        break
+                    valid += len(line.encode("utf-8"))
+                    lines += 1
+                    code, _, url = line.rstrip("\n").partition("\t")
+                    if url:
+                        self._map[code] = url
+                    else:
+                        self._map.pop(code, None)
+        except FileNotFoundError:
+            return lines
+        # 截掉崩溃留下的半行，避免后续追加与其拼接成坏记录
+        if os.path.getsize(self.path) > valid:
+            with open(self.path, "r+b") as f:
+                f.truncate(valid)
+        return lines
+
+    def _compact(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for code, url in self._map.items():
+                f.write(f"{code}\t{url}\n")
+        os.replace(tmp, self.path)
+
+    def get(self, code: str):
+        with self._lock:
+            url = self._map.get(self._key(code))
+            self.stats["hit" if url else "miss"] += 1
+            return url
+
+    def put(self, code: str, detail_url: str):
+        key = self._key(code)
+        with self._lock:
+            if self._map.get(key) == detail_url:
+                return
+            self._map[key] = detail_url
+            self._f.write(f"{key}\t{detail_url}\n")
+            self._f.flush()
+            self.stats["stored"] += 1
+
+    def discard(self, code: str):
+        key = self._key(code)
+        with self._lock:
+            if self._map.pop(key, None) is not None:
+                self._f.write(f"{key}\t\n")
+                self._f.flush()
+                self.stats["stale"] += 1
+
+    def close(self):
+        with self._lock:
+            if not self._f.closed:
+                self._f.close()
+
+
+_detail_index = None
+_detail_index_lock = threading.Lock()
+
+
+def _get_detail_index():
+    """按 CONFIG["detail_index"] 懒加载索引；未启用或未开启 extract_first_result 时返回 None。"""
+    global _detail_index
+    cfg = CONFIG.get("detail_index") or {}
+    if not cfg.get("enabled") or not CONFIG.get("extract_first_result", False):
+        return None
+    with _detail_index_lock:
+        if _detail_index is None:
+            _detail_index = DetailUrlIndex(cfg.get("path", ".scraper_cache/detail_index.tsv"))
+    return _detail_index
+
+
+def close_detail_index():
+    global _detail_index
+    with _detail_index_lock:
+        index, _detail_index = _detail_index, None
+    if index is not None:
+        index.close()
+        logging.info(f"Detail index: {index.stats}")
+
+
+def _fetch_indexed_detail(code: str, timeout: float):
+    """
+    索引命中时直接请求详情页，返回 (detail_url, html, status, err, elapsed)。
+    未命中，或详情页 404/410（映射已失效，同时从索引删除）时返回 None，调用方改走搜索页。
+    """
+    index = _get_detail_index()
+    detail_url = index.get(code) if index is not None else None
+    if not detail_url:
+        return None
+    start = time.perf_counter()
+    html, status, err = fetch_detail(detail_url, timeout=timeout, code=code)
+    elapsed = time.perf_counter() - start
+    if status in _INDEX_STALE_STATUSES:
+        index.discard(code)
+        return None
+    return detail_url, html, status, err, elapsed
+
+
+def _indexed_result(code: str, timeout: float):
+    """
+    串行 / 线程池引擎用：索引命中时返回与搜索流程相同的 (content, status, url, err, elapsed, result)，
+    否则返回 None。
+    """
+    hit = _fetch_indexed_detail(code, timeout)
+    if hit is None:
+        return None
+    detail_url, html, status, err, elapsed = hit
+    result = _parse_detail_page(html, detail_url) if not err and status == 200 else None
+    return html, status, _make_url(code), err, elapsed, result
+
+
+def _gzip_rotator(source: str, dest: str):
+    with open(source, "rb") as src, gzip.open(dest, "wb", compresslevel=6) as dst:
+        shutil.copyfileobj(src, dst, 1 << 20)
+    os.remove(source)
+
+
+class _RotatingLogHandler(logging.handlers.RotatingFileHandler):
+    """按大小（max_bytes）或时间（interval 秒）轮转，旧段可 gzip 压缩为 <log>.N.gz。"""
+
+    def __init__(self, filename: str, max_bytes: int = 0, interval: float = None,
+                 backup_count: int = 10, compress: bool = True):
+        super().__init__(filename, mode="a", maxBytes=max(0, int(max_bytes or 0)),
+                         backupCount=max(1, int(backup_count)), encoding="utf-8")
+        self.interval = float(interval) if interval else None
+        self._opened_at = time.time()
+        if compress:
+            self.namer = lambda name: name + ".gz"
+            self.rotator = _gzip_rotator
+
+    def shouldRollover(self, record) -> bool:
+        if self.interval and time.time() - self._opened_at >= self.interval:
+            return True
+        return bool(super().shouldRollover(record))
+
+    def doRollover(self):
+        super().doRollover()
+        self._opened_at = time.time()
+
+
+_log_listener = None
+
+
+def setup_logging(log_file: str, also_stdout: bool = False):
+    """
+    工作线程只把日志记录放进队列，由后台 QueueListener 线程写盘，不会因磁盘 I/O 阻塞。
+    日志按 CONFIG["logging"] 轮转；启动时已有内容的旧日志先轮转为一个归档段，而不是被覆盖。
+    """
+    global _log_listener
+    stop_logging()
+    lcfg = CONFIG.get("logging") or {}
+    file_handler = _RotatingLogHandler(
+        log_file,
+        max_bytes=lcfg.get("max_bytes", 50 * 1024 * 1024),
+        interval=lcfg.get("interval"),
+        backup_count=lcfg.get("backup_count", 10),
+        compress=lcfg.get("compress", True),
+    )
+    if lcfg.get("rollover_on_start", True) and os.path.isfile(log_file) and os.path.getsize(log_file) > 0:
+        file_handler.doRollover()
+    handlers = [file_handler]
+    if also_stdout:
+        handlers.append(logging.StreamHandler(sys.stdout))
+    log_queue = queue.SimpleQueue()
+    _log_listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=False)
+    _log_listener.start()
+    # 异常退出时也把队列里的日志写完
+    atexit.unregister(stop_logging)
+    atexit.register(stop_logging)
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(message)s",
+        handlers=[logging.handlers.QueueHandler(log_queue)],
+        force=True,  # 覆盖已有配置，保证写入我们指定的文件
+    )
+
+
+def stop_logging():
+    """写完队列中剩余的日志并关闭文件。"""
+    global _log_listener
+    listener, _log_listener = _log_listener, None
+    if listener is not None:
+        listener.stop()
+        for h in listener.handlers:
+            h.close()
+
+
+def _verbosity() -> str:
+    return str((CONFIG.get("logging") or {}).get("verbosity", "normal")).lower()
+
+
+def _print_response_block(counter: int, total: int, code: str, status: int, url: str, elapsed: float, content: str, err: str):
+    timestamp = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+    header = (
+        f"\n===== BEGIN RESPONSE [{counter}/{total or '?'}] code={code} status={status} time={elapsed:.3f}s at {timestamp} UTC =====\n"
+        f"URL: {url}\n"
+    )
+    footer = f"\n===== END RESPONSE [{counter}/{total or '?'}] code={code} =====\n"
+    if err:
+        block = header + f"ERROR: {err}\n" + footer
+    elif _verbosity() == "full":
+        block = header + content + footer
+    else:
+        block = header + f"（正文 {len(content)} 字符，verbosity=full 时输出）" + footer
+    # 经 QueueHandler 入队，由后台 QueueListener 线程写盘：工作线程不阻塞在磁盘 I/O 上，多线程调用也安全
+    logging.info(block)
+
+
+def _print_extract_block(counter: int, total: int, code: str, status: int, url: str, elapsed: float, result: dict):
+    timestamp = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+    header = (
+        f"\n===== BEGIN EXTRACT [{counter}/{total or '?'}] code={code} status={status} time={elapsed:.3f}s at {timestamp} UTC =====\n"
+        f"Search URL: {url}\n"
+    )
+    detail_url = result.get("detail_url", "")
+    title = result.get("title", "")
+    performer = result.get("performer", "")
+    category = result.get("category", "")
+    cover = result.get("cover", "")
+    error = result.get("error", "")
+    body = (
+        f"Detail URL: {detail_url}\n"
+        f"Title: {title}\n"
+        f"Performer: {performer}\n"
+        f"Category: {category}\n"
+        f"Cover: {cover}\n"
+    )
+    if error:
+        body += f"ERROR: {error}\n"
+    footer = f"===== END EXTRACT [{counter}/{total or '?'}] code={code} =====\n"
+    logging.info(header + body + footer)
+
+
+# ---------------- 结构化结果输出（JSONL / SQLite / movie-metadata-cache.json） ----------------
+
+def make_record(code: str, status: int, url: str, elapsed: float, err: str, result, timings: dict = None) -> dict:
+    """
+    把一次抓取整理成一条紧凑记录（不含页面正文）。
+    timings 中 search 为搜索页（或详情索引命中时的详情页）请求耗时，其余为 RECORD_PHASES 中实际经过的阶段
+    （重试、等待限流名额的时间计入对应阶段；多数据源与离线重新解析时没有分阶段耗时）。
+    """
+    result = result or {}
+    category = result.get("category", "")
+    phases = {"search": round(elapsed, 6)}
+    for phase in RECORD_PHASES:
+        if timings and phase in timings:
+            phases[phase] = round(timings[phase], 6)
+    return {
+        "code": code,
+        "status": status,
+        "search_url": url,
+        "detail_url": result.get("detail_url", ""),
+        "title": result.get("title", ""),
+        "performer": result.get("performer", ""),
+        "category": category.split(" / ") if category else [],
+        "cover": result.get("cover", ""),
+        "timings": phases,
+        "error": err or result.get("error", ""),
+        "ts": time.time(),
+    }
+
+
+class JsonlSink:
+    """每条记录一行 JSON，追加写入。"""
+
+    def __init__(self, path: str, batch_size: int = 100):
+        self._f = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+        self._batch_size = max(1, batch_size)
+        self._pending = 0
+
+    def write(self, record: dict):
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+        with self._lock:
+            self._f.write(line)
+            self._pending += 1
+            if self._pending >= self._batch_size:
+                self._f.flush()
+                self._pending = 0
+
+    def close(self):
+        with self._lock:
+            self._f.close()
+
+
+class SqliteSink:
+    """写入 SQLite 的 results 表，每 batch_size 条提交一次。"""
+
+    def __init__(self, path: str, batch_size: int = 200):
+        import sqlite3
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "code TEXT, status INTEGER, search_url TEXT, detail_url TEXT, title TEXT, performer TEXT, "
+            "category TEXT, cover TEXT, timings TEXT, error TEXT, ts REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_results_code ON results(code)")
+        self._lock = threading.Lock()
+        self._batch_size = max(1, batch_size)
+        self._rows = []
+
+    def write(self, record: dict):
+        row = (
+            record["code"], record["status"], record["search_url"], record["detail_url"],
+            record["title"], record["performer"], json.dumps(record["category"], ensure_ascii=False),
+            record["cover"], json.dumps(record["timings"]), record["error"], record["ts"],
+        )
+        with self._lock:
+            self._rows.append(row)
+            if len(self._rows) >= self._batch_size:
+                self._flush()
+
+    def _flush(self):
+        if self._rows:
+            self._conn.executemany("INSERT INTO results VALUES (?,?,?,?,?,?,?,?,?,?,?)", self._rows)
+            self._conn.commit()
+            self._rows = []
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            self._conn.close()
+
+
+class MetadataCacheSink:
+    """
+    收集成功的记录，结束时合并进 Next.js 读取的 movie-metadata-cache.json
+    （结构见 src/lib/movieMetadataCache.ts 的 MovieMetadata；只覆盖抓取字段，保留 elo 等其它字段）。
+    写入前获取与 TS 端相同的目录锁（<cache>.lock）。
+    """
+
+    LOCK_TIMEOUT = 30.0
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._updates = {}
+
+    def write(self, record: dict):
+        if record["error"] or not (record["title"] or record["cover"]):
+            return
+        with self._lock:
+            self._updates[record["code"].upper()] = record
+
+    def _take_updates(self) -> dict:
+        with self._lock:
+            updates, self._updates = self._updates, {}
+        covers = _covers
+        if covers is not None:
+            # 封面已下载到 image-cache 时改写为本地地址，与 Next.js 端 image-proxy 的结果一致
+            for code, record in updates.items():
+                local = covers.local_url(record["cover"])
+                if local:
+                    updates[code] = dict(record, cover=local)
+        return updates
+
+    def close(self):
+        updates = self._take_updates()
+        if updates:
+            merge_into_metadata_cache(self.path, updates.values())
+
+
+def _metadata_entry(record: dict, existing) -> dict:
+    entry = dict(existing or {})
+    entry.update({
+        # 已有条目保留缓存中的写法（大小写），新条目用大写
+        "code": entry.get("code") or record["code"].upper(),
+        "coverUrl": record["cover"] or entry.get("coverUrl"),
+        "title": record["title"] or entry.get("title"),
+        "actress": record["performer"] or entry.get("actress"),
+        "lastUpdated": int(record["ts"] * 1000),
+    })
+    if record["category"]:
+        entry["kinds"] = record["category"]
+    for key, default in (("elo", 1000), ("matchCount", 0), ("winCount", 0), ("drawCount", 0),
+                         ("lossCount", 0), ("recentMatches", [])):
+        entry.setdefault(key, default)
+    return entry
+
+
+def merge_into_metadata_cache(path: str, records) -> int:
+    """
+    把记录合并进 movie-metadata-cache.json（原子替换），返回更新的条目数。
+    番号按大写匹配已有条目（缓存里的 ssni-1 与记录的 SSNI-1 是同一条），条目顺序保持不变。
+    """
+    lock_dir = path + ".lock"
+    deadline = time.time() + MetadataCacheSink.LOCK_TIMEOUT
+    while True:
+        try:
+            os.mkdir(lock_dir)
+            break
+        except FileExistsError:
+            if time.time() > deadline:
+                raise TimeoutError(f"获取缓存锁超时: {lock_dir}")
+            time.sleep(0.1)
+    try:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                items = json.load(f) or []
+        except FileNotFoundError:
+            items = []
+        positions = {str(item["code"]).upper(): i for i, item in enumerate(items) if item.get("code")}
+        n = 0
+        for record in records:
+            code = record["code"].upper()
+            i = positions.get(code)
+            if i is None:
+                positions[code] = len(items)
+                items.append(_metadata_entry(record, None))
+            else:
+                items[i] = _metadata_entry(record, items[i])
+            n += 1
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(items, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, path)
+        return n
+    finally:
+        os.rmdir(lock_dir)
+
+
+# ---------------- 增量刷新（refresh 模式）：按元数据缓存的陈旧程度排队 ----------------
+
+_PLACEHOLDER_COVER = "placeholder-image.svg"
+
+
+def _refresh_priority(entry: dict):
+    """越小越先刷新：缺封面 / 标题的在前（都缺的最前），其余按 lastUpdated 从旧到新。"""
+    cover = entry.get("coverUrl") or ""
+    missing = (not cover or _PLACEHOLDER_COVER in cover) + (not entry.get("title"))
+    return -missing, entry.get("lastUpdated") or 0
+
+
+class RefreshBudget:
+    """
+    refresh 模式的预算：max_seconds 秒、max_requests 个请求、max_codes 个番号，任一用尽即停止提交新番号
+    （在途的番号仍会完成）。请求数按 已发出 + 在途番号 × 2（搜索页 + 详情页）估算，避免超出。
+    """
+
+    def __init__(self, max_seconds=None, max_requests=None, max_codes=None):
+        self.deadline = time.monotonic() + float(max_seconds) if max_seconds else None
+        self.max_requests = int(max_requests) if max_requests else None
+        self.max_codes = int(max_codes) if max_codes else None
+        self._requests_at_start = _requests_sent
+        self.stopped_by = ""
+
+    def exhausted(self, submitted: int, in_flight: int) -> bool:
+        if self.max_codes is not None and submitted >= self.max_codes:
+            self.stopped_by = "max_codes"
+        elif self.deadline is not None and time.monotonic() >= self.deadline:
+            self.stopped_by = "max_seconds"
+        elif (self.max_requests is not None
+              and _requests_sent - self._requests_at_start + 2 * (in_flight + 1) > self.max_requests):
+            self.stopped_by = "max_requests"
+        return bool(self.stopped_by)
+
+
+class RefreshSink(MetadataCacheSink):
+    """
+    refresh 模式的写回：只合并本次刷新成功且抓取字段有变化（changed）的条目；没有变化的（unchanged）
+    默认不写回，touch_unchanged=True 时也写回以更新 lastUpdated。请求失败的条目保持原样。
+    """
+
+    def __init__(self, path: str, snapshot: dict, touch_unchanged: bool = False):
+        super().__init__(path)
+        self.snapshot = snapshot
+        self.touch_unchanged = touch_unchanged
+        self.completed = 0
+        self.stats = {"refreshed": 0, "changed": 0, "unchanged": 0, "failed": 0}
+
+    def write(self, record: dict):
+        with self._lock:
+            self.completed += 1
+        super().write(record)
+
+    def close(self):
+        updates = self._take_updates()
+        writes = []
+        for code, record in updates.items():
+            old = self.snapshot.get(code) or {}
+            new = _metadata_entry(record, old)
+            same = all(new.get(k) == old.get(k) for k in ("coverUrl", "title", "actress", "kinds"))
+            self.stats["unchanged" if same else "changed"] += 1
+            if not same or self.touch_unchanged:
+                writes.append(record)
+        self.stats["refreshed"] = len(updates)
+        self.stats["failed"] = self.completed - len(updates)
+        if writes:
+            merge_into_metadata_cache(self.path, writes)
+        logging.info(f"Refresh: {self.stats}")
+
+
+def refresh_codes(cfg: dict) -> Iterator[str]:
+    """
+    读取 CONFIG["refresh"]["cache_path"]（movie-metadata-cache.json），按 _refresh_priority 建立优先队列，
+    在预算内逐个产出待刷新的番号；同时注册 RefreshSink 负责写回。
+    最近 min_age_days 天内更新过且封面、标题齐全的条目不参与排队。
+    """
+    rcfg = cfg.get("refresh") or {}
+    path = rcfg.get("cache_path", "movie-metadata-cache.json")
+    if not cfg.get("extract_first_result", False):
+        logging.warning("refresh 模式需要 extract_first_result=True，否则没有可写回的字段")
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            items = json.load(f) or []
+    except FileNotFoundError:
+        items = []
+    snapshot = {str(item["code"]).upper(): item for item in items if item.get("code")}
+    fresh_after = (time.time() - float(rcfg.get("min_age_days", 7)) * 86400) * 1000
+    heap = []
+    for code, entry in snapshot.items():
+        priority = _refresh_priority(entry)
+        if priority[0] == 0 and priority[1] >= fresh_after:
+            continue
+        heap.append(priority + (code,))
+    heapq.heapify(heap)
+    sink = RefreshSink(path, snapshot, touch_unchanged=bool(rcfg.get("touch_unchanged", False)))
+    _get_sinks().append(sink)
+    budget = RefreshBudget(rcfg.get("max_seconds"), rcfg.get("max_requests"), rcfg.get("max_codes"))
+    missing = sum(1 for p in heap if p[0] < 0)
+    logging.info(f"Refresh: 缓存 {len(snapshot)} 条，待刷新 {len(heap)} 条（缺封面/标题 {missing} 条），"
+                 f"预算 max_seconds={rcfg.get('max_seconds')} max_requests={rcfg.get('max_requests')} "
+                 f"max_codes={rcfg.get('max_codes')}")
+    submitted = 0
+    while heap:
+        if budget.exhausted(submitted, submitted - sink.completed):
+            logging.info(f"Refresh: 预算用尽（{budget.stopped_by}），已提交 {submitted} 条，剩余 {len(heap)} 条留待下次")
+            return
+        submitted += 1
+        yield heapq.heappop(heap)[-1]
+
+
+# ---------------- 封面下载（内容寻址存储） ----------------
+
+_IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".gif", ".webp")
+
+
+def _image_ext(url: str) -> str:
+    ext = os.path.splitext(urlsplit(url).path)[1].lower()
+    return ext if ext in _IMAGE_EXTS else ".jpg"
+
+
+def image_proxy_filename(url: str) -> str:
+    """与 src/app/api/image-proxy 的 getCacheFileName 一致：base64(url)（/ -> _，+ -> -，去掉 =）+ 扩展名。"""
+    b64 = base64.b64encode(url.encode("utf-8")).decode("ascii")
+    return b64.replace("/", "_").replace("+", "-").replace("=", "") + _image_ext(url)
+
+
+class CoverDownloader:
+    """
+    并发下载封面并按内容寻址存储：
+    - objects/<sha256 前两位>/<sha256><ext>，临时文件写完后 os.replace，内容相同的封面只存一份
+    - index.tsv 记录 "url\tsha256\text"，已下载的 URL 直接跳过
+    - 未完成的下载保留在 partial/ 下，下次（或本次重试）用 Range 续传
+    - image_cache_dir 非空时，在该目录按 image-proxy 的文件名放一份硬链接（失败时复制），
+      Next.js 端 /api/image-serve/<filename> 可直接命中
+    - thumbnail 启用时（需要 Pillow）另存 thumbs/<sha256>_<max_size>.jpg；已存储但缺缩略图的封面在跳过时补生成
+    """
+
+    def __init__(self, root: str, workers: int = 8, timeout: float = 30.0, max_attempts: int = 3,
+                 image_cache_dir: str = None, thumbnail: dict = None):
+        self.root = root
+        self.timeout = float(timeout)
+        self.max_attempts = max(1, int(max_attempts))
+        self.image_cache_dir = image_cache_dir
+        self.thumbnail = thumbnail if thumbnail and thumbnail.get("enabled") else None
+        if self.thumbnail is not None:
+            from PIL import Image  # noqa: F401  缺少 Pillow 时尽早报错
+        for sub in ("objects", "partial", "thumbs"):
+            os.makedirs(os.path.join(root, sub), exist_ok=True)
+        if image_cache_dir:
+            os.makedirs(image_cache_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._pending = {}    # url -> Future
+        self._index = {}      # url -> (sha256, ext)
+        self.stats = {"downloaded": 0, "skipped": 0, "resumed": 0, "dedup": 0, "failed": 0, "bytes": 0}
+        self._index_path = os.path.join(root, "index.tsv")
+        self._load_index()
+        self._index_f = open(self._index_path, "a", encoding="utf-8")
+        self._pool = ThreadPoolExecutor(max_workers=max(1, int(workers)), thread_name_prefix="cover")
+
+    def _load_index(self):
+        try:
+            with open(self._index_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    parts = line.rstrip("\n").split("\t")
+                    if line.endswith("\n") and len(parts) == 3:
+                        self._index[parts[0]] = (parts[1], parts[2])
+        except FileNotFoundError:
+            pass
+
+    def _session(self) -> "requests.Session":
+        # 每个下载线程一个 Session，keep-alive 连接在同一线程的多次下载间复用
+        sess = getattr(self._local, "session", None)
+        if sess is None:
+            sess = requests.Session()
+            sess.headers.update(DEFAULT_HEADERS)
+            sess.headers["Accept"] = "image/avif,image/webp,image/apng,image/*,*/*;q=0.8"
+            self._local.session = sess
+        return sess
+
+    def object_path(self, sha: str, ext: str) -> str:
+        return os.path.join(self.root, "objects", sha[:2], sha + ext)
+
+    def _stored(self, url: str):
+        entry = self._index.get(url)
+        if entry and os.path.exists(self.object_path(*entry)):
+            return entry
+        return None
+
+    def submit(self, url: str):
+        """排队下载 url；已存在或已在下载中时不重复提交。"""
+        with self._lock:
+            if url in self._pending:
+                return self._pending[url]
+            if self._stored(url):
+                self.stats["skipped"] += 1
+                sha, ext = self._index[url]
+                self._link_for_ui(url, sha, ext)
+                if self.thumbnail is not None and not os.path.exists(self._thumb_path(sha)):
+                    # 下载时还没开启缩略图（或生成失败）：在下载线程里补生成，join() 同样会等待
+                    fut = self._pending[url] = self._pool.submit(self._backfill_thumbnail, url, sha, ext)
+                    return fut
+                return None
+            fut = self._pending[url] = self._pool.submit(self._download, url)
+            return fut
+
+    def local_url(self, url: str):
+        """已下载且放入 image-cache 时返回 /api/image-serve/<filename>，否则 None。"""
+        if not self.image_cache_dir or not url:
+            return None
+        with self._lock:
+            stored = self._stored(url)
+        if stored is None:
+            return None
+        name = image_proxy_filename(url)
+        if not os.path.exists(os.path.join(self.image_cache_dir, name)):
+            return None
+        return f"/api/image-serve/{name}"
+
+    def _download(self, url: str):
+        try:
+            return self._download_and_store(url)
+        except Exception as e:
+            # 写盘 / 建目录 / 放置硬链接 / 缩略图出错：计为失败，不让异常留在 Future 里无人查看
+            with self._lock:
+                self.stats["failed"] += 1
+            logging.warning(f"封面保存失败: {url} ({e})")
+            return None
+        finally:
+            # 无论成败都要移出 _pending，否则 join() 会一直等待这个已结束的 Future
+            with self._lock:
+                self._pending.pop(url, None)
+
+    def _download_and_store(self, url: str):
+        ext = _image_ext(url)
+        part = os.path.join(self.root, "partial", hashlib.sha1(url.encode("utf-8")).hexdigest() + ".part")
+        err = ""
+        with _span("cover_download"):
+            for attempt in range(1, self.max_attempts + 1):
+                err = self._fetch_into(url, part)
+                if not err or err.startswith("HTTP 4"):
+                    break
+                time.sleep(min(5.0, 0.5 * 2 ** (attempt - 1)))
+        if err:
+            with self._lock:
+                self.stats["failed"] += 1
+            logging.warning(f"封面下载失败: {url} ({err})")
+            return None
+
+        sha = hashlib.sha256()
+        with open(part, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 16), b""):
+                sha.update(chunk)
+        sha = sha.hexdigest()
+        obj = self.object_path(sha, ext)
+        os.makedirs(os.path.dirname(obj), exist_ok=True)
+        if os.path.exists(obj):
+            os.remove(part)
+            dedup = True
+        else:
+            os.replace(part, obj)
+            dedup = False
+        with self._lock:
+            self._index[url] = (sha, ext)
+            self._index_f.write(f"{url}\t{sha}\t{ext}\n")
+            self._index_f.flush()
+            self.stats["dedup" if dedup else "downloaded"] += 1
+        self._link_for_ui(url, sha, ext)
+        if self.thumbnail is not None:
+            self._make_thumbnail(obj, sha)
+        return obj
+
+    def _fetch_into(self, url: str, part: str) -> str:
+        """把 url 下载（或续传）到 part，返回错误描述，成功时返回空串。"""
+        offset = os.path.getsize(part) if os.path.exists(part) else 0
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        try:
+            with self._session().get(url, headers=headers, timeout=self.timeout, stream=True) as resp:
+                _count_response(resp.status_code)
+                if resp.status_code == 416 and offset:
+                    # 上次其实已经下完
+                    return ""
+                if resp.status_code == 206 and offset and \
+                        resp.headers.get("Content-Range", "").startswith(f"bytes {offset}-"):
+                    mode = "ab"
+                    with self._lock:
+                        self.stats["resumed"] += 1
+                elif resp.status_code == 200:
+                    mode = "wb"
+                elif resp.status_code == 206 and offset:
+                    # 返回的区间与请求的偏移不符：续传不可信，丢弃 partial 文件，改用不带 Range 的 GET 从头下载
+                    resp.close()
+                    os.remove(part)
+                    return self._fetch_into(url, part)
+                else:
+                    return f"HTTP {resp.status_code}"
+                if resp.headers.get("Content-Type", "").startswith("text/"):
+                    return f"HTTP {resp.status_code} 非图片响应"
+                n = 0
+                with open(part, mode) as f:
+                    # 小块写入：连接中断时已收到的大部分内容都能留在 partial 文件里
+                    for chunk in resp.iter_content(16384):
+                        f.write(chunk)
+                        n += len(chunk)
+                    f.flush()
+                    os.fsync(f.fileno())
+                with self._lock:
+                    self.stats["bytes"] += n
+                return ""
+        except (requests.RequestException, OSError) as e:
+            return str(e)
+
+    def _place(self, src: str, dst: str):
+        """把 src 原子地放到 dst：优先硬链接，跨设备等情况下复制。"""
+        if os.path.exists(dst):
+            return
+        tmp = f"{dst}.{threading.get_ident()}.tmp"
+        try:
+            try:
+                os.link(src, tmp)
+            except OSError:
+                shutil.copyfile(src, tmp)
+            os.replace(tmp, dst)
+        except OSError as e:
+            logging.warning(f"放置封面失败: {dst} ({e})")
+
+    def _link_for_ui(self, url: str, sha: str, ext: str):
+        if self.image_cache_dir:
+            self._place(self.object_path(sha, ext), os.path.join(self.image_cache_dir, image_proxy_filename(url)))
+
+    def _thumb_path(self, sha: str) -> str:
+        return os.path.join(self.root, "thumbs", f"{sha}_{int(self.thumbnail.get('max_size', 360))}.jpg")
+
+    def _backfill_thumbnail(self, url: str, sha: str, ext: str):
+        try:
+            self._make_thumbnail(self.object_path(sha, ext), sha)
+        except Exception as e:
+            logging.warning(f"生成缩略图失败: {url} ({e})")
+        finally:
+            with self._lock:
+                self._pending.pop(url, None)
+
+    def _make_thumbnail(self, obj: str, sha: str):
+        from PIL import Image
+
+        out = self._thumb_path(sha)
+        if not os.path.exists(out):
+            tmp = f"{out}.{threading.get_ident()}.tmp"
+            try:
+                size = int(self.thumbnail.get("max_size", 360))
+                with Image.open(obj) as im:
+                    im = im.convert("RGB")
+                    im.thumbnail((size, size))
+                    im.save(tmp, "JPEG", quality=int(self.thumbnail.get("quality", 85)))
+                os.replace(tmp, out)
+            except OSError as e:
+                logging.warning(f"生成缩略图失败: {obj} ({e})")
+                return
+        if self.image_cache_dir:
+            self._place(out, os.path.join(self.image_cache_dir, os.path.basename(out)))
+
+    def join(self):
+        """等待已提交的下载全部结束。"""
+        while True:
+            with self._lock:
+                futures = list(self._pending.values())
+            if not futures:
+                return
+            wait(futures)
+
+    def close(self):
+        self.join()
+        self._pool.shutdown(wait=True)
+        with self._lock:
+            self._index_f.close()
+
+
+_covers = None
+_covers_lock = threading.Lock()
+
+
+def _get_cover_downloader():
+    """按 CONFIG["covers"] 懒加载封面下载器；未启用时返回 None。"""
+    global _covers
+    cfg = CONFIG.get("covers") or {}
+    if not cfg.get("enabled"):
+        return None
+    with _covers_lock:
+        if _covers is None:
+            _covers = CoverDownloader(
+                cfg.get("dir", ".scraper_cache/covers"),
+                workers=int(cfg.get("workers", 8)),
+                timeout=float(cfg.get("timeout", 30.0)),
+                max_attempts=int(cfg.get("max_attempts", 3)),
+                image_cache_dir=cfg.get("image_cache_dir"),
+                thumbnail=cfg.get("thumbnail"),
+            )
+    return _covers
+
+
+def close_covers():
+    global _covers
+    with _covers_lock:
+        covers, _covers = _covers, None
+    if covers is not None:
+        covers.close()
+        logging.info(f"Covers: {covers.stats}")
+
+
+_sinks = None
+_sinks_lock = threading.Lock()
+
+
+def _get_sinks() -> list:
+    """按 CONFIG["sinks"] 懒加载结果输出目标。"""
+    global _sinks
+    with _sinks_lock:
+        if _sinks is None:
+            _sinks = []
+            for spec in CONFIG.get("sinks") or []:
+                kind = spec.get("type")
+                batch = int(spec.get("batch_size", 200))
+                if kind == "jsonl":
+                    _sinks.append(JsonlSink(spec["path"], batch))
+                elif kind == "sqlite":
+                    _sinks.append(SqliteSink(spec["path"], batch))
+                elif kind == "metadata_cache":
+                    _sinks.append(MetadataCacheSink(spec["path"]))
+                else:
+                    logging.warning(f"未知的 sink 类型: {kind}")
+    return _sinks
+
+
+def close_sinks():
+    global _sinks
+    with _sinks_lock:
+        sinks, _sinks = _sinks or [], None
+    # 先等封面下载结束，MetadataCacheSink 才能写入本地封面地址
+    covers = _covers
+    if covers is not None:
+        covers.join()
+    for sink in sinks:
+        sink.close()
+
+
+def _emit_result(counter: int, total: int, code: str, status: int, url: str, elapsed: float,
+                 content: str, err: str, result, timings: dict = None):
+    """
+    所有引擎共用的结果出口：写日志块（CONFIG["logging"]["verbosity"]）并送入各个 sink。
+    result 为 None 表示未解析详情页（请求失败或未开启 extract_first_result）。
+    timings 为该番号的分阶段耗时（见 _Timings），写入记录的 timings 字段。
+    """
+    if _verbosity() != "quiet":
+        if result is not None:
+            _print_extract_block(counter, total, code, status, url, elapsed, result)
+        else:
+            _print_response_block(counter, total, code, status, url, elapsed, content, err)
+    if _journal is not None:
+        _journal.record(code, _is_final(status, err, result))
+    if result is not None and result.get("cover") and not result.get("error"):
+        covers = _get_cover_downloader()
+        if covers is not None:
+            covers.submit(result["cover"])
+    if result is not None and not result.get("error"):
+        # 多数据源的合并结果中 detail_url 可能来自其他站点，索引只记录 DMM 的详情页
+        detail_url = (result["detail_urls"].get("dmm", "") if "detail_urls" in result
+                      else result.get("detail_url"))
+        index = _get_detail_index() if detail_url else None
+        if index is not None:
+            index.put(code, detail_url)
+    sinks = _get_sinks()
+    if sinks:
+        record = make_record(code, status, url, elapsed, err, result, timings)
+        for sink in sinks:
+            sink.write(record)
+
+
+# ---------------- 断点续跑日志（checkpoint journal） ----------------
+
+class CheckpointJournal:
+    """
+    只追加的完成记录：每行 "<done|failed>\t<code>"。
+    写入先进缓冲区，每 fsync_every 条或 fsync_interval 秒 flush + fsync 一次；
+    崩溃时最多丢失最后一批记录（这些番号下次会被重新抓取）。
+    加载时以每个番号的最后一条记录为准，末尾不完整的行会被忽略。
+    """
+
+    def __init__(self, path: str, fsync_every: int = 200, fsync_interval: float = 2.0):
+        self.path = path
+        self.fsync_every = max(1, int(fsync_every))
+        self.fsync_interval = float(fsync_interval)
+        self.done = set()
+        self.failed = set()
+        self._load()
+        self._f = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                valid = 0
+                for line in f:
+                    if not line.endswith("\n"):
+                        break
+                    valid += len(line.encode("utf-8"))
+                    state, _, code = line.rstrip("\n").partition("\t")
+                    if not code:
+                        continue
+                    if state == "done":
+                        self.done.add(code)
+                        self.failed.discard(code)
+                    elif state == "failed" and code not in self.done:
+                        self.failed.add(code)
+        except FileNotFoundError:
+            return
+        # 截掉崩溃留下的半行，避免后续追加与其拼接成坏记录
+        if os.path.getsize(self.path) > valid:
+            with open(self.path, "r+b") as f:
+                f.truncate(valid)
+
+    def record(self, code: str, ok: bool):
+        with self._lock:
+            if ok:
+                self.done.add(code)
+                self.failed.discard(code)
+            elif code not in self.done:
+                self.failed.add(code)
+            self._f.write(f"{'done' if ok else 'failed'}\t{code}\n")
+            self._pending += 1
+            if self._pending >= self.fsync_every or time.monotonic() - self._last_sync >= self.fsync_interval:
+                self._sync()
+
+    def _sync(self):
+        # 调用方持有锁
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def close(self):
+        with self._lock:
+            if not self._f.closed:
+                self._sync()
+                self._f.close()
+
+
+_journal = None
+
+
+def open_journal(cfg: dict):
+    """按 CONFIG["checkpoint"] 打开断点日志；未启用时返回 None。"""
+    global _journal
+    ccfg = cfg.get("checkpoint") or {}
+    if not ccfg.get("enabled"):
+        return None
+    _journal = CheckpointJournal(ccfg.get("path", "scraper.journal"),
+                                 fsync_every=ccfg.get("fsync_every", 200),
+                                 fsync_interval=ccfg.get("fsync_interval", 2.0))
+    return _journal
+
+
+def close_journal():
+    global _journal
+    if _journal is not None:
+        _journal.close()
+        _journal = None
+
+
+def _is_final(status: int, err: str, result) -> bool:
+    """
+    该番号是否已有确定结果（无需再抓）：请求成功且解析成功，或搜索页明确没有结果。
+    """
+    if err or status != 200:
+        return False
+    if result is None:
+        return True
+    error = result.get("error", "")
+    return not error or error == "未找到第一个结果链接"
+
+
+class BloomFilter:
+    """
+    定长位数组的布隆过滤器：capacity 个元素时误判率约为 error_rate，内存约
+    capacity * 1.44 * log2(1/error_rate) 位（一千万个番号、万分之一误判约 23 MB）。
+    误判意味着极少数番号被当成重复而跳过。
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 1e-4):
+        capacity = max(1, int(capacity))
+        error_rate = min(0.5, max(1e-12, float(error_rate)))
+        self.nbits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.k = max(1, int(round(self.nbits / capacity * math.log(2))))
+        self.bits = bytearray((self.nbits + 7) // 8)
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.k):
+            yield (h1 + i * h2) % self.nbits
+
+    def add(self, item: str) -> bool:
+        """加入 item；返回 True 表示此前（很可能）不存在。"""
+        new = False
+        for pos in self._positions(item):
+            byte, bit = divmod(pos, 8)
+            if not self.bits[byte] & (1 << bit):
+                self.bits[byte] |= 1 << bit
+                new = True
+        return new
+
+
+class _ExactDeduper:
+    """
+    精确去重：每个番号只存 8 字节摘要，约 8 字节/番号（set 里的 Python int 约 70 字节/番号，并不比字符串省）。
+    摘要按高 SHARD_BITS 位分到多个有序 array('Q')，二分查找、原地插入；分片让每次插入只移动一小段内存。
+    内存仍随不同番号的数量线性增长，需要固定内存时用 "bloom"。
+    """
+
+    SHARD_BITS = 12
+
+    def __init__(self):
+        self._shards = [array("Q") for _ in range(1 << self.SHARD_BITS)]
+
+    def add(self, item: str) -> bool:
+        key = int.from_bytes(hashlib.blake2b(item.encode("utf-8"), digest_size=8).digest(), "little")
+        shard = self._shards[key >> (64 - self.SHARD_BITS)]
+        i = bisect.bisect_left(shard, key)
+        if i < len(shard) and shard[i] == key:
+            return False
+        shard.insert(i, key)
+        return True
+
+
+def _make_deduper(scfg: dict):
+    if str(scfg.get("dedupe", "exact")).lower() == "bloom":
+        return BloomFilter(scfg.get("bloom_capacity", 10_000_000), scfg.get("bloom_error_rate", 1e-4))
+    return _ExactDeduper()
+
+
+def _iter_raw_codes(cfg) -> Iterator[str]:
+    # 1) 直接从配置中的列表读取
+    if isinstance(cfg.get("codes"), list):
+        for c in cfg.get("codes"):
+            s = str(c).strip()
+            if s:
+                yield s
+    # 2) 可选：从文件逐行读取
+    codes_file = cfg.get("codes_file")
+    if codes_file:
+        try:
+            with open(codes_file, "r", encoding="utf-8") as f:
+                for line in f:
+                    s = line.strip()
+                    if s:
+                        yield s
+        except OSError as e:
+            print(f"读取 codes 文件失败: {e}", file=sys.stderr)
+
+
+def iter_codes_from_config(cfg) -> Iterator[str]:
+    """
+    流式读取番号：按需逐行读取 codes_file，用 CONFIG["streaming"]["dedupe"] 指定的紧凑结构去重，
+    保持首次出现的顺序。
+    """
+    deduper = _make_deduper(cfg.get("streaming") or {})
+    dropped = 0
+    for c in _iter_raw_codes(cfg):
+        if deduper.add(c):
+            yield c
+        else:
+            dropped += 1
+    if dropped and isinstance(deduper, BloomFilter):
+        # 布隆过滤器无法区分真实重复与误判，只能给出总数供核对
+        logging.info(f"Streaming dedupe: 布隆过滤器跳过 {dropped} 个番号（真实重复 + 误判）")
+
+
+def load_codes_from_config(cfg) -> List[str]:
+    # 去重并保持顺序
+    seen = set()
+    deduped = []
+    for c in _iter_raw_codes(cfg):
+        if c not in seen:
+            seen.add(c)
+            deduped.append(c)
+    if not deduped:
+        deduped = ["ABF-243"]
+    return deduped
+
+
+def _prepare_codes(cfg: dict, codes=None):
+    """
+    返回待抓取的番号：codes 为 None 时按 CONFIG 读取（流式模式下为生成器，否则为列表），
+    开启断点日志时跳过已完成的番号。
+    """
+    streaming = bool((cfg.get("streaming") or {}).get("enabled"))
+    journal = open_journal(cfg)
+    if codes is None and str(cfg.get("mode", "crawl")).lower() == "refresh":
+        codes = refresh_codes(cfg)
+    elif codes is None:
+        codes = iter_codes_from_config(cfg) if streaming else load_codes_from_config(cfg)
+    if journal is None:
+        return codes
+    done = journal.done
+    if not isinstance(codes, list):
+        logging.info(f"Checkpoint: 流式模式，边读边跳过已完成的 {len(done)} 个番号")
+        return (c for c in codes if c not in done)
+    before = len(codes)
+    codes = [c for c in codes if c not in done]
+    logging.info(f"Checkpoint: 跳过已完成 {before - len(codes)} 个，待抓取 {len(codes)} 个"
+                 f"（其中上次失败 {sum(1 for c in codes if c in journal.failed)} 个）")
+    return codes
+
+
+def _run_engine(cfg: dict, codes):
+    """按 CONFIG["mode"] / ["engine"] 选择引擎跑完 codes。"""
+    streaming = bool((cfg.get("streaming") or {}).get("enabled"))
+    window = (cfg.get("streaming") or {}).get("window") if streaming else None
+    mode = str(cfg.get("mode", "crawl")).lower()
+    # refresh 模式每个番号只查一次
+    repeat = 1 if mode == "refresh" else int(cfg.get("repeat", 1))
+    interval = float(cfg.get("interval", 0.0))
+    workers = int(cfg.get("workers", 1))
+    timeout = float(cfg.get("timeout", 15.0))
+    engine = str(cfg.get("engine", "thread")).lower()
+
+    if mode == "daemon" or (mode != "reextract" and engine != "async"):
+        # async 引擎在 aiohttp 的 connector 上单独预热
+        prewarm_http_client()
+    if mode == "reextract":
+        acfg = cfg.get("archive") or {}
+        reextract_archive(acfg.get("dir", ".scraper_cache/archive"), workers=acfg.get("reextract_workers"))
+    elif mode == "daemon":
+        serve_daemon(cfg)
+    elif engine == "async":
+        run_async(codes, repeat=max(1, repeat),
+                  concurrency=int(cfg.get("async_concurrency", 100)), timeout=timeout, window=window)
+    elif engine == "pipeline":
+        run_pipeline(codes, repeat=max(1, repeat), timeout=timeout,
+                     stage_workers=cfg.get("pipeline_workers") or {},
+                     queue_size=int(cfg.get("pipeline_queue_size", 100)))
+    elif workers > 1:
+        run_parallel(codes, repeat=max(1, repeat),
+                     workers=workers, timeout=timeout, window=window)
+    else:
+        run_sequential(codes, repeat=max(1, repeat),
+                       interval=max(0.0, interval), timeout=timeout)
+
+
+def _shutdown_runtime(reporter):
+    """
+    关闭一次运行打开的 sink / 断点日志 / 各类缓存与线程池并输出统计，
+    然后清空懒加载的全局对象，下一次运行（scrape() 的另一组 options）会按新的 CONFIG 重建。
+    """
+    global _metrics, _limiter, _retry_policy, _circuit_breaker, _http_cache, _single_flight
+    try:
+        # 被中断时也要落盘断点日志与 sink
+        close_sinks()
+        close_covers()
+        close_journal()
+        close_detail_index()
+        close_parse_pool()
+        close_parse_memo()
+        close_hedger()
+        close_archive()
+        close_sources()
+        close_http_client()
+    finally:
+        if reporter is not None:
+            reporter.stop()
+            logging.info(f"Metrics: {json.dumps(_metrics.summary(), ensure_ascii=False)}")
+        # 只汇报本次运行真正创建过的单例；调用 _get_X() 会为没用到的功能新建对象（HttpCache 还会建目录）
+        if _http_cache is not None:
+            logging.info(f"HTTP cache: {_http_cache.stats}")
+        if _single_flight is not None:
+            logging.info(f"Single-flight: {_single_flight.stats}")
+        if _retry_policy is not None:
+            logging.info(f"Retry: {_retry_stats}")
+        if _circuit_breaker is not None:
+            logging.info(f"Circuit breaker: {_circuit_breaker.stats}")
+        if _limiter is not None:
+            logging.info(f"Adaptive: final limit={int(_limiter.limit)} rate={_limiter.rate:.2f}/s "
+                         f"decisions={len(_limiter.decisions)}")
+        _metrics = _limiter = _retry_policy = _circuit_breaker = _http_cache = _single_flight = None
+        _retry_stats["retries"] = 0
+
+
+# ---------------- 库接口：scrape() / ascrape() ----------------
+
+_SCRAPE_DONE = object()
+_api_lock = threading.Lock()
+
+
+class _QueueSink:
+    """把结果记录送入 scrape() 的队列；调用方提前结束迭代后丢弃其余记录。"""
+
+    def __init__(self, q: queue.Queue, stop: threading.Event):
+        self.q = q
+        self.stop = stop
+
+    def write(self, record: dict):
+        if not self.stop.is_set():
+            self.q.put(record)
+
+    def close(self):
+        pass
+
+
+def _merge_options(options: dict) -> dict:
+    """options 覆盖 CONFIG 的同名键；两边都是 dict 时只覆盖给出的子键。"""
+    merged = dict(CONFIG)
+    for key, value in options.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            value = {**merged[key], **value}
+        merged[key] = value
+    return merged
+
+
+def _feed_until(stop: threading.Event, codes: Iterable[str]) -> Iterator[str]:
+    for code in codes:
+        if stop.is_set():
+            return
+        yield code
+
+
+def scrape(codes: Iterable[str] = None, **options) -> Iterator[dict]:
+    """
+    以生成器方式抓取：每完成一个番号 yield 一条结果记录（字段同 make_record / jsonl sink），
+    顺序为完成顺序。codes 可以是任意可迭代对象（边迭代边提交），为 None 时按 CONFIG 读取番号。
+    options 覆盖 CONFIG 的同名键（例如 engine="async", workers=32, retry={"enabled": True}），
+    未给出时 repeat 默认为 1、日志块默认关闭（verbosity="quiet"）。
+    抓取在后台线程中进行；提前结束迭代（break / close()）会停止提交新番号并等待在途请求完成。
+    同一进程内同时只能有一个 scrape() 在运行。
+    """
+    if not _api_lock.acquire(blocking=False):
+        raise RuntimeError("scrape() 正在运行：同一进程内同时只能有一个抓取任务")
+    saved = dict(CONFIG)
+    try:
+        options.setdefault("repeat", 1)
+        options.setdefault("logging", {"verbosity": "quiet"})
+        merged = _merge_options(options)
+        CONFIG.clear()
+        CONFIG.update(merged)
+        stop = threading.Event()
+        q = queue.Queue(maxsize=1024)
+        failure = []
+
+        def run():
+            reporter = None
+            try:
+                reporter = start_metrics(CONFIG)
+                _get_sinks().append(_QueueSink(q, stop))
+                todo = _prepare_codes(CONFIG, None if codes is None else _feed_until(stop, codes))
+                _run_engine(CONFIG, todo)
+            except BaseException as e:
+                failure.append(e)
+            finally:
+                try:
+                    _shutdown_runtime(reporter)
+                finally:
+                    q.put(_SCRAPE_DONE)
+
+        worker = threading.Thread(target=run, name="scrape", daemon=True)
+        worker.start()
+        try:
+            while True:
+                record = q.get()
+                if record is _SCRAPE_DONE:
+                    break
+                yield record
+        finally:
+            stop.set()
+            # 排空队列，放行阻塞在 put 上的结果出口
+            while worker.is_alive():
+                try:
+                    q.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            worker.join()
+        if failure:
+            raise failure[0]
+    finally:
+        CONFIG.clear()
+        CONFIG.update(saved)
+        _api_lock.release()
+
+
+async def ascrape(codes: Iterable[str] = None, **options):
+    """
+    scrape() 的异步迭代器版本：async for record in ascrape(codes, ...)。
+    抓取在线程池中进行，不阻塞调用方的事件循环；调用方消费慢时后台同样会被背压。
+    """
+    loop = asyncio.get_running_loop()
+    q = asyncio.Queue(maxsize=256)
+    closed = threading.Event()
+
+    def pump():
+        gen = scrape(codes, **options)
+        try:
+            for record in gen:
+                if closed.is_set():
+                    break
+                asyncio.run_coroutine_threadsafe(q.put(record), loop).result()
+        finally:
+            gen.close()
+            # 等结束标记真正入队再退出：队列满时由消费方（或下面 finally 的排空）放行
+            asyncio.run_coroutine_threadsafe(q.put(_SCRAPE_DONE), loop).result()
+
+    fut = loop.run_in_executor(None, pump)
+    try:
+        while True:
+            record = await q.get()
+            if record is _SCRAPE_DONE:
+                break
+            yield record
+        await fut
+    finally:
+        closed.set()
+        while not fut.done():
+            try:
+                q.get_nowait()
+            except asyncio.QueueEmpty:
+                await asyncio.sleep(0.05)
+
+
+# ---------------- 多数据源：DMM / JavBus 并发查询 ----------------
+
+# JavBus 详情页中不作为类别输出的标签（与 route.ts 的 fetchCoverUrlFromJavbus 一致）
+_JAVBUS_BLOCKED_GENRES = frozenset((
+    "高畫質", "DMM獨家", "單體作品", "數位馬賽克", "多選提交", "4K",
+    "フルハイビジョン(FHD)", "MGSだけのおまけ映像付き", "アクメ・オーガズム",
+))
+_SOURCE_FIELDS = ("detail_url", "title", "performer", "category", "cover")
+
+
+def _empty_result(detail_url: str = "", error: str = "") -> dict:
+    return {"detail_url": detail_url, "title": "", "performer": "", "category": "", "cover": "", "error": error}
+
+
+def _javbus_first_link(html: str):
+    from bs4 import BeautifulSoup
+    a = BeautifulSoup(html, "html.parser").select_one("#waterfall > div > a")
+    return a.get("href") if a else None
+
+
+def _javbus_detail(html: str, detail_url: str) -> dict:
+    """解析 JavBus 详情页，返回与 _extract_detail_fields 相同结构的字典。"""
+    from bs4 import BeautifulSoup
+    with _span("detail_parse"):
+        soup = BeautifulSoup(html, "html.parser")
+        img = soup.select_one("div.row.movie > div.col-md-9.screencap > a > img")
+        title_el = soup.select_one("div.container > h3")
+        performers = [a.get_text(strip=True) for a in
+                      soup.select("div.row.movie > div.col-md-3.info > p:last-child > span > a")]
+        genres = []
+        for header in soup.select("div.row.movie > div.col-md-3.info > p.header"):
+            p = header.find_next_sibling("p")
+            if p is None:
+                continue
+            for tag in p.get_text(" ").split():
+                # 片假名标签多为未翻译的日文原名，与屏蔽列表一起跳过
+                if tag not in _JAVBUS_BLOCKED_GENRES and not any("\u30a0" <= ch <= "\u30ff" for ch in tag):
+                    genres.append(tag)
+    result = _empty_result(detail_url)
+    result.update(
+        title=title_el.get_text(strip=True) if title_el else "",
+        performer=" ".join(p for p in performers if p),
+        category=" / ".join(dict.fromkeys(genres)),
+        cover=urljoin(detail_url, img["src"]) if img is not None and img.get("src") else "",
+    )
+    return result
+
+
+class SourceProvider(ABC):
+    """
+    元数据来源。fetch / fetch_async 返回 (content, status, url, err, result)：
+    content / status / url 为该来源入口页面的响应，result 结构同 _extract_detail_fields（请求失败时为 None）。
+    cancel 被置位表示已有其他来源给出完整结果，应尽快放弃后续请求。
+    子类必须实现两个方法，缺一个时在创建实例时就报错。
+    """
+
+    name = ""
+
+    @abstractmethod
+    def fetch(self, code: str, timeout: float, cancel: threading.Event):
+        ...
+
+    @abstractmethod
+    async def fetch_async(self, session, sem, code: str, timeout: float):
+        ...
+
+
+class DmmProvider(SourceProvider):
+    """原有的 DMM 搜索页 -> 详情页流程（含详情索引、缓存、重试等）。"""
+
+    name = "dmm"
+
+    def fetch(self, code: str, timeout: float, cancel: threading.Event):
+        hit = _indexed_result(code, timeout)
+        if hit is not None:
+            content, status, url, err, _, result = hit
+            return content, status, url, err, result
+        content, status, url, err = fetch_once(code, 0, timeout=timeout)
+        if err or status != 200 or cancel.is_set():
+            return content, status, url, err, None
+        return content, status, url, err, _extract_detail_fields(content, url)
+
+    async def fetch_async(self, session, sem, code: str, timeout: float):
+        _, content, status, url, err, _, result = await _async_fetch_and_extract(
+            session, sem, code, 0, timeout, single_source=True)
+        return content, status, url, err, result
+
+
+class JavBusProvider(SourceProvider):
+    """JavBus：/search/<番号> 的第一个结果 -> 详情页。"""
+
+    name = "javbus"
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip("/")
+
+    def search_url(self, code: str) -> str:
+        return f"{self.base_url}/search/{code}"
+
+    def fetch(self, code: str, timeout: float, cancel: threading.Event):
+        url = self.search_url(code)
+        try:
+            content, status, _ = _shared_get(url, timeout)
+        except requests.RequestException as e:
+            return "", 0, url, str(e), None
+        if status != 200 or cancel.is_set():
+            return content, status, url, "", None
+        href = _javbus_first_link(content)
+        if not href:
+            return content, status, url, "", _empty_result(error="未找到第一个结果链接")
+        detail_url = urljoin(url, href.strip())
+        try:
+            html, dstatus, _ = _shared_get(detail_url, timeout)
+        except requests.RequestException as e:
+            return content, status, url, "", _empty_result(detail_url, f"详情页请求失败: {e}")
+        if dstatus != 200:
+            return content, status, url, "", _empty_result(detail_url, f"详情页请求失败: HTTP {dstatus}")
+        return content, status, url, "", _javbus_detail(html, detail_url)
+
+    async def fetch_async(self, session, sem, code: str, timeout: float):
+        url = self.search_url(code)
+        content, status, err = await _async_get_text(session, sem, url, timeout)
+        if err or status != 200:
+            return content, status, url, err, None
+        href = _javbus_first_link(content)
+        if not href:
+            return content, status, url, "", _empty_result(error="未找到第一个结果链接")
+        detail_url = urljoin(url, href.strip())
+        html, dstatus, derr = await _async_get_text(session, sem, detail_url, timeout, phase="detail_fetch")
+        if derr or dstatus != 200:
+            return content, status, url, "", _empty_result(detail_url, f"详情页请求失败: {derr or f'HTTP {dstatus}'}")
+        return content, status, url, "", _javbus_detail(html, detail_url)
+
+
+def _make_provider(name: str, cfg: dict) -> SourceProvider:
+    if name == "dmm":
+        return DmmProvider()
+    if name == "javbus":
+        return JavBusProvider(cfg.get("javbus_base", "https://www.javbus.com"))
+    raise ValueError(f"未知的数据源: {name}")
+
+
+class SourceFanout:
+    """
+    每个番号同时向所有来源发起查询：任一来源给出完整结果（complete_fields 均非空且无错误）即返回，
+    其余来源被取消（async 下取消协程；线程下跳过其后续请求，在途请求在后台自然结束）；
+    都不完整时按 providers 的顺序逐字段合并各来源的部分结果。
+    """
+
+    def __init__(self, providers: List[SourceProvider], complete_fields, pool_size: int):
+        self.providers = providers
+        self.complete_fields = tuple(complete_fields)
+        self._pool = ThreadPoolExecutor(max_workers=max(1, pool_size), thread_name_prefix="source")
+        self._lock = threading.Lock()
+        self.stats = {"lookups": 0, "complete": 0, "merged": 0, "cancelled": 0,
+                      "wins": {p.name: 0 for p in providers}}
+
+    def _is_complete(self, result) -> bool:
+        return bool(result) and not result.get("error") and all(result.get(f) for f in self.complete_fields)
+
+    def _combine(self, finished: dict, winner: str, cancelled: int, elapsed: float):
+        """finished: {来源名: (content, status, url, err, result)} -> 引擎使用的六元组。"""
+        order = [p.name for p in self.providers if p.name in finished]
+        if winner is not None:
+            order.remove(winner)
+            order.insert(0, winner)
+        merged = _empty_result()
+        merged["sources"] = []
+        merged["detail_urls"] = {}
+        for name in order:
+            result = finished[name][4]
+            if not result:
+                continue
+            if result.get("detail_url"):
+                merged["detail_urls"][name] = result["detail_url"]
+            if result.get("error"):
+                continue
+            used = False
+            for f in _SOURCE_FIELDS:
+                if not merged[f] and result.get(f):
+                    merged[f] = result[f]
+                    used = True
+            if used:
+                merged["sources"].append(name)
+        # 入口页面信息取自首个贡献字段的来源，没有时取排在最前的来源
+        lead = merged["sources"][0] if merged["sources"] else order[0]
+        content, status, url, err, result = finished[lead]
+        if not merged["sources"]:
+            errors = [f"{name}: {finished[name][3] or (finished[name][4] or {}).get('error') or f'HTTP {finished[name][1]}'}"
+                      for name in order]
+            merged["error"] = "；".join(errors)
+            if result is None:
+                # 与单一来源一致：入口请求失败时不给解析结果
+                merged = None
+        with self._lock:
+            self.stats["lookups"] += 1
+            self.stats["cancelled"] += cancelled
+            if winner is not None:
+                self.stats["complete"] += 1
+                self.stats["wins"][winner] += 1
+            elif merged is not None and merged["sources"]:
+                self.stats["merged"] += 1
+        return content, status, url, err, elapsed, merged
+
+    def fetch(self, code: str, timeout: float):
+        start = time.perf_counter()
+        cancel = threading.Event()
+        futures = {self._pool.submit(p.fetch, code, timeout, cancel): p.name for p in self.providers}
+        pending = set(futures)
+        finished = {}
+        winner = None
+        while pending and winner is None:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                name = futures[fut]
+                try:
+                    finished[name] = fut.result()
+                except Exception as e:
+                    finished[name] = ("", 0, "", f"{name} 查询异常: {e}", None)
+                if winner is None and self._is_complete(finished[name][4]):
+                    winner = name
+        if pending:
+            cancel.set()
+        return self._combine(finished, winner, len(pending), time.perf_counter() - start)
+
+    async def fetch_async(self, session, sem, code: str, timeout: float):
+        start = time.perf_counter()
+        # 与线程版本一致：各来源的阶段耗时不计入该番号的 timings（协程任务创建时会复制当前上下文）
+        token = _current_timings.set(None)
+        try:
+            tasks = {asyncio.ensure_future(p.fetch_async(session, sem, code, timeout)): p.name
+                     for p in self.providers}
+        finally:
+            _current_timings.reset(token)
+        pending = set(tasks)
+        finished = {}
+        winner = None
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                name = tasks[task]
+                try:
+                    finished[name] = task.result()
+                except Exception as e:
+                    finished[name] = ("", 0, "", f"{name} 查询异常: {e}", None)
+                if winner is None and self._is_complete(finished[name][4]):
+                    winner = name
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+        return self._combine(finished, winner, len(pending), time.perf_counter() - start)
+
+    def close(self):
+        # 被取消来源的在途请求不必等待
+        self._pool.shutdown(wait=False)
+
+
+_fanout = None
+_fanout_lock = threading.Lock()
+
+
+def _source_names() -> List[str]:
+    return [str(n).lower() for n in (CONFIG.get("sources") or {}).get("providers") or ["dmm"]]
+
+
+def _get_fanout():
+    """按 CONFIG["sources"] 懒加载；只使用 DMM 时返回 None（走原有流程）。"""
+    global _fanout
+    names = _source_names()
+    if names == ["dmm"]:
+        return None
+    with _fanout_lock:
+        if _fanout is None:
+            cfg = CONFIG.get("sources") or {}
+            providers = [_make_provider(name, cfg) for name in dict.fromkeys(names)]
+            # 每个调用方同时占用每个来源一个线程；被取消的来源可能仍在后台占用线程直到请求结束
+            _fanout = SourceFanout(providers, cfg.get("complete_fields", ("title", "performer", "cover")),
+                                   pool_size=int(cfg.get("pool_size") or 2 * len(providers) * max(8, _fetcher_count())))
+    return _fanout
+
+
+def close_sources():
+    global _fanout
+    with _fanout_lock:
+        fanout, _fanout = _fanout, None
+    if fanout is not None:
+        fanout.close()
+        logging.info(f"Sources: {fanout.stats}")
+
+
+def _source_result(code: str, timeout: float):
+    """
+    串行 / 线程池 / daemon 用：启用多数据源时返回 (content, status, url, err, elapsed, result)，
+    否则返回 None，调用方走 DMM 流程。
+    """
+    fanout = _get_fanout()
+    if fanout is None:
+        return None
+    return fanout.fetch(code, timeout)
+
+
+# ---------------- 常驻服务（daemon）：本地 JSON API ----------------
+
+class LookupService:
+    """
+    常驻进程中的查询服务：Session / 缓存 / 解析进程池等懒加载对象在多次查询间保持复用。
+    每次查询走与批量抓取相同的流程（详情索引 → 搜索页 → 详情页），结果同样送入 sinks，
+    并发由线程池（workers）限制。
+    """
+
+    def __init__(self, workers: int, timeout: float):
+        self.timeout = timeout
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="lookup")
+        self._lock = threading.Lock()
+        self._counter = 0
+        self.started = time.time()
+        self.stats = {"lookups": 0, "errors": 0}
+
+    def _lookup(self, code: str) -> dict:
+        with _Timings({}) as timings:
+            hit = _source_result(code, self.timeout) or _indexed_result(code, self.timeout)
+            if hit is not None:
+                content, status, url, err, elapsed, result = hit
+            else:
+                start = time.perf_counter()
+                content, status, url, err = fetch_once(code, 0, timeout=self.timeout)
+                elapsed = time.perf_counter() - start
+                result = _extract_detail_fields(content, url) if not err and status == 200 else None
+        with self._lock:
+            self._counter += 1
+            counter = self._counter
+            self.stats["lookups"] += 1
+            if err or status != 200 or (result or {}).get("error"):
+                self.stats["errors"] += 1
+        _emit_result(counter, None, code, status, url, elapsed, content, err, result, timings)
+        return {"code": code, "status": status, "search_url": url, "elapsed": round(elapsed, 6),
+                "error": err or (result or {}).get("error", ""), "result": result}
+
+    def lookup(self, code: str) -> dict:
+        return self._pool.submit(self._lookup, code).result()
+
+    def lookup_many(self, codes: List[str]) -> List[dict]:
+        """按输入顺序返回；重复番号只查询一次。"""
+        futures = {}
+        for code in codes:
+            if code not in futures:
+                futures[code] = self._pool.submit(self._lookup, code)
+        return [futures[code].result() for code in codes]
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+
+
+def _make_daemon_handler(service: LookupService, max_batch: int):
+    from http.server import BaseHTTPRequestHandler
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send_json(self, status: int, payload):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _codes_from_body(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            if length <= 0 or length > 1024 * 1024:
+                raise ValueError("请求体为空或过大")
+            payload = json.loads(self.rfile.read(length))
+            codes = payload.get("codes") if isinstance(payload, dict) else payload
+            if not isinstance(codes, list) or not all(isinstance(c, str) for c in codes):
+                raise ValueError('需要 {"codes": ["SSNI-123", ...]}')
+            return codes
+
+        def do_GET(self):
+            parts = urlsplit(self.path)
+            if parts.path == "/health":
+                return self._send_json(200, {"ok": True, "uptime_s": round(time.time() - service.started, 3),
+                                             **service.stats})
+            if parts.path == "/stats":
+                return self._send_json(200, _runtime_stats())
+            if parts.path == "/lookup":
+                codes = [c.strip() for c in parse_qs(parts.query).get("code", []) if c.strip()]
+                if len(codes) != 1:
+                    return self._send_json(400, {"error": "需要且只能给出一个 code 参数"})
+                return self._send_json(200, service.lookup(codes[0]))
+            self._send_json(404, {"error": f"未知路径: {parts.path}"})
+
+        def do_POST(self):
+            path = urlsplit(self.path).path
+            if path != "/batch":
+                return self._send_json(404, {"error": f"未知路径: {path}"})
+            try:
+                codes = [c.strip() for c in self._codes_from_body() if c.strip()]
+            except ValueError as e:
+                return self._send_json(400, {"error": str(e)})
+            if len(codes) > max_batch:
+                return self._send_json(413, {"error": f"单次最多 {max_batch} 个番号"})
+            self._send_json(200, {"results": service.lookup_many(codes)})
+
+    return Handler
+
+
+def _runtime_stats() -> dict:
+    """daemon 的 /stats：当前各组件的统计（未启用的组件不出现）。"""
+    stats = {}
+    if _metrics is not None:
+        stats["metrics"] = _metrics.summary()
+    for name, obj in (("http_cache", _http_cache), ("single_flight", _single_flight),
+                      ("circuit_breaker", _circuit_breaker), ("hedging", _hedger),
+                      ("detail_index", _detail_index), ("archive", _archive), ("covers", _covers),
+                      ("sources", _fanout), ("parse_memo", _parse_memo)):
+        if obj is not None:
+            stats[name] = obj.stats
+    if _retry_policy is not None:
+        stats["retry"] = dict(_retry_stats)
+    return stats
+
+
+def serve_daemon(cfg: dict):
+    """
+    以常驻服务运行，直到 Ctrl+C / SIGTERM：
+      GET  /lookup?code=SSNI-123   -> 单个番号的结果（result 为 _extract_detail_fields 的返回值）
+      POST /batch {"codes": [...]} -> {"results": [...]}，顺序与输入一致
+      GET  /health, GET /stats
+    CONFIG["daemon"]["unix_socket"] 给出路径时监听 Unix socket，否则监听 host:port（默认仅本机）。
+    """
+    import signal
+    import socketserver
+    from http.server import ThreadingHTTPServer
+
+    dcfg = cfg.get("daemon") or {}
+    workers = max(1, int(dcfg.get("workers") or cfg.get("workers", 1)))
+    service = LookupService(workers, timeout=float(cfg.get("timeout", 15.0)))
+    handler = _make_daemon_handler(service, int(dcfg.get("max_batch", 500)))
+    unix_path = dcfg.get("unix_socket")
+    if unix_path:
+        class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+            daemon_threads = True
+
+            def get_request(self):
+                request, _ = super().get_request()
+                # BaseHTTPRequestHandler 需要 (host, port) 形式的客户端地址
+                return request, ("local", 0)
+
+        if os.path.exists(unix_path):
+            os.remove(unix_path)
+        server = _UnixHTTPServer(unix_path, handler)
+        where = unix_path
+    else:
+        server = ThreadingHTTPServer((dcfg.get("host", "127.0.0.1"), int(dcfg.get("port", 8765))), handler)
+        server.daemon_threads = True
+        where = "http://%s:%d" % server.server_address[:2]
+
+    def _stop(*_args):
+        # shutdown() 会等待 serve_forever 退出，不能在其所在线程中直接调用
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, _stop)
+    logging.info(f"[daemon] 监听 {where}，查询线程 {workers} 个")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        if unix_path and os.path.exists(unix_path):
+            os.remove(unix_path)
+        logging.info(f"[daemon] 已停止：{service.stats}")
+
+
+# ---------------- 命令行 ----------------
+
+def _build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="scraper.py",
+        description="DMM 番号抓取。未给出的选项使用 scraper.py 中 CONFIG 的值。")
+    parser.add_argument("codes", nargs="*", help="要抓取的番号（覆盖 CONFIG['codes']）")
+    parser.add_argument("-f", "--codes-file", help="番号文件，每行一个")
+    parser.add_argument("-e", "--engine", choices=("thread", "pipeline", "async"), help="并发引擎")
+    parser.add_argument("-w", "--workers", type=int, help="线程数（1 为串行）")
+    parser.add_argument("--concurrency", type=int, help="async 引擎的在途请求上限")
+    parser.add_argument("-r", "--repeat", type=int, help="每个番号重复请求次数")
+    parser.add_argument("-t", "--timeout", type=float, help="单次请求超时（秒）")
+    parser.add_argument("--parser", choices=("bs4", "lxml", "partial"), help="HTML 解析后端")
+    parser.add_argument("--mode", choices=("crawl", "reextract", "refresh", "daemon"),
+                        help="抓取、从归档离线重新解析、按元数据缓存增量刷新，或作为常驻服务提供本地 JSON API")
+    parser.add_argument("--metadata-cache", help="refresh 模式读取并写回的 movie-metadata-cache.json")
+    parser.add_argument("--max-seconds", type=float, help="refresh 模式的时间预算（秒）")
+    parser.add_argument("--max-requests", type=int, help="refresh 模式的请求预算")
+    parser.add_argument("--port", type=int, help="daemon 模式的监听端口")
+    parser.add_argument("--unix-socket", help="daemon 模式改为监听该 Unix socket 路径")
+    parser.add_argument("--log-file", help="日志文件")
+    parser.add_argument("--verbosity", choices=("quiet", "normal", "full"), help="日志块详细程度")
+    parser.add_argument("--set", dest="overrides", action="append", default=[], metavar="KEY=VALUE",
+                        help="覆盖任意 CONFIG 键，KEY 可用点号指定子键，VALUE 按 JSON 解析（失败时当作字符串），"
+                             "例如 --set retry.enabled=true；可重复")
+    parser.add_argument("--json", action="store_true",
+                        help="把每条结果记录以 JSON Lines 写到标准输出（不写日志文件）")
+    return parser
+
+
+def _set_config_path(cfg: dict, dotted: str, raw: str):
+    try:
+        value = json.loads(raw)
+    except ValueError:
+        value = raw
+    keys = dotted.split(".")
+    node = cfg
+    for key in keys[:-1]:
+        child = node.get(key)
+        if not isinstance(child, dict):
+            child = node[key] = {}
+        else:
+            child = node[key] = dict(child)
+        node = child
+    node[keys[-1]] = value
+
+
+def _apply_cli_args(args: argparse.Namespace, cfg: dict):
+    """把命令行参数写入 cfg（通常就是 CONFIG）。"""
+    if args.codes:
+        cfg["codes"] = list(args.codes)
+        cfg["codes_file"] = None
+    if args.codes_file:
+        cfg["codes_file"] = args.codes_file
+        if not args.codes:
+            cfg["codes"] = []
+    if args.workers is not None:
+        cfg["workers"] = args.workers
+    for attr, key in (("engine", "engine"), ("concurrency", "async_concurrency"), ("repeat", "repeat"),
+                      ("timeout", "timeout"), ("parser", "parser"), ("mode", "mode"),
+                      ("log_file", "log_file")):
+        value = getattr(args, attr)
+        if value is not None:
+            cfg[key] = value
+    refresh = {k: v for k, v in (("cache_path", args.metadata_cache), ("max_seconds", args.max_seconds),
+                                 ("max_requests", args.max_requests)) if v is not None}
+    if refresh:
+        cfg["refresh"] = {**(cfg.get("refresh") or {}), **refresh}
+    if args.port is not None or args.unix_socket:
+        daemon = dict(cfg.get("daemon") or {})
+        if args.port is not None:
+            daemon["port"] = args.port
+        if args.unix_socket:
+            daemon["unix_socket"] = args.unix_socket
+        cfg["daemon"] = daemon
+    if args.verbosity is not None:
+        cfg["logging"] = {**(cfg.get("logging") or {}), "verbosity": args.verbosity}
+    for item in args.overrides:
+        key, sep, raw = item.partition("=")
+        if not sep or not key:
+            raise SystemExit(f"--set 需要 KEY=VALUE 形式: {item!r}")
+        _set_config_path(cfg, key.strip(), raw)
+
+
+def main(argv: List[str] = None):
+    """
+    命令行入口。argv 为 None 时只使用 CONFIG（与 import 后直接调用 main() 相同），
+    否则先解析命令行参数并覆盖 CONFIG。
+    """
+    if argv is not None:
+        args = _build_arg_parser().parse_args(argv)
+        _apply_cli_args(args, CONFIG)
+        if args.json:
+            # 命令行模式下 repeat / 日志设置沿用 CONFIG，而不是 scrape() 的库默认值
+            for record in scrape(None, repeat=CONFIG.get("repeat", 1), logging=CONFIG.get("logging") or {}):
+                sys.stdout.write(json.dumps(record, ensure_ascii=False) + "\n")
+                sys.stdout.flush()
+            return
+
+    cfg = CONFIG
+    # 初始化日志
+    log_file = cfg.get("log_file", "scraper.log")
+    also_stdout = bool(cfg.get("also_stdout", False))
+    setup_logging(log_file, also_stdout)
+    logging.info("=== Scraper started ===")
+    logging.info(f"CONFIG: {cfg}")
+
+    codes = _prepare_codes(cfg)
+    reporter = start_metrics(cfg)
+    try:
+        _run_engine(cfg, codes)
+    finally:
+        _shutdown_runtime(reporter)
     logging.info("=== Scraper finished ===")
+    stop_logging()
 
 
 if __name__ == "__main__":
-    main()
+    main(sys.argv[1:])
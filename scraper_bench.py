@@ -0,0 +1,304 @@
+"""
+scraper.py 的离线基准测试：
+- 在子进程中启动一个本地 HTTP 服务，模拟 DMM 搜索页 / 详情页（可配置延迟、抖动、错误率、429）
+- 每个试验（引擎 × workers × 番号数量）在独立子进程中运行，互不影响峰值内存
+- 输出吞吐、每个番号端到端（交给引擎到输出结果）的 p50/p95/p99 延迟、CPU 时间与峰值 RSS
+- 试验进程崩溃（导入失败、OOM、异常）或超过 trial_timeout_s 时记为失败，不会卡住整轮基准
+"""
+import os
+import sys
+import json
+import time
+import queue
+import random
+import threading
+import multiprocessing
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+
+# 配置：在此处直接设置参数而非命令行
+BENCH_CONFIG = {
+    "engines": ["sequential", "thread", "pipeline", "async"],
+    "workers": [1, 8, 32],          # 线程池 / 流水线各阶段 / async 并发上限
+    "code_counts": [50, 200],       # 每轮番号数量
+    "fixtures_dir": None,           # 录制的页面目录（search.html / detail.html）；为空时使用内置模板
+    "server": {
+        "latency_ms": 50.0,          # 每个请求的基础延迟
+        "jitter_ms": 20.0,           # 延迟抖动（均匀分布 ±jitter）
+        "error_rate": 0.0,           # 返回 500 的概率
+        "rate_429": 0.0,             # 返回 429 的概率
+        "retry_after": 1,            # 429 时的 Retry-After（秒）
+    },
+    "scraper_overrides": {},        # 额外覆盖 scraper.CONFIG 的键，例如 {"parser": "lxml"}
+    "trial_timeout_s": 600.0,       # 单个试验的最长时间，超时后终止试验进程并记为失败
+    "output_json": "bench_output.json",
+}
+
+# 内置模板：与 DMM 页面结构一致（只保留 scraper 用到的节点，外加一些噪声节点）
+SEARCH_TEMPLATE = """<!DOCTYPE html><html><head><meta charset="utf-8"><title>search</title></head><body>
+<div id="main-src"><ul id="list">
+<li><div><p class="tmb"><a href="/mono/dvd/-/detail/=/cid={cid}/"><span class="img"><img src="https://pics.dmm.co.jp/mono/movie/adult/{cid}/{cid}pt.jpg" alt=""></span></a></p></div></li>
+<li><div><p class="tmb"><a href="/mono/dvd/-/detail/=/cid={cid}r/"><span class="img"><img src="https://pics.dmm.co.jp/mono/movie/adult/{cid}r/{cid}rpt.jpg" alt=""></span></a></p></div></li>
+</ul></div>
+{filler}
+</body></html>"""
+
+DETAIL_TEMPLATE = """<!DOCTYPE html><html><head><meta charset="utf-8">
+<meta property="og:image" content="https://pics.dmm.co.jp/mono/movie/adult/{cid}/{cid}ps.jpg">
+<title>{code}</title></head><body>
+<h1 id="title" class="item fn-cmnTitle">{code} ベンチマーク用タイトル</h1>
+<div id="sample-video"><a href="https://pics.dmm.co.jp/mono/movie/adult/{cid}/{cid}pl.jpg" name="package-image">
+<img id="fn-modalSampleImage__image" src="https://p.dmm.co.jp/p/general/loading.gif" data-src="https://pics.dmm.co.jp/mono/movie/adult/{cid}/{cid}pl.jpg"></a></div>
+<table class="mg-b20">
+<tr><td class="nw">発売日：</td><td>2024/01/01</td></tr>
+<tr><td class="nw">出演者：</td><td><span id="performer"><a href="/a/1">女優A</a></span></td></tr>
+<tr><td class="nw">ジャンル：</td><td><a href="/g/1">巨乳</a>&nbsp;<a href="/g/2">単体作品</a>&nbsp;<a href="/g/3">美少女</a></td></tr>
+</table>
+{filler}
+</body></html>"""
+
+FILLER = "".join(
+    f'<div class="rec"><a href="/mono/dvd/-/detail/=/cid=rec{i:04d}/">'
+    f'<img src="https://pics.dmm.co.jp/mono/movie/adult/rec{i:04d}/rec{i:04d}pt.jpg"></a><p>おすすめ {i}</p></div>'
+    for i in range(400)
+)
+
+
+# ---------------- 模拟服务 ----------------
+
+def _load_fixtures(fixtures_dir):
+    if not fixtures_dir:
+        return SEARCH_TEMPLATE, DETAIL_TEMPLATE
+    with open(os.path.join(fixtures_dir, "search.html"), "r", encoding="utf-8") as f:
+        search = f.read()
+    with open(os.path.join(fixtures_dir, "detail.html"), "r", encoding="utf-8") as f:
+        detail = f.read()
+    return search, detail
+
+
+def _make_handler(server_cfg: dict, search_tpl: str, detail_tpl: str, recorded: bool):
+    latency = float(server_cfg.get("latency_ms", 0.0)) / 1000.0
+    jitter = float(server_cfg.get("jitter_ms", 0.0)) / 1000.0
+    error_rate = float(server_cfg.get("error_rate", 0.0))
+    rate_429 = float(server_cfg.get("rate_429", 0.0))
+    retry_after = str(server_cfg.get("retry_after", 1))
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status: int, body: bytes = b"", headers=None):
+            self.send_response(status)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            if body:
+                self.wfile.write(body)
+
+        def do_GET(self):
+            delay = latency + random.uniform(-jitter, jitter)
+            if delay > 0:
+                time.sleep(delay)
+            roll = random.random()
+            if roll < rate_429:
+                return self._send(429, headers={"Retry-After": retry_after})
+            if roll < rate_429 + error_rate:
+                return self._send(500)
+            path = self.path
+            base = f"http://{self.headers.get('Host', '127.0.0.1')}"
+            if "/search/" in path and "searchstr=" in path:
+                code = path.split("searchstr=", 1)[1].strip("/")
+                tpl = search_tpl
+            elif "/detail/" in path and "cid=" in path:
+                code = path.split("cid=", 1)[1].strip("/")
+                tpl = detail_tpl
+            else:
+                return self._send(404)
+            if recorded:
+                # 录制页面原样返回，只把绝对链接改写到本地服务
+                body = tpl.replace("https://www.dmm.co.jp", base)
+            else:
+                cid = code.lower().replace("-", "")
+                body = tpl.format(code=code, cid=cid, filler=FILLER)
+            self._send(200, body.encode("utf-8"))
+
+    return Handler
+
+
+def serve(port_queue, server_cfg: dict, fixtures_dir):
+    search_tpl, detail_tpl = _load_fixtures(fixtures_dir)
+    handler = _make_handler(server_cfg, search_tpl, detail_tpl, recorded=bool(fixtures_dir))
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    httpd.daemon_threads = True
+    httpd.request_queue_size = 1024
+    port_queue.put(httpd.server_address[1])
+    httpd.serve_forever()
+
+
+# ---------------- 单次试验 ----------------
+
+class _CollectSink:
+    """收集每条结果记录及其输出时刻的基准 sink。"""
+
+    def __init__(self):
+        self.records = []
+        self.done_at = {}
+        self._lock = threading.Lock()
+
+    def write(self, record: dict):
+        now = time.perf_counter()
+        with self._lock:
+            self.records.append(record)
+            self.done_at[record["code"]] = now
+
+    def close(self):
+        pass
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    return rss / (1024.0 * 1024.0) if sys.platform == "darwin" else rss / 1024.0
+
+
+def run_trial(result_queue, port: int, engine: str, workers: int, n_codes: int, overrides: dict):
+    import scraper
+
+    scraper.DMM_SEARCH_TEMPLATE = f"http://127.0.0.1:{port}/mono/dvd/-/search/=/searchstr={{code}}/"
+    scraper.CONFIG.update(overrides)
+    scraper.CONFIG.update({"extra_cookies": [], "logging": {"verbosity": "quiet"}, "sinks": []})
+    scraper.setup_logging(os.devnull)
+    sink = _CollectSink()
+    scraper._sinks = [sink]
+
+    codes = [f"BENCH-{i:05d}" for i in range(n_codes)]
+    submitted = {}
+
+    def timed_codes():
+        # 各引擎都按需从输入中取番号，取出的时刻即为该番号交给引擎的时刻
+        for code in codes:
+            submitted[code] = time.perf_counter()
+            yield code
+
+    timeout = float(scraper.CONFIG.get("timeout", 15.0))
+    cpu0 = os.times()
+    t0 = time.perf_counter()
+    if engine == "sequential":
+        scraper.run_sequential(timed_codes(), repeat=1, interval=0.0, timeout=timeout)
+    elif engine == "thread":
+        scraper.run_parallel(timed_codes(), repeat=1, workers=workers, timeout=timeout)
+    elif engine == "pipeline":
+        stage_workers = {name: workers for name in scraper.PIPELINE_STAGES}
+        scraper.run_pipeline(timed_codes(), repeat=1, timeout=timeout, stage_workers=stage_workers)
+    elif engine == "async":
+        scraper.run_async(timed_codes(), repeat=1, concurrency=workers, timeout=timeout)
+    else:
+        raise ValueError(f"未知引擎: {engine}")
+    wall = time.perf_counter() - t0
+    cpu1 = os.times()
+
+    # 端到端延迟：番号交给引擎到结果输出（含排队、搜索页、详情页与解析）
+    latencies = [done - submitted[code] for code, done in sink.done_at.items()]
+    errors = sum(1 for r in sink.records if r["error"] or r["status"] != 200)
+    result_queue.put({
+        "engine": engine,
+        "workers": workers,
+        "codes": n_codes,
+        "completed": len(sink.records),
+        "errors": errors,
+        "wall_s": round(wall, 4),
+        "throughput_per_s": round(len(sink.records) / wall, 2) if wall > 0 else 0.0,
+        "p50_ms": round(_percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(_percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(_percentile(latencies, 99) * 1000, 2),
+        "cpu_s": round((cpu1.user - cpu0.user) + (cpu1.system - cpu0.system), 4),
+        "peak_rss_mb": _peak_rss_mb(),
+    })
+
+
+def _run_isolated(port: int, engine: str, workers: int, n_codes: int, overrides: dict,
+                  trial_timeout: float = None) -> dict:
+    q = multiprocessing.Queue()
+    proc = multiprocessing.Process(target=run_trial, args=(q, port, engine, workers, n_codes, overrides))
+    proc.start()
+    deadline = time.monotonic() + trial_timeout if trial_timeout else None
+    failure = None
+    try:
+        while True:
+            try:
+                return q.get(timeout=1.0)
+            except queue.Empty:
+                pass
+            if not proc.is_alive():
+                # 进程刚放入结果就退出时，结果可能还在管道里
+                try:
+                    return q.get(timeout=1.0)
+                except queue.Empty:
+                    failure = f"试验进程退出（exit code {proc.exitcode}）"
+                    break
+            if deadline is not None and time.monotonic() > deadline:
+                proc.terminate()
+                failure = f"超时（{trial_timeout:.0f}s）"
+                break
+    finally:
+        proc.join()
+    return {"engine": engine, "workers": workers, "codes": n_codes, "failed": failure}
+
+
+def main():
+    cfg = BENCH_CONFIG
+    port_queue = multiprocessing.Queue()
+    server = multiprocessing.Process(
+        target=serve, args=(port_queue, cfg.get("server") or {}, cfg.get("fixtures_dir")), daemon=True)
+    server.start()
+    port = port_queue.get()
+    print(f"stand-in server on 127.0.0.1:{port}")
+
+    rows = []
+    header = f"{'engine':<10}{'workers':>8}{'codes':>7}{'ok':>6}{'err':>5}{'codes/s':>10}" \
+             f"{'p50ms':>9}{'p95ms':>9}{'p99ms':>9}{'cpu_s':>8}{'rssMB':>8}"
+    print(header)
+    try:
+        for n_codes in cfg.get("code_counts") or [50]:
+            for engine in cfg.get("engines") or ["thread"]:
+                # 串行引擎与 workers 无关，只跑一次
+                sweep = [1] if engine == "sequential" else (cfg.get("workers") or [1])
+                for workers in sweep:
+                    row = _run_isolated(port, engine, workers, n_codes, cfg.get("scraper_overrides") or {},
+                                        cfg.get("trial_timeout_s"))
+                    rows.append(row)
+                    if row.get("failed"):
+                        print(f"{engine:<10}{workers:>8}{n_codes:>7}  FAILED: {row['failed']}")
+                        continue
+                    rss = row["peak_rss_mb"]
+                    print(f"{engine:<10}{workers:>8}{n_codes:>7}{row['completed'] - row['errors']:>6}"
+                          f"{row['errors']:>5}{row['throughput_per_s']:>10.1f}{row['p50_ms']:>9.1f}"
+                          f"{row['p95_ms']:>9.1f}{row['p99_ms']:>9.1f}{row['cpu_s']:>8.2f}"
+                          f"{(rss if rss is not None else float('nan')):>8.1f}")
+    finally:
+        server.terminate()
+
+    out = cfg.get("output_json")
+    if out:
+        with open(out, "w", encoding="utf-8") as f:
+            json.dump({"config": cfg, "results": rows}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
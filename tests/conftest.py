@@ -0,0 +1,117 @@
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# scraper.py 是仓库根目录下的单文件模块
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+FIXTURES = os.path.join(ROOT, "tests", "fixtures", "dmm")
+
+
+def read_fixture(name: str) -> str:
+    with open(os.path.join(FIXTURES, name), "r", encoding="utf-8") as f:
+        return f.read()
+
+
+class FakeDmm:
+    """
+    本地模拟 DMM：搜索页 / 详情页取自 fixtures，绝对链接改写到本地；可让前 N 个详情页请求返回 503。
+    设置 etag 后响应带 ETag，请求的 If-None-Match 与之相同时返回 304（计入 not_modified）。
+    search_status 不为 200 时搜索页以该状态码返回；body_delay 秒为发出响应头之后、发出正文之前的等待。
+    connections 统计服务端接受的 TCP 连接数，max_in_flight 为同时处理中的请求数峰值。
+    """
+
+    def __init__(self):
+        self.hits = {"search": 0, "detail": 0}
+        self.fail_detail = 0
+        self.search_status = 200
+        self.body_delay = 0.0
+        self.connections = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.etag = None
+        self.not_modified = 0
+        self.conditional = []
+        self._lock = threading.Lock()
+        self.base = ""
+
+    def page(self, path: str, headers=None):
+        headers = headers or {}
+        with self._lock:
+            if "/search/" in path:
+                kind, body = "search", "search.html"
+            elif "/detail/" in path:
+                kind, body = "detail", "detail.html"
+            else:
+                return 404, "", {}
+            self.hits[kind] += 1
+            if kind == "detail" and self.fail_detail > 0:
+                self.fail_detail -= 1
+                return 503, "", {}
+            if kind == "search" and self.search_status != 200:
+                return self.search_status, read_fixture("search_no_result.html"), {}
+            if self.etag is None:
+                return 200, read_fixture(body), {}
+            if headers.get("If-None-Match"):
+                self.conditional.append(headers["If-None-Match"])
+            if headers.get("If-None-Match") == self.etag:
+                self.not_modified += 1
+                return 304, "", {"ETag": self.etag}
+            return 200, read_fixture(body), {"ETag": self.etag}
+
+
+@pytest.fixture
+def dmm_server(monkeypatch):
+    import scraper
+
+    fake = FakeDmm()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def setup(self):
+            # 每个 TCP 连接一个 Handler 实例
+            with fake._lock:
+                fake.connections += 1
+            super().setup()
+
+        def do_GET(self):
+            with fake._lock:
+                fake.in_flight += 1
+                fake.max_in_flight = max(fake.max_in_flight, fake.in_flight)
+            try:
+                self._respond()
+            finally:
+                with fake._lock:
+                    fake.in_flight -= 1
+
+        def _respond(self):
+            status, body, extra = fake.page(self.path, self.headers)
+            data = body.replace("https://www.dmm.co.jp", fake.base).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            for name, value in extra.items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            if fake.body_delay:
+                self.wfile.flush()
+                time.sleep(fake.body_delay)
+            self.wfile.write(data)
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    httpd.daemon_threads = True
+    fake.base = f"http://127.0.0.1:{httpd.server_address[1]}"
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    monkeypatch.setattr(scraper, "DMM_SEARCH_TEMPLATE", fake.base + "/mono/dvd/-/search/=/searchstr={code}/")
+    yield fake
+    httpd.shutdown()
+    httpd.server_close()
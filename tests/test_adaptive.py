@@ -0,0 +1,80 @@
+import scraper
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def _limiter(clock, **kwargs):
+    options = dict(initial_limit=8, min_limit=2, max_limit=10, initial_rate=10.0, min_rate=1.0, max_rate=12.0,
+                   rate_step=1.0, burst=100.0, latency_target=1.0, cooldown=2.0)
+    options.update(kwargs)
+    return scraper.AdaptiveLimiter(clock=clock, **options)
+
+
+def _round_trip(limiter, status, latency=0.1, retry_after=None):
+    limiter.acquire()
+    limiter.release(status, latency, retry_after)
+
+
+def test_multiplicative_decrease_on_429_and_503_once_per_cooldown():
+    clock = FakeClock()
+    limiter = _limiter(clock)
+    _round_trip(limiter, 429)
+    assert (limiter.limit, limiter.rate) == (4.0, 5.0)
+    # cooldown 内的第二个错误不再降
+    _round_trip(limiter, 503)
+    assert (limiter.limit, limiter.rate) == (4.0, 5.0)
+    clock.now += 2.0
+    _round_trip(limiter, 503)
+    assert (limiter.limit, limiter.rate) == (2.0, 2.5)
+    assert [d["reason"] for d in limiter.decisions] == ["status=429", "status=503"]
+    assert limiter.in_flight == 0
+
+
+def test_slow_responses_count_as_congestion():
+    limiter = _limiter(FakeClock())
+    _round_trip(limiter, 200, latency=5.0)
+    assert limiter.limit == 4.0 and limiter.decisions[-1]["reason"] == "latency=5.00s"
+
+
+def test_additive_increase_after_successes():
+    limiter = _limiter(FakeClock(), initial_limit=4, initial_rate=5.0)
+    for _ in range(4):
+        _round_trip(limiter, 200)
+    # 每个成功 +1/limit：一轮（约 limit 个）成功后 +1
+    assert 4.9 < limiter.limit < 5.0
+    assert limiter.rate == 9.0
+    _round_trip(limiter, 200)
+    assert int(limiter.limit) == 5 and limiter.decisions[-1]["reason"] == "increase"
+
+
+def test_floor_and_ceiling():
+    clock = FakeClock()
+    limiter = _limiter(clock)
+    for _ in range(10):
+        clock.now += 10
+        _round_trip(limiter, 503)
+    assert (limiter.limit, limiter.rate) == (2.0, 1.0)
+    for _ in range(200):
+        clock.now += 1
+        _round_trip(limiter, 200)
+    assert (limiter.limit, limiter.rate) == (10.0, 12.0)
+
+
+def test_retry_after_pauses_new_requests():
+    clock = FakeClock()
+    limiter = _limiter(clock)
+    _round_trip(limiter, 503, retry_after="3")
+    assert limiter._try_acquire() == 3.0
+    clock.now += 2.5
+    assert limiter._try_acquire() == 0.5
+    clock.now += 0.5
+    assert limiter._try_acquire() == 0.0
+    # Retry-After 只对 429/503 生效
+    limiter.release(200, 0.1, "30")
+    assert limiter._try_acquire() == 0.0
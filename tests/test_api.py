@@ -0,0 +1,93 @@
+import asyncio
+import contextlib
+import json
+import logging
+import subprocess
+import sys
+
+import pytest
+
+import scraper
+from conftest import ROOT
+
+CODES = ["SSNI-123", "SSNI-124", "SSNI-125"]
+
+
+@pytest.mark.parametrize("engine", ["sequential", "thread", "pipeline", "async"])
+def test_scrape_streams_one_record_per_code(engine, dmm_server):
+    if engine == "async":
+        pytest.importorskip("aiohttp")
+    options = {"engine": engine, "workers": 1 if engine == "sequential" else 3, "async_concurrency": 3,
+               "extract_first_result": True, "extra_cookies": []}
+    records = list(scraper.scrape(CODES, **options))
+    assert sorted(r["code"] for r in records) == CODES
+    for r in records:
+        assert r["error"] == "" and r["status"] == 200
+        assert r["title"] == "新人NO.1STYLE 交わる体液、濃密セックス"
+
+
+def test_early_close_releases_the_api(dmm_server):
+    saved = dict(scraper.CONFIG)
+    gen = scraper.scrape(iter(CODES * 20), workers=2, extra_cookies=[])
+    next(gen)
+    gen.close()
+    assert not scraper._api_lock.locked()
+    assert scraper.CONFIG == saved
+
+
+def test_ascrape_waits_for_done_marker_after_early_exit(monkeypatch):
+    def fake_scrape(codes, **options):
+        for i in range(1000):
+            yield {"code": f"A-{i:04d}"}
+
+    monkeypatch.setattr(scraper, "scrape", fake_scrape)
+
+    async def main():
+        async with contextlib.aclosing(scraper.ascrape()) as agen:
+            async for _ in agen:
+                # 让后台线程把队列塞满，结束标记只能等排空后再入队
+                await asyncio.sleep(0.2)
+                break
+        # 结束标记的 put 已完成，没有遗留在事件循环里的任务
+        assert asyncio.all_tasks() == {asyncio.current_task()}
+
+    asyncio.run(main())
+
+
+def test_shutdown_only_reports_singletons_that_exist(monkeypatch, tmp_path, caplog):
+    cache_dir = tmp_path / "http"
+    monkeypatch.setitem(scraper.CONFIG, "http_cache", {"enabled": True, "dir": str(cache_dir)})
+    monkeypatch.setitem(scraper.CONFIG, "adaptive", {"enabled": True})
+    monkeypatch.setitem(scraper.CONFIG, "circuit_breaker", {"enabled": True})
+    with caplog.at_level(logging.INFO):
+        scraper._shutdown_runtime(None)
+    # 启用但本次没有用到：不创建缓存目录，也不新建对象
+    assert not cache_dir.exists()
+    assert "HTTP cache" not in caplog.text and "Adaptive" not in caplog.text
+    assert scraper._limiter is None and scraper._circuit_breaker is None
+
+    scraper._get_http_cache()
+    with caplog.at_level(logging.INFO):
+        scraper._shutdown_runtime(None)
+    assert "HTTP cache:" in caplog.text and scraper._http_cache is None
+
+
+def test_import_does_not_load_network_stack():
+    code = "import sys, scraper; print('requests' in sys.modules, 'bs4' in sys.modules)"
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    assert out.stdout.split() == ["False", "False"]
+
+
+def test_cli_json_lines(dmm_server, tmp_path):
+    code = (
+        f"import sys; sys.path.insert(0, {ROOT!r}); import scraper; "
+        f"scraper.DMM_SEARCH_TEMPLATE = {scraper.DMM_SEARCH_TEMPLATE!r}; "
+        "scraper.main(sys.argv[1:])"
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", code, "SSNI-123", "--json", "-w", "1", "--repeat", "1",
+         "--log-file", str(tmp_path / "cli.log"), "--set", "extra_cookies=[]"],
+        cwd=str(tmp_path), capture_output=True, text=True, timeout=60)
+    assert out.returncode == 0, out.stderr
+    rows = [json.loads(line) for line in out.stdout.splitlines() if line.strip()]
+    assert [r["code"] for r in rows] == ["SSNI-123"]
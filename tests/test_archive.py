@@ -0,0 +1,124 @@
+import os
+
+import pytest
+
+import scraper
+
+
+def _fill(root, n, flush_every=1):
+    archive = scraper.PageArchive(root, flush_every=flush_every)
+    for i in range(n):
+        archive.add("detail", f"http://x/detail/{i}", f"<html>page {i}</html>", code=f"SSNI-{i}")
+    return archive
+
+
+def test_round_trip_through_mmap(tmp_path):
+    root = str(tmp_path)
+    archive = _fill(root, 3)
+    archive.add("detail", "http://x/detail/1", "<html>page 1</html>", code="SSNI-1")
+    assert archive.stats["stored"] == 3 and archive.stats["unchanged"] == 1
+    # 写入端自己读回（未 close 时 _view 先落盘再重新映射）
+    assert archive.get("http://x/detail/2")[1] == "<html>page 2</html>"
+    archive.close()
+
+    reader = scraper.PageArchive(root, readonly=True)
+    try:
+        meta, html = reader.get("http://x/detail/0#frag")
+        assert html == "<html>page 0</html>"
+        assert meta["code"] == "SSNI-0" and meta["kind"] == "detail" and meta["status"] == 200
+        assert reader.get("http://x/detail/missing") == (None, "")
+        assert len(reader.entries()) == 3
+    finally:
+        reader.close()
+
+
+def test_unflushed_records_are_invisible_to_readers(tmp_path):
+    root = str(tmp_path)
+    writer = _fill(root, 2, flush_every=100)
+    reader = scraper.PageArchive(root, readonly=True)
+    try:
+        assert len(reader) == 0
+    finally:
+        reader.close()
+    writer.close()
+    reader = scraper.PageArchive(root, readonly=True)
+    try:
+        assert len(reader) == 2
+    finally:
+        reader.close()
+
+
+def test_second_writer_is_rejected(tmp_path):
+    writer = scraper.PageArchive(str(tmp_path))
+    try:
+        with pytest.raises(RuntimeError):
+            scraper.PageArchive(str(tmp_path))
+    finally:
+        writer.close()
+    scraper.PageArchive(str(tmp_path)).close()
+
+
+def test_reader_racing_writer_leaves_index_alone(tmp_path, monkeypatch):
+    root = str(tmp_path)
+    writer = _fill(root, 1)
+    seen_size = os.path.getsize(writer.data_path)
+    # 写入者在读者取得 pages.dat 大小之后又提交了一条
+    writer.add("detail", "http://x/detail/late", "<html>late</html>", code="SSNI-9")
+    writer._flush()
+    index_before = open(writer.index_path, "rb").read()
+
+    getsize = os.path.getsize
+    monkeypatch.setattr(scraper.os.path, "getsize",
+                        lambda p: seen_size if p.endswith("pages.dat") else getsize(p))
+    reader = scraper.PageArchive(root, readonly=True)
+    monkeypatch.undo()
+    try:
+        assert len(reader) == 1 and reader.lookup("http://x/detail/late") is None
+    finally:
+        reader.close()
+    assert open(writer.index_path, "rb").read() == index_before
+    writer.close()
+
+    reader = scraper.PageArchive(root, readonly=True)
+    try:
+        assert reader.get("http://x/detail/late")[1] == "<html>late</html>"
+    finally:
+        reader.close()
+
+
+def test_torn_tails_are_dropped_by_writer(tmp_path):
+    root = str(tmp_path)
+    archive = _fill(root, 3)
+    archive.close()
+    # 崩溃：最后一条数据只落了一半，索引末尾多出半个索引项
+    with open(os.path.join(root, "pages.dat"), "r+b") as f:
+        f.truncate(os.path.getsize(f.name) - 5)
+    with open(os.path.join(root, "pages.idx"), "ab") as f:
+        f.write(b"\x00" * 7)
+
+    archive = scraper.PageArchive(root)
+    try:
+        assert len(archive) == 2 and archive.lookup("http://x/detail/2") is None
+        assert os.path.getsize(archive.index_path) == 2 * scraper.PageArchive.ENTRY.size
+        archive.add("detail", "http://x/detail/3", "<html>page 3</html>", code="SSNI-3")
+        assert archive.get("http://x/detail/3")[1] == "<html>page 3</html>"
+        assert archive.get("http://x/detail/1")[1] == "<html>page 1</html>"
+    finally:
+        archive.close()
+
+
+def test_reextract_reproduces_records_offline(tmp_path, dmm_server):
+    root = str(tmp_path / "archive")
+    codes = ["SSNI-123", "ABP-001"]
+    crawled = {r["code"]: r for r in scraper.scrape(codes, engine="thread", workers=2, extract_first_result=True,
+                                                    extra_cookies=[], archive={"enabled": True, "dir": root})}
+    hits = dict(dmm_server.hits)
+    replayed = {r["code"]: r for r in scraper.scrape(None, mode="reextract", extract_first_result=True,
+                                                     extra_cookies=[],
+                                                     archive={"enabled": True, "dir": root,
+                                                              "reextract_workers": 1})}
+    assert dmm_server.hits == hits
+    assert set(replayed) == set(codes)
+    for code in codes:
+        for field in ("detail_url", "title", "performer", "category", "cover", "error"):
+            assert replayed[code][field] == crawled[code][field], field
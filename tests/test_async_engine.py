@@ -0,0 +1,77 @@
+import asyncio
+import socket
+
+import pytest
+
+import scraper
+
+pytest.importorskip("aiohttp")
+
+
+@pytest.fixture
+def emitted(monkeypatch):
+    records = []
+
+    def emit(counter, total, code, status, url, elapsed, content, err, result, timings=None):
+        records.append({"code": code, "status": status, "err": err, "result": result})
+
+    monkeypatch.setattr(scraper, "_emit_result", emit)
+    monkeypatch.setitem(scraper.CONFIG, "extra_cookies", [])
+    return records
+
+
+@pytest.fixture
+def sessions(monkeypatch):
+    built = []
+    build = scraper._build_async_session
+
+    def counting(concurrency):
+        built.append(build(concurrency))
+        return built[-1]
+
+    monkeypatch.setattr(scraper, "_build_async_session", counting)
+    return built
+
+
+def test_semaphore_limits_requests_in_flight(emitted, dmm_server):
+    dmm_server.body_delay = 0.05
+    scraper.run_async([f"SSNI-{i:03d}" for i in range(12)], repeat=1, concurrency=3, timeout=5.0)
+    assert len(emitted) == 12 and all(r["status"] == 200 for r in emitted)
+    assert dmm_server.max_in_flight == 3
+
+
+def test_timeout_becomes_error_record(emitted, dmm_server, monkeypatch):
+    monkeypatch.setitem(scraper.CONFIG, "extract_first_result", True)
+    dmm_server.body_delay = 1.0
+    scraper.run_async(["SSNI-001", "SSNI-002"], repeat=1, concurrency=2, timeout=0.2)
+    assert sorted(r["code"] for r in emitted) == ["SSNI-001", "SSNI-002"]
+    for record in emitted:
+        assert record["status"] == 0 and record["err"] and record["result"] is None
+
+
+def test_connection_error_becomes_error_record(emitted, monkeypatch):
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    # 端口已关闭：连接被拒绝
+    monkeypatch.setattr(scraper, "DMM_SEARCH_TEMPLATE", f"http://127.0.0.1:{port}/search/{{code}}/")
+    scraper.run_async(["SSNI-001"], repeat=1, concurrency=1, timeout=2.0)
+    assert len(emitted) == 1 and emitted[0]["status"] == 0 and emitted[0]["err"]
+
+
+def test_session_is_closed_when_cancelled(emitted, sessions, dmm_server):
+    dmm_server.body_delay = 5.0
+
+    async def main():
+        task = asyncio.ensure_future(scraper._run_async_main(["SSNI-001", "SSNI-002"], 1, 2, 30.0))
+        while dmm_server.in_flight < 2:
+            await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        # 在途的请求协程随之取消，不会在 session 关闭后继续运行
+        assert asyncio.all_tasks() == {asyncio.current_task()}
+
+    asyncio.run(main())
+    assert emitted == []
+    assert len(sessions) == 1 and sessions[0].closed
@@ -0,0 +1,28 @@
+import importlib.util
+import json
+
+import scraper_bench
+
+REPORT_KEYS = {"engine", "workers", "codes", "completed", "errors", "wall_s", "throughput_per_s",
+               "p50_ms", "p95_ms", "p99_ms", "cpu_s", "peak_rss_mb"}
+
+
+def test_bench_smoke_on_builtin_templates(monkeypatch, tmp_path, capsys):
+    out = tmp_path / "bench_output.json"
+    engines = ["sequential", "thread", "pipeline"]
+    if importlib.util.find_spec("aiohttp") is not None:
+        engines.append("async")
+    cfg = dict(scraper_bench.BENCH_CONFIG, engines=engines,
+               workers=[2], code_counts=[3], fixtures_dir=None, scraper_overrides={}, trial_timeout_s=60.0,
+               server={"latency_ms": 0.0, "jitter_ms": 0.0}, output_json=str(out))
+    monkeypatch.setattr(scraper_bench, "BENCH_CONFIG", cfg)
+    scraper_bench.main()
+
+    rows = json.loads(out.read_text(encoding="utf-8"))["results"]
+    assert [r["engine"] for r in rows] == engines
+    for row in rows:
+        assert not row.get("failed"), row
+        assert set(row) == REPORT_KEYS
+        assert row["completed"] == 3 and row["errors"] == 0
+        assert 0 <= row["p50_ms"] <= row["p95_ms"] <= row["p99_ms"]
+    assert "codes/s" in capsys.readouterr().out
@@ -0,0 +1,22 @@
+import scraper
+
+
+def test_journal_resumes_and_truncates_torn_tail(tmp_path):
+    path = str(tmp_path / "scraper.journal")
+    journal = scraper.CheckpointJournal(path, fsync_every=1)
+    journal.record("A-1", True)
+    journal.record("B-2", False)
+    journal.close()
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("done\tC-")
+
+    journal = scraper.CheckpointJournal(path)
+    assert journal.done == {"A-1"} and journal.failed == {"B-2"}
+    journal.record("B-2", True)
+    journal.close()
+
+    journal = scraper.CheckpointJournal(path)
+    try:
+        assert journal.done == {"A-1", "B-2"} and not journal.failed
+    finally:
+        journal.close()
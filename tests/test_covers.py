@@ -0,0 +1,123 @@
+import hashlib
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import scraper
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\0" * 64
+
+
+class _ImageHandler(BaseHTTPRequestHandler):
+    # 收到的 Range 请求头（无 Range 时记为 None）；带 Range 时总是从 0 开始返回 206（与请求的偏移不符）
+    ranges = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.ranges.append(self.headers.get("Range"))
+        if self.headers.get("Range"):
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes 0-{len(PNG) - 1}/{len(PNG)}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(len(PNG)))
+        self.end_headers()
+        self.wfile.write(PNG)
+
+
+@pytest.fixture
+def image_server():
+    _ImageHandler.ranges = []
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _ImageHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_download_is_content_addressed(tmp_path, image_server):
+    covers = scraper.CoverDownloader(str(tmp_path / "covers"), workers=2)
+    try:
+        for name in ("a", "b"):
+            covers.submit(f"{image_server}/{name}pl.jpg")
+        covers.join()
+    finally:
+        covers.close()
+    assert covers.stats["downloaded"] == 1 and covers.stats["dedup"] == 1
+    assert not covers._pending
+
+
+def test_failure_after_fetch_does_not_hang_join(tmp_path, image_server, monkeypatch):
+    covers = scraper.CoverDownloader(str(tmp_path / "covers"), workers=2)
+
+    def broken_replace(src, dst):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(scraper.os, "replace", broken_replace)
+    done = threading.Event()
+    try:
+        covers.submit(f"{image_server}/cpl.jpg")
+        t = threading.Thread(target=lambda: (covers.join(), done.set()), daemon=True)
+        t.start()
+        assert done.wait(10), "join() 在下载失败后没有返回"
+    finally:
+        monkeypatch.undo()
+        covers.close()
+    assert covers.stats["failed"] == 1
+    assert not covers._pending
+
+
+def test_mismatched_content_range_restarts_without_range(tmp_path, image_server):
+    root = str(tmp_path / "covers")
+    url = f"{image_server}/dpl.jpg"
+    covers = scraper.CoverDownloader(root, workers=1)
+    part = os.path.join(root, "partial", hashlib.sha1(url.encode("utf-8")).hexdigest() + ".part")
+    with open(part, "wb") as f:
+        f.write(b"stale")
+    try:
+        covers.submit(url)
+        covers.join()
+    finally:
+        covers.close()
+    assert _ImageHandler.ranges == ["bytes=5-", None]
+    assert covers.stats["downloaded"] == 1 and covers.stats["failed"] == 0 and covers.stats["resumed"] == 0
+    with open(covers.object_path(hashlib.sha256(PNG).hexdigest(), ".jpg"), "rb") as f:
+        assert f.read() == PNG
+    assert not os.path.exists(part)
+
+
+def test_skipped_cover_gets_missing_thumbnail(tmp_path, image_server, monkeypatch):
+    root = str(tmp_path / "covers")
+    url = f"{image_server}/epl.jpg"
+    covers = scraper.CoverDownloader(root, workers=1)
+    try:
+        covers.submit(url)
+        covers.join()
+    finally:
+        covers.close()
+
+    made = []
+
+    def make_thumbnail(self, obj, sha):
+        made.append(obj)
+        open(self._thumb_path(sha), "wb").close()
+
+    monkeypatch.setattr(scraper.CoverDownloader, "_make_thumbnail", make_thumbnail)
+    # 之前下载时未开启缩略图；这里跳过构造函数里的 Pillow 检查
+    covers = scraper.CoverDownloader(root, workers=1)
+    covers.thumbnail = {"enabled": True, "max_size": 64}
+    try:
+        covers.submit(url)
+        covers.join()
+        covers.submit(url)
+        covers.join()
+    finally:
+        covers.close()
+    sha = hashlib.sha256(PNG).hexdigest()
+    assert made == [covers.object_path(sha, ".jpg")]
+    assert covers.stats["skipped"] == 2 and _ImageHandler.ranges == [None]
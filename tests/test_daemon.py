@@ -0,0 +1,53 @@
+import json
+import threading
+import urllib.request
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+import scraper
+
+
+@pytest.fixture
+def daemon(dmm_server):
+    service = scraper.LookupService(workers=2, timeout=5.0)
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), scraper._make_daemon_handler(service, max_batch=3))
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}", service
+    httpd.shutdown()
+    httpd.server_close()
+    service.close()
+
+
+def _call(url, body=None):
+    data = json.dumps(body).encode("utf-8") if body is not None else None
+    req = urllib.request.Request(url, data=data, method="POST" if data else "GET")
+    try:
+        with urllib.request.urlopen(req, timeout=10) as resp:
+            return resp.status, json.loads(resp.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def test_lookup_and_batch(daemon, dmm_server):
+    base, service = daemon
+    status, body = _call(f"{base}/lookup?code=SSNI-123")
+    assert status == 200 and body["error"] == ""
+    assert body["result"]["performer"] == "唯井まひろ"
+
+    status, body = _call(f"{base}/batch", {"codes": ["SSNI-123", "SSNI-124", "SSNI-123"]})
+    assert status == 200
+    assert [r["code"] for r in body["results"]] == ["SSNI-123", "SSNI-124", "SSNI-123"]
+    # 同一批次内重复的番号只查询一次
+    assert service.stats["lookups"] == 3
+
+
+def test_bad_requests(daemon):
+    base, _ = daemon
+    assert _call(f"{base}/lookup")[0] == 400
+    assert _call(f"{base}/batch", {"codes": "SSNI-123"})[0] == 400
+    assert _call(f"{base}/batch", {"codes": ["A-1", "A-2", "A-3", "A-4"]})[0] == 413
+    assert _call(f"{base}/nope")[0] == 404
+    status, body = _call(f"{base}/health")
+    assert status == 200 and body["ok"] is True
@@ -0,0 +1,77 @@
+import threading
+import time
+
+import pytest
+
+import scraper
+
+
+class _Resp:
+    status_code = 200
+    headers = {}
+    url = "http://example.invalid/search"
+    encoding = "utf-8"
+
+    def __init__(self, chunks=()):
+        self._chunks = list(chunks)
+        self.closed = False
+
+    def iter_content(self, size):
+        yield from self._chunks
+
+    def close(self):
+        self.closed = True
+
+
+class _CountingLimiter:
+    def __init__(self):
+        self.acquired = 0
+        self.released = []
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            self.acquired += 1
+
+    def release(self, status, latency, retry_after=None):
+        with self._lock:
+            self.released.append(status)
+
+
+def test_hedged_duplicate_takes_a_limiter_slot(monkeypatch):
+    limiter = _CountingLimiter()
+    hedger = scraper.Hedger(min_samples=1, max_ratio=1.0, min_delay=0.01)
+    hedger._lat.append(0.01)
+    calls = []
+
+    def fake_http_get(url, timeout, headers, stream_search, cancel=None):
+        calls.append(cancel)
+        if len(calls) == 1:
+            # 主请求很慢，落败后才发现被取消
+            cancel.wait(5)
+            raise scraper._HedgeCancelled(url)
+        return _Resp(), "page", False
+
+    monkeypatch.setattr(scraper, "_get_limiter", lambda: limiter)
+    monkeypatch.setattr(scraper, "_get_hedger", lambda: hedger)
+    monkeypatch.setattr(scraper, "_http_get", fake_http_get)
+    try:
+        _, content, _ = scraper._hedged_http_get("http://example.invalid/", 1.0, None, False)
+        deadline = time.monotonic() + 5
+        while len(limiter.released) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        hedger.close()
+    assert content == "page"
+    assert limiter.acquired == 2
+    # 胜出的请求按状态码归还，落败的只归还名额（None）
+    assert sorted(limiter.released, key=str) == [200, None]
+
+
+def test_streamed_search_stops_when_cancelled():
+    cancel = threading.Event()
+    cancel.set()
+    resp = _Resp([b"<html><body>", b"<ul id='list'>"])
+    with pytest.raises(scraper._HedgeCancelled):
+        scraper._read_search_stream(resp, cancel)
+    assert resp.closed
@@ -0,0 +1,62 @@
+import itertools
+import os
+
+import scraper
+
+FIELDS = ("detail_url", "title", "performer", "category", "cover", "error")
+
+
+def _run(cache_dir, **http_cache):
+    return list(scraper.scrape(["SSNI-123"], engine="thread", workers=1, extract_first_result=True,
+                               extra_cookies=[], http_cache={"enabled": True, "dir": str(cache_dir), **http_cache}))
+
+
+def _fields(records):
+    return [{f: r[f] for f in FIELDS} for r in records]
+
+
+def test_expired_entries_are_revalidated_with_etag(tmp_path, dmm_server):
+    dmm_server.etag = '"v1"'
+    first = _run(tmp_path, ttl=0)
+    assert dmm_server.not_modified == 0 and first[0]["title"]
+    second = _run(tmp_path, ttl=0)
+    assert dmm_server.conditional == ['"v1"', '"v1"']
+    assert dmm_server.not_modified == 2
+    assert _fields(second) == _fields(first)
+
+
+def test_fresh_entries_make_no_request(tmp_path, dmm_server):
+    first = _run(tmp_path, ttl=3600)
+    hits = dict(dmm_server.hits)
+    assert _fields(_run(tmp_path, ttl=3600)) == _fields(first)
+    assert dmm_server.hits == hits
+
+
+def test_corrupt_or_truncated_entries_fall_back_to_network(tmp_path, dmm_server):
+    first = _run(tmp_path, ttl=3600)
+    files = sorted(os.path.join(tmp_path, n) for n in os.listdir(tmp_path) if n.endswith(".bin"))
+    assert len(files) == 2
+    with open(files[0], "wb") as f:
+        f.write(b"not json\n\x00\x01")
+    with open(files[1], "r+b") as f:
+        f.truncate(os.path.getsize(files[1]) - 10)
+    hits = dict(dmm_server.hits)
+    assert _fields(_run(tmp_path, ttl=3600)) == _fields(first)
+    assert dmm_server.hits == {"search": hits["search"] + 1, "detail": hits["detail"] + 1}
+
+
+def test_lru_evicts_least_recently_used_once_over_cap(tmp_path, monkeypatch):
+    clock = itertools.count(1000)
+    monkeypatch.setattr(scraper.time, "time", lambda: float(next(clock)))
+    body = os.urandom(600).hex()
+    cache = scraper.HttpCache(str(tmp_path))
+    cache.put("http://x/a", body)
+    # 上限放得下两条
+    cache.max_bytes = cache._total * 5 // 2
+    cache.put("http://x/b", body)
+    assert cache.get("http://x/a")[1] == body
+    cache.put("http://x/c", body)
+    assert cache.stats["evicted"] == 1
+    assert cache.get("http://x/b") == (None, "")
+    assert cache.get("http://x/a")[1] == body and cache.get("http://x/c")[1] == body
+    assert len([n for n in os.listdir(tmp_path) if n.endswith(".bin")]) == 2
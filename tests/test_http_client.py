@@ -0,0 +1,107 @@
+import logging
+import sys
+import threading
+import time
+
+import pytest
+
+import scraper
+
+
+@pytest.fixture
+def sessions(monkeypatch):
+    """记录本次运行创建的 requests.Session 与各线程拿到的 Session。"""
+    created, used = [], set()
+    new_session, get_session = scraper._new_session, scraper._get_session
+
+    def counting_new():
+        created.append(new_session())
+        return created[-1]
+
+    def recording_get():
+        session = get_session()
+        used.add((threading.current_thread().name, id(session)))
+        return session
+
+    monkeypatch.setattr(scraper, "_new_session", counting_new)
+    monkeypatch.setattr(scraper, "_get_session", recording_get)
+    return created, used
+
+
+@pytest.mark.parametrize("engine,workers", [("sequential", 1), ("thread", 4), ("pipeline", 1)])
+def test_engines_share_one_session(engine, workers, sessions, dmm_server):
+    created, used = sessions
+    records = list(scraper.scrape([f"SSNI-{i:03d}" for i in range(8)], engine=engine, workers=workers,
+                                  extract_first_result=True, extra_cookies=[],
+                                  pipeline_workers={"search_fetch": 3, "detail_fetch": 3}))
+    assert len(records) == 8 and all(not r["error"] for r in records)
+    assert len(created) == 1
+    assert {sid for _, sid in used} == {id(created[0])}
+    if engine != "sequential":
+        assert len({name for name, _ in used}) > 1
+    # 运行结束后单例已重置
+    assert scraper._http_client is None
+
+
+def test_async_engine_builds_one_client_session(monkeypatch, dmm_server):
+    built = []
+    build = scraper._build_async_session
+
+    def counting(concurrency):
+        built.append(build(concurrency))
+        return built[-1]
+
+    monkeypatch.setattr(scraper, "_build_async_session", counting)
+    records = list(scraper.scrape([f"SSNI-{i:03d}" for i in range(8)], engine="async", async_concurrency=4,
+                                  extract_first_result=True, extra_cookies=[]))
+    assert len(records) == 8 and len(built) == 1 and built[0].closed
+
+
+def _connections(fake, expected, timeout=2.0):
+    # 服务端在各自的线程里接受连接，计数可能稍晚于客户端建连完成
+    deadline = time.monotonic() + timeout
+    while fake.connections < expected and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return fake.connections
+
+
+def test_prewarm_opens_configured_connections(monkeypatch, dmm_server):
+    monkeypatch.setitem(scraper.CONFIG, "http_client", {"prewarm": 3, "pool_size": 8})
+    monkeypatch.setitem(scraper.CONFIG, "extra_cookies", [])
+    try:
+        scraper.prewarm_http_client()
+        assert _connections(dmm_server, 3) == 3
+        # 预热的连接放回连接池，随后的请求直接复用
+        for _ in range(3):
+            scraper._cached_get(scraper._make_url("SSNI-123"), 5.0)
+        assert _connections(dmm_server, 4, timeout=0.2) == 3
+    finally:
+        scraper.close_http_client()
+
+
+def test_close_http_client_resets_singleton(monkeypatch):
+    monkeypatch.setitem(scraper.CONFIG, "extra_cookies", [])
+    first = scraper._get_session()
+    assert scraper._get_session() is first
+    scraper.close_http_client()
+    assert scraper._http_client is None
+    second = scraper._get_session()
+    try:
+        assert second is not first
+    finally:
+        scraper.close_http_client()
+
+
+def test_http2_falls_back_without_h2(monkeypatch, caplog):
+    monkeypatch.setitem(sys.modules, "h2", None)
+    monkeypatch.setattr(scraper, "_http2_adapter", None)
+    monkeypatch.setitem(scraper.CONFIG, "http_client", {"http2": True})
+    monkeypatch.setitem(scraper.CONFIG, "extra_cookies", [])
+    with caplog.at_level(logging.WARNING):
+        session = scraper._new_session()
+    try:
+        assert isinstance(session.get_adapter("https://www.dmm.co.jp/"), scraper._pooled_adapter_class())
+        assert "HTTP/2 需要 httpx[http2]" in caplog.text
+        assert scraper._http2_adapter is None
+    finally:
+        session.close()
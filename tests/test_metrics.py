@@ -0,0 +1,61 @@
+import json
+import re
+
+import scraper
+
+# Prometheus 文本格式的样本行：name{label="v",...} value
+SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{(?:[a-zA-Z_][a-zA-Z0-9_]*="[^"]*",?)*\})? (\S+)$')
+
+
+def _parse_prometheus(text: str):
+    samples, types = {}, {}
+    for line in text.splitlines():
+        if line.startswith("# TYPE "):
+            _, _, name, kind = line.split(" ", 3)
+            types[name] = kind
+            continue
+        if not line or line.startswith("#"):
+            continue
+        m = SAMPLE.match(line)
+        assert m, f"无法解析的样本行: {line!r}"
+        samples[m.group(1) + (m.group(2) or "")] = float(m.group(3))
+    return samples, types
+
+
+def test_metrics_after_a_run(tmp_path, dmm_server):
+    dmm_server.fail_detail = 1
+    json_path, prom_path = tmp_path / "m.json", tmp_path / "m.prom"
+    records = list(scraper.scrape(["SSNI-123", "ABP-001"], engine="thread", workers=2, extract_first_result=True,
+                                  extra_cookies=[], retry={"enabled": True, "base_delay": 0.01, "max_delay": 0.01},
+                                  metrics={"enabled": True, "json_path": str(json_path),
+                                           "prom_path": str(prom_path), "interval": 0}))
+    assert all(not r["error"] for r in records)
+
+    summary = json.loads(json_path.read_text(encoding="utf-8"))
+    for phase in ("connect", "ttfb", "download", "search_fetch", "search_parse", "detail_fetch", "detail_parse"):
+        assert summary["phases"][phase]["count"] > 0, phase
+    assert summary["phases"]["search_fetch"]["count"] == 2
+    assert summary["status"] == {"200": 4, "503": 1}
+    assert summary["bytes_received"] > 0
+
+    samples, types = _parse_prometheus(prom_path.read_text(encoding="utf-8"))
+    assert types == {"scraper_phase_seconds": "histogram", "scraper_http_responses_total": "counter",
+                     "scraper_bytes_received_total": "counter"}
+    assert samples['scraper_http_responses_total{status="200"}'] == 4
+    assert samples['scraper_http_responses_total{status="503"}'] == 1
+    for phase, stats in summary["phases"].items():
+        assert samples[f'scraper_phase_seconds_count{{phase="{phase}"}}'] == stats["count"]
+        assert samples[f'scraper_phase_seconds_bucket{{phase="{phase}",le="+Inf"}}'] == stats["count"]
+
+
+def test_streamed_non_200_download_includes_body(dmm_server, monkeypatch):
+    metrics = scraper.Metrics()
+    monkeypatch.setattr(scraper, "_metrics", metrics)
+    dmm_server.search_status = 404
+    dmm_server.body_delay = 0.2
+    try:
+        resp, content, truncated = scraper._http_get(scraper._make_url("SSNI-123"), 5.0, None, True)
+    finally:
+        scraper.close_http_client()
+    assert resp.status_code == 404 and content and not truncated
+    assert metrics.sums["download"] >= 0.15
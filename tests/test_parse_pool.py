@@ -0,0 +1,56 @@
+import os
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+import scraper
+from conftest import read_fixture
+
+SEARCH_URL = "https://www.dmm.co.jp/mono/dvd/-/search/=/searchstr=SSNI-123/"
+DETAIL_URL = "https://www.dmm.co.jp/mono/dvd/-/detail/=/cid=ssni123/"
+
+pytestmark = pytest.mark.skipif(not os.path.isdir("/dev/shm"), reason="需要 /dev/shm 检查共享内存段")
+
+
+def _segments():
+    return {name for name in os.listdir("/dev/shm") if name.startswith("psm_")}
+
+
+@pytest.fixture
+def no_leaks():
+    before = _segments()
+    yield
+    assert _segments() - before == set()
+
+
+@pytest.mark.parametrize("transfer", ["shm", "zlib"])
+def test_pool_matches_in_process_parse(transfer, no_leaks):
+    search_html, detail_html = read_fixture("search.html"), read_fixture("detail.html")
+    expected = (scraper._parse_first_result_link_uncached(search_html, SEARCH_URL),
+                scraper._parse_detail_page_uncached(detail_html, DETAIL_URL))
+    pool = scraper.ParsePool(workers=2, transfer=transfer)
+    try:
+        assert pool.transfer == transfer
+        futures = [(pool.submit("search", search_html, SEARCH_URL), pool.submit("detail", detail_html, DETAIL_URL))
+                   for _ in range(4)]
+        for search, detail in futures:
+            assert (search.result(), detail.result()) == expected
+    finally:
+        pool.close()
+
+
+def test_worker_crash_does_not_leak_segments(no_leaks):
+    html = read_fixture("detail.html")
+    pool = scraper.ParsePool(workers=1, transfer="shm")
+    try:
+        crash = pool._pool.submit(os._exit, 1)
+        queued = pool.submit("detail", html, DETAIL_URL)
+        with pytest.raises(BrokenProcessPool):
+            crash.result()
+        with pytest.raises(BrokenProcessPool):
+            queued.result()
+        # 进程池损坏后 submit 直接失败，已创建的共享内存同样释放
+        with pytest.raises(BrokenProcessPool):
+            pool.submit("detail", html, DETAIL_URL)
+    finally:
+        pool.close()
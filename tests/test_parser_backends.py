@@ -0,0 +1,56 @@
+"""
+解析后端的差分测试：lxml / partial 在 DMM 页面样本上的输出必须与 bs4 完全一致。
+样本在 tests/fixtures/dmm/ 下，按 DMM 搜索页 / 详情页的结构裁剪而成（保留解析用到的节点与一些噪声节点）。
+"""
+import pytest
+
+import scraper
+from conftest import read_fixture as _read
+
+DETAIL_URL = "https://www.dmm.co.jp/mono/dvd/-/detail/=/cid=ssni123/"
+
+SEARCH_PAGES = ("search.html", "search_no_result.html")
+DETAIL_PAGES = ("detail.html", "detail_no_performer.html", "detail_lazy_image.html")
+
+
+def _samples():
+    return [(_read(s), _read(d), DETAIL_URL) for s in SEARCH_PAGES for d in DETAIL_PAGES]
+
+
+@pytest.mark.parametrize("backend", ["lxml", "partial"])
+def test_backend_matches_bs4(backend):
+    if backend == "lxml":
+        pytest.importorskip("lxml")
+    assert scraper.compare_parser_backends(_samples(), backends=(backend,)) == []
+
+
+def test_fixture_variants():
+    """确认样本确实覆盖了各变体，避免差分测试在退化的样本上空跑。"""
+    first_link, _ = scraper.PARSER_BACKENDS["bs4"]
+    assert "cid=ssni123/" in first_link(_read("search.html"))
+    assert first_link(_read("search_no_result.html")) is None
+
+    full = scraper._parse_detail_page_uncached(_read("detail.html"), DETAIL_URL, backend="bs4")
+    assert full["performer"] == "唯井まひろ"
+    assert full["category"].split(" / ")[0] == scraper.GENRE_JA_TO_ZH["単体作品"]
+
+    no_performer = scraper._parse_detail_page_uncached(_read("detail_no_performer.html"), DETAIL_URL, backend="bs4")
+    assert no_performer["performer"] == ""
+    assert no_performer["title"] == "素人ナンパ 街角の美女たち"
+
+    lazy = scraper._parse_detail_page_uncached(_read("detail_lazy_image.html"), DETAIL_URL, backend="bs4")
+    assert lazy["cover"].endswith("ipx789pl.jpg")
+
+
+def test_mismatch_is_reported(monkeypatch):
+    first_link, detail_raw = scraper.PARSER_BACKENDS["bs4"]
+
+    def broken_detail_raw(html):
+        raw = detail_raw(html)
+        raw["title"] = raw["title"][:-1]
+        return raw
+
+    monkeypatch.setitem(scraper.PARSER_BACKENDS, "broken", (first_link, broken_detail_raw))
+    mismatches = scraper.compare_parser_backends(_samples(), backends=("broken",))
+    assert len(mismatches) == len(_samples())
+    assert all("backend=broken" in m for m in mismatches)
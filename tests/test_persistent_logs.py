@@ -0,0 +1,93 @@
+"""只追加文件（详情页索引、解析结果记忆）在崩溃留下半行后的加载与续写。"""
+import scraper
+
+
+def test_detail_index_truncates_torn_tail(tmp_path):
+    path = str(tmp_path / "index.tsv")
+    index = scraper.DetailUrlIndex(path)
+    index.put("SSNI-123", "https://www.dmm.co.jp/mono/dvd/-/detail/=/cid=ssni123/")
+    index.close()
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("IPX-789\thttps://www.dmm.co.jp/mono/dvd/-/det")
+
+    index = scraper.DetailUrlIndex(path)
+    index.put("ABC-456", "https://www.dmm.co.jp/mono/dvd/-/detail/=/cid=abc456/")
+    index.close()
+
+    index = scraper.DetailUrlIndex(path)
+    try:
+        assert index.get("IPX-789") is None
+        assert index.get("ABC-456") == "https://www.dmm.co.jp/mono/dvd/-/detail/=/cid=abc456/"
+        assert index.get("SSNI-123") == "https://www.dmm.co.jp/mono/dvd/-/detail/=/cid=ssni123/"
+    finally:
+        index.close()
+
+
+def test_parse_memo_truncates_torn_tail(tmp_path):
+    path = str(tmp_path / "memo.tsv")
+    fp = scraper._parser_fingerprint()
+    memo = scraper.ParseMemo(path, fp)
+    memo.put("k1", "search", ("u1", ""))
+    memo.close()
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('k2\t["u2')
+
+    memo = scraper.ParseMemo(path, fp)
+    memo.put("k3", "search", ("u3", ""))
+    memo.close()
+
+    memo = scraper.ParseMemo(path, fp)
+    try:
+        assert memo.get("k1", "search") == ("u1", "")
+        assert memo.get("k2", "search") is None
+        assert memo.get("k3", "search") == ("u3", "")
+    finally:
+        memo.close()
+
+
+def test_parse_memo_treats_corrupt_value_as_miss(tmp_path):
+    memo = scraper.ParseMemo(str(tmp_path / "memo.tsv"), "fp")
+    try:
+        memo._map["bad"] = '["x'
+        assert memo.get("bad", "search") is None
+        assert "bad" not in memo._map
+        assert memo.stats["miss"] == 1 and memo.stats["hit"] == 0
+    finally:
+        memo.close()
+
+
+def test_parse_memo_invalidated_by_genre_table(tmp_path, monkeypatch):
+    path = str(tmp_path / "memo.tsv")
+    memo = scraper.ParseMemo(path, scraper._parser_fingerprint())
+    memo.put("k1", "search", ("u1", ""))
+    memo.close()
+    monkeypatch.setitem(scraper.GENRE_JA_TO_ZH, "巨乳", "大胸")
+    memo = scraper.ParseMemo(path, scraper._parser_fingerprint())
+    try:
+        assert memo.get("k1", "search") is None
+    finally:
+        memo.close()
+
+
+def test_parse_memo_compacts_journal_while_running(tmp_path, monkeypatch):
+    monkeypatch.setattr(scraper.ParseMemo, "COMPACT_MIN_LINES", 20)
+    path = str(tmp_path / "memo.tsv")
+    memo = scraper.ParseMemo(path, "fp", max_entries=10)
+    try:
+        for i in range(200):
+            memo.put(f"k{i}", "search", (f"u{i}", ""))
+            with open(path, encoding="utf-8") as f:
+                # 首行指纹 + 不超过 COMPACT_MIN_LINES 或 COMPACT_RATIO 倍存活条目的记录
+                assert len(f.readlines()) <= 1 + 20
+        assert memo.stats["compacted"] > 0 and memo.stats["evicted"] == 190
+        memo.put("k200", "search", ("u200", ""))
+    finally:
+        memo.close()
+
+    memo = scraper.ParseMemo(path, "fp", max_entries=10)
+    try:
+        assert memo.get("k200", "search") == ("u200", "")
+        assert memo.get("k191", "search") == ("u191", "")
+        assert memo.get("k190", "search") is None
+    finally:
+        memo.close()
@@ -0,0 +1,80 @@
+import threading
+
+import pytest
+
+import scraper
+
+STAGE_WORKERS = {name: 2 for name in scraper.PIPELINE_STAGES}
+
+
+@pytest.fixture
+def emitted(monkeypatch):
+    records = []
+
+    def emit(counter, total, code, status, url, elapsed, content, err, result=None, timings=None):
+        records.append({"code": code, "status": status, "url": url, "err": err, "result": result})
+
+    monkeypatch.setattr(scraper, "_emit_result", emit)
+    return records
+
+
+def _run_with_timeout(fn, seconds=10):
+    outcome = {}
+
+    def target():
+        try:
+            fn()
+        except BaseException as e:
+            outcome["error"] = e
+
+    t = threading.Thread(target=target, daemon=True)
+    t.start()
+    t.join(seconds)
+    assert not t.is_alive(), "流水线没有结束"
+    return outcome.get("error")
+
+
+def test_first_stage_exception_is_reported(monkeypatch, emitted):
+    def boom(job):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(scraper, "_stage_search_fetch", boom)
+    err = _run_with_timeout(lambda: scraper.run_pipeline(["A-001", "A-002"], 1, 1.0, STAGE_WORKERS))
+    assert err is None
+    assert sorted(r["code"] for r in emitted) == ["A-001", "A-002"]
+    for r in emitted:
+        assert r["status"] == 0
+        assert "boom" in r["err"] and "boom" in r["result"]["error"]
+
+
+def test_failing_input_stream_ends_the_run(monkeypatch, emitted):
+    def search_fetch(job):
+        job.update(content="", status=200, url="u", err="", elapsed=0.0)
+        return False
+
+    def codes():
+        yield "A-001"
+        raise OSError("read error")
+
+    monkeypatch.setattr(scraper, "_stage_search_fetch", search_fetch)
+    err = _run_with_timeout(lambda: scraper.run_pipeline(codes(), 1, 1.0, STAGE_WORKERS))
+    assert isinstance(err, OSError)
+    assert [r["code"] for r in emitted] == ["A-001"]
+
+
+@pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
+def test_worker_killed_by_base_exception_still_ends_the_run(monkeypatch, emitted):
+    def search_fetch(job):
+        if job["code"] == "A-001":
+            # 该 worker 线程随之退出，同阶段的另一个 worker 继续处理剩下的任务
+            raise SystemExit("stop")
+        job.update(content="", status=200, url="u", err="", elapsed=0.0)
+        return False
+
+    monkeypatch.setattr(scraper, "_stage_search_fetch", search_fetch)
+    codes = [f"A-{i:03d}" for i in range(1, 6)]
+    err = _run_with_timeout(lambda: scraper.run_pipeline(codes, 1, 1.0, STAGE_WORKERS))
+    assert err is None
+    assert sorted(r["code"] for r in emitted) == codes
+    failed = [r for r in emitted if r["code"] == "A-001"]
+    assert failed[0]["status"] == 0 and "stop" in failed[0]["err"]
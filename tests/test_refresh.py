@@ -0,0 +1,61 @@
+import json
+import time
+
+import scraper
+
+DAY_MS = 86400 * 1000
+
+
+def _entry(code, age_days, **extra):
+    entry = {"code": code, "title": f"Title {code}", "coverUrl": f"https://pics.dmm.co.jp/{code}pl.jpg",
+             "actress": "", "kinds": [], "lastUpdated": int(time.time() * 1000) - age_days * DAY_MS, "elo": 1500}
+    entry.update(extra)
+    return entry
+
+
+def test_priority_puts_missing_fields_first_then_oldest():
+    entries = [_entry("OLD-1", 30), _entry("OLDER-2", 60), _entry("NOCOVER-3", 1, coverUrl=None),
+               _entry("BOTH-4", 1, coverUrl="/placeholder-image.svg", title=None)]
+    ordered = sorted(entries, key=scraper._refresh_priority)
+    assert [e["code"] for e in ordered] == ["BOTH-4", "NOCOVER-3", "OLDER-2", "OLD-1"]
+
+
+def test_refresh_respects_budget_and_keeps_other_fields(tmp_path, dmm_server):
+    path = tmp_path / "movie-metadata-cache.json"
+    entries = [_entry("SSNI-001", 30), _entry("SSNI-002", 60), _entry("SSNI-003", 1, coverUrl=None),
+               _entry("SSNI-004", 0)]
+    path.write_text(json.dumps(entries, ensure_ascii=False), encoding="utf-8")
+
+    records = list(scraper.scrape(mode="refresh", engine="thread", workers=1, extract_first_result=True,
+                                  extra_cookies=[], refresh={"cache_path": str(path), "max_codes": 2}))
+    assert [r["code"] for r in records] == ["SSNI-003", "SSNI-002"]
+
+    after = {e["code"]: e for e in json.loads(path.read_text(encoding="utf-8"))}
+    before = {e["code"]: e for e in entries}
+    assert after["SSNI-003"]["coverUrl"].endswith("ssni123pl.jpg")
+    assert after["SSNI-003"]["elo"] == 1500
+    # 预算外与近期更新过的条目保持原样
+    assert after["SSNI-001"] == before["SSNI-001"]
+    assert after["SSNI-004"] == before["SSNI-004"]
+
+
+def _refresh(path, **refresh):
+    return list(scraper.scrape(mode="refresh", engine="thread", workers=1, extract_first_result=True,
+                               extra_cookies=[], refresh={"cache_path": str(path), "min_age_days": 0, **refresh}))
+
+
+def test_unchanged_entry_keeps_last_updated(tmp_path, dmm_server):
+    path = tmp_path / "movie-metadata-cache.json"
+    path.write_text(json.dumps([_entry("SSNI-001", 30, coverUrl=None)]), encoding="utf-8")
+    _refresh(path)
+    refreshed = json.loads(path.read_text(encoding="utf-8"))[0]
+    # 再刷新一次：抓取字段与缓存一致，条目不写回
+    refreshed["lastUpdated"] -= 30 * DAY_MS
+    path.write_text(json.dumps([refreshed]), encoding="utf-8")
+    mtime = path.stat().st_mtime_ns
+    assert len(_refresh(path)) == 1
+    assert path.stat().st_mtime_ns == mtime
+    assert json.loads(path.read_text(encoding="utf-8"))[0] == refreshed
+
+    _refresh(path, touch_unchanged=True)
+    assert json.loads(path.read_text(encoding="utf-8"))[0]["lastUpdated"] > refreshed["lastUpdated"]
@@ -0,0 +1,46 @@
+import threading
+import time
+
+import scraper
+
+RETRY = {"enabled": True, "max_attempts": 3, "statuses": [503], "base_delay": 0.01, "max_delay": 0.05}
+
+
+def test_detail_retry_does_not_refetch_search_page(dmm_server):
+    dmm_server.fail_detail = 1
+    records = list(scraper.scrape(["SSNI-123"], engine="thread", workers=2, extract_first_result=True,
+                                  extra_cookies=[], retry=RETRY))
+    assert len(records) == 1
+    assert records[0]["error"] == "" and records[0]["performer"] == "唯井まひろ"
+    assert dmm_server.hits == {"search": 1, "detail": 2}
+
+
+def test_follower_does_not_inherit_deferred_retry():
+    sf = scraper.SingleFlight()
+    started, release = threading.Event(), threading.Event()
+
+    def deferred():
+        started.set()
+        release.wait(5)
+        raise scraper._RetryLater(1.0)
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(_catch(lambda: sf.do("request", "u", deferred))))
+    leader.start()
+    started.wait(5)
+    follower = threading.Thread(target=lambda: results.append(sf.do("request", "u", lambda: "page")))
+    follower.start()
+    # 让跟随者先进入等待
+    time.sleep(0.1)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+    # 领头者的任务推迟了重试；跟随者不拿到 _RetryLater，而是自己执行拿到结果
+    assert sorted(map(str, results)) == ["_RetryLater", "page"]
+
+
+def _catch(fn):
+    try:
+        return fn()
+    except scraper._RetryLater as e:
+        return type(e).__name__
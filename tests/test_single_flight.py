@@ -0,0 +1,50 @@
+import threading
+
+import scraper
+
+
+def test_concurrent_callers_share_one_call():
+    sf = scraper.SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return ("<html>", 200, "")
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(sf.do("request", "u", fn)))
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=lambda: results.append(sf.do("request", "u", fn))) for _ in range(3)]
+    for t in followers:
+        t.start()
+    release.set()
+    for t in [leader] + followers:
+        t.join(5)
+    assert calls == [1]
+    assert results == [("<html>", 200, "")] * 4
+    assert sf.stats["requests_saved"] == 3
+    # 完成后不再持有任何调用（也就不持有页面正文）
+    assert sf._calls == {} and not sf._completed
+
+
+def test_completed_requests_are_never_retained():
+    sf = scraper.SingleFlight(share_completed=True)
+    for _ in range(2):
+        sf.do("request", "u", lambda: ("<html>", 200, ""))
+    assert sf.stats["executed"] == 2
+    assert not sf._completed
+
+
+def test_completed_parses_are_bounded_lru():
+    sf = scraper.SingleFlight(share_completed=True, max_completed=2)
+    for key in ("a", "b", "a", "c"):
+        sf.do("parse", key, lambda: {"error": ""})
+    assert list(k for _, k in sf._completed) == ["a", "c"]
+    assert sf.stats["parses_saved"] == 1
+    # keep 为假（失败结果）不保留
+    sf.do("parse", "d", lambda: {"error": "x"}, keep=lambda r: not r["error"])
+    assert ("parse", "d") not in sf._completed
@@ -0,0 +1,114 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import pytest
+
+import scraper
+
+CODES = ["SSNI-001", "SSNI-002", "SSNI-003"]
+
+
+def _record(code, **fields):
+    record = scraper.make_record(code, 200, scraper._make_url(code), 0.1, "",
+                                 {"detail_url": f"https://www.dmm.co.jp/detail/{code}", "title": f"Title {code}",
+                                  "performer": "P", "category": "a / b", "cover": f"https://pics/{code}.jpg",
+                                  "error": ""})
+    record.update(fields)
+    return record
+
+
+@pytest.mark.parametrize("engine", ["sequential", "thread", "pipeline", "async"])
+def test_jsonl_has_one_compact_record_per_code(engine, tmp_path, dmm_server):
+    path = tmp_path / "results.jsonl"
+    list(scraper.scrape(CODES, engine=engine, workers=2, extract_first_result=True, extra_cookies=[],
+                        sinks=[{"type": "jsonl", "path": str(path)}]))
+    lines = path.read_text(encoding="utf-8").splitlines()
+    records = [json.loads(line) for line in lines]
+    assert sorted(r["code"] for r in records) == CODES
+    for line, record in zip(lines, records):
+        assert line == json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+        assert set(record) == {"code", "status", "search_url", "detail_url", "title", "performer", "category",
+                               "cover", "timings", "error", "ts"}
+        assert record["category"] and isinstance(record["category"], list)
+        assert set(record["timings"]) == {"search", *scraper.RECORD_PHASES}
+        assert all(v >= 0 for v in record["timings"].values())
+
+
+def test_sqlite_commits_in_batches_and_flushes_at_close(tmp_path):
+    path = str(tmp_path / "results.db")
+    sink = scraper.SqliteSink(path, batch_size=3)
+
+    def committed():
+        conn = sqlite3.connect(path)
+        try:
+            return conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        finally:
+            conn.close()
+
+    for i in range(5):
+        sink.write(_record(f"SSNI-{i:03d}"))
+    assert committed() == 3
+    sink.close()
+    assert committed() == 5
+    conn = sqlite3.connect(path)
+    try:
+        category, timings = conn.execute("SELECT category, timings FROM results WHERE code='SSNI-004'").fetchone()
+    finally:
+        conn.close()
+    assert json.loads(category) == ["a", "b"] and json.loads(timings) == {"search": 0.1}
+
+
+def test_metadata_cache_merge_keeps_elo_fields_and_matches_codes_case_insensitively(tmp_path):
+    path = tmp_path / "movie-metadata-cache.json"
+    existing = [{"code": "ssni-001", "title": "old", "coverUrl": None, "actress": "", "lastUpdated": 1,
+                 "elo": 1620, "matchCount": 7, "winCount": 4, "drawCount": 1, "lossCount": 2,
+                 "recentMatches": [{"opponent": "X", "result": "win"}], "userRating": 9},
+                {"code": "OTHER-1", "title": "keep", "elo": 900}]
+    path.write_text(json.dumps(existing), encoding="utf-8")
+    sink = scraper.MetadataCacheSink(str(path))
+    sink.write(_record("SSNI-001"))
+    sink.write(_record("SSNI-002"))
+    sink.write(_record("SSNI-003", error="boom"))
+    sink.close()
+
+    items = json.loads(path.read_text(encoding="utf-8"))
+    assert [i["code"] for i in items] == ["ssni-001", "OTHER-1", "SSNI-002"]
+    updated = items[0]
+    assert updated["title"] == "Title SSNI-001" and updated["coverUrl"] == "https://pics/SSNI-001.jpg"
+    assert updated["kinds"] == ["a", "b"] and updated["lastUpdated"] > 1
+    for key in ("elo", "matchCount", "winCount", "drawCount", "lossCount", "recentMatches", "userRating"):
+        assert updated[key] == existing[0][key], key
+    assert items[1] == existing[1]
+    assert items[2]["elo"] == 1000 and items[2]["recentMatches"] == []
+    assert not os.path.exists(str(path) + ".lock")
+
+
+def test_metadata_cache_waits_for_lock_directory(tmp_path, monkeypatch):
+    path = str(tmp_path / "movie-metadata-cache.json")
+    lock_dir = path + ".lock"
+    os.mkdir(lock_dir)
+    done = threading.Event()
+
+    def merge():
+        scraper.merge_into_metadata_cache(path, [_record("SSNI-001")])
+        done.set()
+
+    t = threading.Thread(target=merge)
+    t.start()
+    time.sleep(0.3)
+    # 锁被 TS 端持有时不写入
+    assert not done.is_set() and not os.path.exists(path)
+    os.rmdir(lock_dir)
+    t.join(5)
+    assert done.is_set() and json.loads(open(path, encoding="utf-8").read())[0]["code"] == "SSNI-001"
+
+    os.mkdir(lock_dir)
+    monkeypatch.setattr(scraper.MetadataCacheSink, "LOCK_TIMEOUT", 0.2)
+    try:
+        with pytest.raises(TimeoutError):
+            scraper.merge_into_metadata_cache(path, [_record("SSNI-002")])
+    finally:
+        os.rmdir(lock_dir)
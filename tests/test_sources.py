@@ -0,0 +1,120 @@
+import asyncio
+import threading
+
+import pytest
+
+import scraper
+
+
+def _result(**fields):
+    result = scraper._empty_result(fields.pop("detail_url", ""))
+    result.update(fields)
+    return result
+
+
+class FakeProvider(scraper.SourceProvider):
+    def __init__(self, name, result, delay=0.0, error=None):
+        self.name = name
+        self.result = result
+        self.delay = delay
+        self.error = error
+        self.cancel_seen = threading.Event()
+        self.async_cancelled = False
+
+    def _response(self):
+        if self.error:
+            raise self.error
+        status = 200 if self.result is not None else 503
+        return "<html>", status, f"http://{self.name}/search", "", self.result
+
+    def fetch(self, code, timeout, cancel):
+        if self.delay and cancel.wait(self.delay):
+            self.cancel_seen.set()
+            return "", 200, f"http://{self.name}/search", "", None
+        return self._response()
+
+    async def fetch_async(self, session, sem, code, timeout):
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.async_cancelled = True
+            raise
+        return self._response()
+
+
+COMPLETE = _result(detail_url="http://a/d", title="T", performer="P", cover="http://a/c.jpg")
+
+
+def _fanout(*providers):
+    return scraper.SourceFanout(list(providers), ("title", "performer", "cover"), pool_size=4)
+
+
+def test_incomplete_provider_fails_at_construction():
+    class NoAsync(scraper.SourceProvider):
+        def fetch(self, code, timeout, cancel):
+            return None
+
+    with pytest.raises(TypeError):
+        NoAsync()
+
+
+def test_first_complete_result_wins_and_cancels_others():
+    fast = FakeProvider("fast", COMPLETE)
+    slow = FakeProvider("slow", _result(title="late"), delay=5.0)
+    fanout = _fanout(slow, fast)
+    try:
+        content, status, url, err, elapsed, result = fanout.fetch("SSNI-1", 1.0)
+        assert slow.cancel_seen.wait(1.0)
+        assert elapsed < 5.0 and url == "http://fast/search"
+        assert result["title"] == "T" and result["sources"] == ["fast"]
+        assert fanout.stats["wins"]["fast"] == 1 and fanout.stats["cancelled"] == 1
+    finally:
+        fanout.close()
+
+
+def test_partial_results_are_merged_field_by_field():
+    a = FakeProvider("a", _result(detail_url="http://a/d", title="A title", performer="A P"))
+    b = FakeProvider("b", _result(detail_url="http://b/d", title="B title", cover="http://b/c.jpg", category="x"))
+    fanout = _fanout(a, b)
+    try:
+        result = fanout.fetch("SSNI-1", 1.0)[5]
+    finally:
+        fanout.close()
+    # 按 providers 顺序：a 的标题优先，其余字段由 b 补齐
+    assert result["title"] == "A title"
+    assert result["performer"] == "A P" and result["cover"] == "http://b/c.jpg" and result["category"] == "x"
+    assert result["sources"] == ["a", "b"]
+    assert result["detail_urls"] == {"a": "http://a/d", "b": "http://b/d"}
+    assert fanout.stats["merged"] == 1 and fanout.stats["complete"] == 0
+
+
+def test_all_providers_failing_surfaces_error():
+    a = FakeProvider("a", None)
+    b = FakeProvider("b", None, error=RuntimeError("boom"))
+    fanout = _fanout(a, b)
+    try:
+        content, status, url, err, elapsed, result = fanout.fetch("SSNI-1", 1.0)
+    finally:
+        fanout.close()
+    assert result is None
+    assert status == 503
+    partial = _fanout(FakeProvider("a", _result(error="未找到第一个结果链接")),
+                      FakeProvider("b", None, error=RuntimeError("boom")))
+    try:
+        result = partial.fetch("SSNI-1", 1.0)[5]
+    finally:
+        partial.close()
+    assert "a: 未找到第一个结果链接" in result["error"] and "b 查询异常: boom" in result["error"]
+
+
+def test_async_path_cancels_slower_provider():
+    fast = FakeProvider("fast", COMPLETE, delay=0.01)
+    slow = FakeProvider("slow", _result(title="late"), delay=5.0)
+    fanout = _fanout(slow, fast)
+    try:
+        result = asyncio.run(fanout.fetch_async(None, None, "SSNI-1", 1.0))[5]
+    finally:
+        fanout.close()
+    assert result["sources"] == ["fast"]
+    assert slow.async_cancelled
+    assert fanout.stats["cancelled"] == 1
@@ -0,0 +1,25 @@
+import scraper
+
+
+def test_truncated_search_page_is_not_archived(tmp_path, dmm_server):
+    root = str(tmp_path / "archive")
+    records = list(scraper.scrape(["SSNI-123"], engine="thread", workers=2, extract_first_result=True,
+                                  extra_cookies=[], stream_search={"enabled": True, "chunk_size": 256},
+                                  single_flight={"enabled": True},
+                                  archive={"enabled": True, "dir": root}))
+    assert records[0]["error"] == "" and records[0]["title"]
+    archive = scraper.PageArchive(root, readonly=True)
+    try:
+        assert archive.lookup(scraper._make_url("SSNI-123")) is None
+        assert archive.lookup(records[0]["detail_url"]) is not None
+    finally:
+        archive.close()
+
+
+def test_streamed_prefix_is_not_shared_with_full_page_callers(monkeypatch):
+    sf = scraper.SingleFlight()
+    monkeypatch.setattr(scraper, "_get_single_flight", lambda: sf)
+    monkeypatch.setattr(scraper, "_cached_get", lambda url, timeout, stream_search=False: (
+        scraper._PartialPage("<html>") if stream_search else "<html></html>", 200, ""))
+    assert isinstance(scraper._shared_get("u", 1.0, stream_search=True)[0], scraper._PartialPage)
+    assert scraper._shared_get("u", 1.0)[0] == "<html></html>"
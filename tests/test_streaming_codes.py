@@ -0,0 +1,44 @@
+import logging
+import tracemalloc
+
+import scraper
+
+
+def _cfg(tmp_path, codes, **streaming):
+    path = tmp_path / "codes.txt"
+    path.write_text("".join(f"{c}\n" for c in codes), encoding="utf-8")
+    return {"codes": [], "codes_file": str(path), "streaming": {"enabled": True, **streaming}}
+
+
+def test_exact_dedupe_is_default(tmp_path):
+    cfg = _cfg(tmp_path, ["A-1", "B-2", "A-1", "C-3", "B-2"])
+    assert isinstance(scraper._make_deduper(cfg["streaming"]), scraper._ExactDeduper)
+    assert list(scraper.iter_codes_from_config(cfg)) == ["A-1", "B-2", "C-3"]
+
+
+def test_exact_dedupe_never_drops_distinct_codes(tmp_path):
+    codes = [f"CODE-{i:06d}" for i in range(50000)]
+    assert list(scraper.iter_codes_from_config(_cfg(tmp_path, codes))) == codes
+
+
+def test_exact_dedupe_stores_about_eight_bytes_per_code():
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        deduper = scraper._ExactDeduper()
+        n = 200000
+        for i in range(n):
+            assert deduper.add(f"CODE-{i:07d}")
+        used = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    assert not deduper.add("CODE-0000123")
+    # 分片数组的固定开销 + 8 字节/番号（含 array 的预留空间）
+    assert used < 12 * n + 1024 * 1024
+
+
+def test_bloom_dedupe_logs_dropped_count(tmp_path, caplog):
+    cfg = _cfg(tmp_path, ["A-1", "A-1", "B-2", "A-1"], dedupe="bloom", bloom_capacity=1000)
+    with caplog.at_level(logging.INFO):
+        assert list(scraper.iter_codes_from_config(cfg)) == ["A-1", "B-2"]
+    assert "跳过 2 个番号" in caplog.text